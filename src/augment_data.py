@@ -1,13 +1,38 @@
 import pandas as pd
 import argparse
-from textaugment import Translate
+import hashlib
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from corpus_io import read_corpus, write_corpus
+import instrument
 
 """Augmentation de données
 
-Ce script prend en entrée un dataset sous forme csv et en augmente les données grâce à la technique de la rétro-traduction.
+Ce script prend en entrée un dataset sous forme csv (ou parquet / arrow, voir le module corpus_io) et en augmente les données grâce à la technique de la rétro-traduction.
 Ce script traduit chaque review en anglais, puis de nouveau en français, et ajoute cette nouvelle review au DataFrame avec la même note que la review de base.
+Une colonne group relie chaque rétro-traduction à sa review de base (même valeur) : dedup.py s'en sert pour retirer les
+rétro-traductions trop proches de leur review, et le découpage en train, validation et test les garde dans le même sous-corpus.
 
-Ce script utilise les bibliothèques pandas, argparse et textaugment.
+Format de sortie : le fichier écrit (data_augmented.csv par défaut) a trois colonnes, reviews, notes et group (un entier), alors
+que les fichiers écrits avant l'ajout de cette colonne n'avaient que reviews et notes. Les reviews de base sont en premier,
+dans l'ordre d'entrée, puis leurs rétro-traductions dans le même ordre. Si le corpus d'entrée a déjà une colonne group, elle est
+gardée telle quelle. Les scripts du projet lisent ce fichier par nom de colonne (harmonize_classes.py garde la colonne, dedup.py
+et tokenized_splits.py s'en servent, les autres l'ignorent) ; un outil externe qui attend exactement deux colonnes doit ignorer group.
+Pour un ancien fichier sans colonne group, dedup.py --augmented-pairs retrouve les paires.
+
+Les reviews sont traduites par paquets (option --batch-size) par un pool de workers (option --workers), chaque paquet étant
+retenté en cas d'erreur. Les nouvelles lignes sont ajoutées au DataFrame en une seule fois à la fin.
+Le traducteur est interchangeable (option --backend) : textaugment (par défaut, service en ligne), marian (modèles de traduction
+Helsinki-NLP exécutés en local avec transformers) ou stub (renvoie le texte tel quel, pour tester sans réseau).
+
+Les rétro-traductions sont gardées dans un cache sqlite sur disque (option --cache), indexé par l'empreinte du texte, des langues
+et du traducteur, et limité en nombre d'entrées (les moins récemment utilisées sont supprimées). Relancer le script sur un corpus
+qui a grandi ne traduit donc que les nouvelles reviews. Le nombre de succès et d'échecs du cache est affiché en fin d'exécution.
+
+Ce script utilise les bibliothèques pandas, argparse, hashlib, sqlite3, threading, time et concurrent.futures,
+les modules corpus_io et instrument, ainsi que textaugment ou transformers selon le traducteur.
 
 Crédits pour la librairie textaugment :
 
@@ -21,14 +46,275 @@ Crédits pour la librairie textaugment :
 }
 
 
-Ce script comporte une fonction :
+Ce script comporte ces fonctions et classes :
 
+    * StubTranslator - traducteur local qui renvoie le texte tel quel
+    * TextAugmentTranslator - rétro-traduction avec textaugment
+    * MarianTranslator - rétro-traduction locale avec les modèles Helsinki-NLP
+    * make_translator - retourne un traducteur à partir de son nom
+    * TranslationCache - cache sqlite des rétro-traductions, limité en taille
+    * CachedTranslator - traducteur qui passe par le cache et ne traduit que les textes absents
+    * translate_batch - rétro-traduit un paquet de reviews, avec plusieurs essais en cas d'erreur
     * augment - retourne le dataset avec les nouvelles données synthétiques
 
 """
 
 
-def augment(data: pd.DataFrame):
+class StubTranslator :
+    """
+    Traducteur local qui renvoie le texte tel quel, pour tester le pipeline sans réseau ni modèle
+    """
+
+    def __init__(self, src: str = "fr", to: str = "en") :
+        self.src = src
+        self.to = to
+
+    def augment_batch(self, texts: list) -> list :
+        return list(texts)
+
+
+class TextAugmentTranslator :
+    """
+    Rétro-traduction avec textaugment (service de traduction en ligne), une review à la fois
+
+    Parameters
+    ---
+    src : str
+    La langue des reviews
+    to : str
+    La langue pivot
+    """
+
+    def __init__(self, src: str = "fr", to: str = "en") :
+        from textaugment import Translate
+
+        self.src = src
+        self.to = to
+        self.translate = Translate(src=src, to=to)
+
+    def augment_batch(self, texts: list) -> list :
+        return [self.translate.augment(text) for text in texts]
+
+
+class MarianTranslator :
+    """
+    Rétro-traduction locale avec les modèles Helsinki-NLP/opus-mt, qui traduisent tout un paquet en un seul appel
+
+    Parameters
+    ---
+    src : str
+    La langue des reviews
+    to : str
+    La langue pivot
+    """
+
+    def __init__(self, src: str = "fr", to: str = "en") :
+        from transformers import MarianMTModel, MarianTokenizer
+
+        self.src = src
+        self.to = to
+        self.models = {}
+        for a, b in ((src, to), (to, src)) :
+            name = f"Helsinki-NLP/opus-mt-{a}-{b}"
+            self.models[a, b] = (MarianTokenizer.from_pretrained(name), MarianMTModel.from_pretrained(name))
+
+    def _translate(self, texts: list, a: str, b: str) -> list :
+        import torch
+
+        tokenizer, model = self.models[a, b]
+        inputs = tokenizer(texts, return_tensors="pt", padding=True, truncation=True, max_length=512)
+        with torch.no_grad() :
+            outputs = model.generate(**inputs, max_new_tokens=512)
+
+        return tokenizer.batch_decode(outputs, skip_special_tokens=True)
+
+    def augment_batch(self, texts: list) -> list :
+        return self._translate(self._translate(list(texts), self.src, self.to), self.to, self.src)
+
+
+TRANSLATORS = {
+    "textaugment": TextAugmentTranslator,
+    "marian": MarianTranslator,
+    "stub": StubTranslator,
+}
+
+
+def make_translator(name: str = "textaugment", src: str = "fr", to: str = "en") :
+    """
+    Créé un traducteur à partir de son nom
+
+    Parameters
+    ---
+    name : str
+    Le nom du traducteur (textaugment, marian ou stub)
+    src : str
+    La langue des reviews
+    to : str
+    La langue pivot
+
+    Returns
+    ---
+    translator : object
+    Un objet avec une méthode augment_batch(texts) -> list qui renvoie les textes rétro-traduits dans le même ordre
+    """
+
+    if name not in TRANSLATORS :
+        raise ValueError(f"Traducteur inconnu : {name} (choix possibles : {', '.join(TRANSLATORS)})")
+
+    return TRANSLATORS[name](src=src, to=to)
+
+
+class TranslationCache :
+    """
+    Cache sqlite des rétro-traductions, utilisable depuis plusieurs threads, qui garde au plus `max_entries` entrées
+    (les moins récemment utilisées sont supprimées en premier)
+
+    Parameters
+    ---
+    path : str
+    Le chemin du fichier sqlite
+    max_entries : int
+    Le nombre maximum de rétro-traductions gardées
+    """
+
+    def __init__(self, path: str, max_entries: int = 1_000_000) :
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS translations (key TEXT PRIMARY KEY, text TEXT, last_used INTEGER)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS translations_last_used ON translations (last_used)")
+        self._db.commit()
+        # compteur d'utilisation, qui reprend là où le run précédent s'était arrêté
+        self._clock = self._db.execute("SELECT COALESCE(MAX(last_used), 0) FROM translations").fetchone()[0]
+
+    @staticmethod
+    def key(text: str, src: str, to: str, backend: str) -> str :
+        """Retourne l'empreinte d'un texte pour une paire de langues et un traducteur donnés"""
+
+        return hashlib.sha256(f"{backend}\x1f{src}\x1f{to}\x1f{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: list) -> dict :
+        """Retourne les rétro-traductions déjà connues pour une liste d'empreintes, et les marque comme récemment utilisées"""
+
+        found = {}
+        with self._lock :
+            for i in range(0, len(keys), 500) :
+                chunk = keys[i:i + 500]
+                rows = self._db.execute(
+                    f"SELECT key, text FROM translations WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                found.update(rows)
+
+            self._clock += 1
+            self._db.executemany("UPDATE translations SET last_used = ? WHERE key = ?", [(self._clock, key) for key in found])
+            self._db.commit()
+
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+
+        return found
+
+    def put_many(self, items: dict) :
+        """Enregistre des rétro-traductions (empreinte -> texte), puis supprime les plus anciennes si le cache est plein"""
+
+        with self._lock :
+            self._clock += 1
+            self._db.executemany(
+                "INSERT OR REPLACE INTO translations VALUES (?, ?, ?)", [(key, text, self._clock) for key, text in items.items()]
+            )
+
+            excess = self._db.execute("SELECT COUNT(*) FROM translations").fetchone()[0] - self.max_entries
+            if excess > 0 :
+                self._db.execute(
+                    "DELETE FROM translations WHERE key IN (SELECT key FROM translations ORDER BY last_used LIMIT ?)", (excess,)
+                )
+                self.evictions += excess
+
+            self._db.commit()
+
+    def stats(self) -> str :
+        """Retourne un résumé des succès et échecs du cache"""
+
+        total = self.hits + self.misses
+        rate = self.hits / total if total else 0.0
+
+        return f"Cache : {self.hits} succès, {self.misses} échecs ({rate:.1%} de succès), {self.evictions} entrées supprimées"
+
+    def close(self) :
+        with self._lock :
+            self._db.close()
+
+
+class CachedTranslator :
+    """
+    Traducteur qui cherche d'abord les rétro-traductions dans le cache, et ne transmet au vrai traducteur que les textes absents
+
+    Parameters
+    ---
+    translator : object
+    Le traducteur à utiliser pour les textes absents du cache
+    cache : TranslationCache
+    Le cache
+    backend : str
+    Le nom du traducteur, qui fait partie de l'empreinte (deux traducteurs ne donnent pas le même texte)
+    """
+
+    def __init__(self, translator, cache: TranslationCache, backend: str) :
+        self.translator = translator
+        self.cache = cache
+        self.backend = backend
+
+    def augment_batch(self, texts: list) -> list :
+        keys = [TranslationCache.key(text, self.translator.src, self.translator.to, self.backend) for text in texts]
+        found = self.cache.get_many(keys)
+
+        missing = [i for i, key in enumerate(keys) if key not in found]
+        if missing :
+            translated = self.translator.augment_batch([texts[i] for i in missing])
+            new_items = {keys[i]: text for i, text in zip(missing, translated)}
+            self.cache.put_many(new_items)
+            found.update(new_items)
+
+        return [found[key] for key in keys]
+
+
+def translate_batch(translator, texts: list, retries: int = 3, backoff: float = 1.0) -> list :
+    """
+    Rétro-traduit un paquet de reviews, en réessayant après une erreur (service indisponible, quota...)
+
+    Parameters
+    ---
+    translator : object
+    Le traducteur
+    texts : list
+    Les reviews à rétro-traduire
+    retries : int
+    Le nombre d'essais supplémentaires après une erreur
+    backoff : float
+    L'attente avant le premier nouvel essai, en secondes (doublée à chaque essai)
+
+    Returns
+    ---
+    new_texts : list
+    Les reviews rétro-traduites, dans le même ordre
+    """
+
+    for attempt in range(retries + 1) :
+        try :
+            new_texts = translator.augment_batch(texts)
+            if len(new_texts) != len(texts) :
+                raise ValueError(f"Le traducteur a renvoyé {len(new_texts)} textes pour {len(texts)} reviews")
+            return new_texts
+        except Exception :
+            if attempt == retries :
+                raise
+            time.sleep(backoff * 2 ** attempt)
+
+
+def augment(data: pd.DataFrame, translator=None, batch_size: int = 32, workers: int = 4, retries: int = 3):
     """
     Ajoute des données synthétiques à un corpus de données
 
@@ -36,38 +322,81 @@ def augment(data: pd.DataFrame):
     ---
     data : DataFrame
     Le dataset dont on souhaite augmenter les données
+    translator : object
+    Le traducteur à utiliser (par défaut textaugment, du français vers l'anglais)
+    batch_size : int
+    Le nombre de reviews par paquet envoyé au traducteur
+    workers : int
+    Le nombre de paquets traduits en parallèle
+    retries : int
+    Le nombre d'essais supplémentaires pour un paquet en cas d'erreur
 
     Returns
     ---
     data : DataFrame
-    Le dataset avec les nouvelles données synthétiques
+    Le dataset avec les nouvelles données synthétiques, et une colonne group (ajoutée si le dataset n'en a pas) qui a la même valeur
+    pour une review et sa rétro-traduction : les colonnes sont donc reviews, notes et group, et non plus seulement reviews et notes
     """
-    
-    t = Translate(src="fr", to="en")
 
-    reviews = data['reviews']
+    if translator is None :
+        translator = make_translator()
 
-    for i in range(len(reviews)):
-        new_text = t.augment(data['reviews'][i])
-        data.loc[len(data)] = [new_text, data['notes'][i] ]
+    reviews = data['reviews'].tolist()
+    batches = [reviews[i:i + batch_size] for i in range(0, len(reviews), batch_size)]
 
-    return data   
+    # map renvoie les paquets dans l'ordre, les nouvelles reviews sont donc dans le même ordre que les reviews d'origine
+    new_texts = []
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool :
+        for translated in pool.map(lambda batch: translate_batch(translator, batch, retries), batches) :
+            new_texts.extend(translated)
+    runtime = time.perf_counter() - start
 
+    instrument.inc("augment_translations_total", len(new_texts), "Reviews rétro-traduites")
+    instrument.set_gauge("augment_translations_per_second", len(new_texts) / runtime if runtime > 0 else 0.0,
+                         "Reviews rétro-traduites par seconde (cache compris)")
 
-if __name__ == "__main__" :
+    # chaque review de base a son groupe (sauf si le dataset en a déjà), que sa rétro-traduction reprend
+    if 'group' not in data.columns :
+        data = data.assign(group=range(len(data)))
 
-    my_parser = argparse.ArgumentParser()
-    my_parser.add_argument("data", help="Le fichier csv contenant le jeu de données")
-    my_args = my_parser.parse_args()
+    # on ajoute toutes les nouvelles lignes en une seule fois, avec la même note et le même groupe que la review de base
+    new_data = pd.DataFrame({'reviews': new_texts, 'notes': data['notes'].tolist(), 'group': data['group'].tolist()})
+
+    return pd.concat([data, new_data], ignore_index=True)
 
-    data = my_args.data
-    data = pd.read_csv(data)
 
-    data_augmented = augment(data)
-    data_augmented.to_csv('../../data_augmented.csv', index=False)  
+if __name__ == "__main__" :
 
+    my_parser = argparse.ArgumentParser()
+    my_parser.add_argument("data", help="Le fichier (csv, parquet ou arrow) contenant le jeu de données")
+    my_parser.add_argument("--output", help="Le fichier de sortie (csv, parquet ou arrow, colonnes reviews, notes et group), par défaut ../../data_augmented.csv.", default="../../data_augmented.csv")
+    my_parser.add_argument("--backend", help="Le traducteur utilisé, par défaut textaugment.", choices=list(TRANSLATORS), default="textaugment")
+    my_parser.add_argument("--pivot", help="La langue pivot de la rétro-traduction, par défaut en.", default="en")
+    my_parser.add_argument("--batch-size", help="Le nombre de reviews par paquet, par défaut 32.", type=int, default=32)
+    my_parser.add_argument("--workers", help="Le nombre de paquets traduits en parallèle, par défaut 4.", type=int, default=4)
+    my_parser.add_argument("--retries", help="Le nombre d'essais supplémentaires par paquet en cas d'erreur, par défaut 3.", type=int, default=3)
+    my_parser.add_argument("--cache", help="Le fichier sqlite du cache des rétro-traductions, par défaut ../../augment_cache.sqlite.", default="../../augment_cache.sqlite")
+    my_parser.add_argument("--cache-size", help="Le nombre maximum d'entrées du cache, par défaut 1000000.", type=int, default=1_000_000)
+    my_parser.add_argument("--no-cache", help="Ne pas utiliser de cache.", action="store_true")
+    my_args = my_parser.parse_args()
 
+    with instrument.stage("augment") :
+        data = my_args.data
+        data = read_corpus(data)
 
+        translator = make_translator(my_args.backend, "fr", my_args.pivot)
 
+        cache = None
+        if not my_args.no_cache :
+            cache = TranslationCache(my_args.cache, my_args.cache_size)
+            translator = CachedTranslator(translator, cache, my_args.backend)
 
+        data_augmented = augment(data, translator, my_args.batch_size, my_args.workers, my_args.retries)
+        write_corpus(data_augmented, my_args.output)
 
+        if cache is not None :
+            print(cache.stats())
+            instrument.set_gauge("augment_cache_hits", cache.hits, "Traductions trouvées dans le cache")
+            instrument.set_gauge("augment_cache_misses", cache.misses, "Traductions absentes du cache")
+            cache.close()
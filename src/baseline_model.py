@@ -0,0 +1,313 @@
+import argparse
+import json
+import time
+import numpy as np
+import pandas as pd
+from corpus_io import load_dataset, iter_corpus, CorpusWriter
+from tokenized_splits import split_dataset
+from evaluate_model import compute_metrics, save_confusion_matrix
+import instrument
+
+"""Modèle de référence rapide
+
+Ce script entraîne, évalue et applique un modèle linéaire beaucoup moins coûteux que le modèle transformer de model_train.py,
+pour trier de très gros corpus ou servir de point de comparaison :
+
+    * les reviews sont transformées en vecteurs creux par hachage des n-grammes de mots (1 et 2 mots) et de caractères (de 2 à 4),
+      sans vocabulaire à construire ni à garder en mémoire
+    * un classifieur linéaire (régression logistique par descente de gradient stochastique) est entraîné morceau par morceau
+      (partial_fit), en plusieurs passages sur le sous-corpus train : la mémoire ne dépend pas de la taille du corpus
+
+Le découpage train / validation / test est le même que celui de model_train.py (seed = 42), et l'évaluation sur le sous-corpus test
+écrit ses mesures dans le même format que evaluate_model.py (fichier json et matrice de confusion).
+Le modèle est sauvegardé dans un seul fichier (par défaut ../bin/baseline.joblib).
+
+Le script a trois commandes :
+
+    * train - entraîne le modèle sur le sous-corpus train et affiche la f-mesure sur le sous-corpus validation après chaque passage
+    * evaluate - évalue le modèle sur le sous-corpus test
+    * predict - note les reviews d'un fichier (csv, parquet ou arrow) morceau par morceau, comme predict.py
+
+Ce script utilise les bibliothèques argparse, json, joblib, numpy, pandas et sklearn, ainsi que les modules corpus_io, tokenized_splits, evaluate_model et instrument
+(joblib et sklearn ne sont importés que par les commandes qui s'en servent)
+
+Ce script comporte ces fonctions :
+
+    * make_vectorizer - crée la transformation des reviews en vecteurs hachés
+    * train_baseline - entraîne le modèle et le sauvegarde
+    * predict_log_proba - retourne le logarithme des probabilités de chaque classe (utilisé comme sorties pour compute_metrics)
+    * predict_proba - retourne les probabilités de chaque note pour une liste de reviews
+    * evaluate_baseline - évalue le modèle sur le sous-corpus test
+    * predict_baseline - note les reviews d'un fichier
+
+"""
+
+
+BASELINE_PATH = "../bin/baseline.joblib"
+CLASSES = np.arange(5)
+
+
+def make_vectorizer(n_features: int = 2 ** 20) :
+    """Crée la transformation des reviews en vecteurs creux : n-grammes de mots et de caractères, hachés dans n_features colonnes
+
+    Parameters
+    ----------
+    n_features : int
+        Le nombre de colonnes de chacune des deux parties (mots et caractères)
+
+    Returns
+    -------
+    vectorizer : FeatureUnion
+        La transformation, qui n'a pas besoin d'être entraînée
+    """
+
+    from sklearn.feature_extraction.text import HashingVectorizer
+    from sklearn.pipeline import FeatureUnion
+
+    return FeatureUnion([
+        ("words", HashingVectorizer(analyzer="word", ngram_range=(1, 2), n_features=n_features, lowercase=True)),
+        ("chars", HashingVectorizer(analyzer="char_wb", ngram_range=(2, 4), n_features=n_features, lowercase=True)),
+    ])
+
+
+def _labels(notes) -> np.ndarray :
+    #Comme pour le modèle transformer, les classes vont de 0 à 4 (notes décalées de 1 vers la gauche)
+    return np.asarray(notes, dtype=np.int64) - 1
+
+
+def train_baseline(data: str, path: str = BASELINE_PATH, epochs: int = 5, chunksize: int = 10_000, n_features: int = 2 ** 20,
+                   alpha: float = 1e-5, seed: int = 42) -> dict :
+    """Entraîne le modèle linéaire sur le sous-corpus train, morceau par morceau, et le sauvegarde
+
+    Parameters
+    ----------
+    data : str
+        Le fichier (csv, parquet ou arrow) contenant le jeu de données
+    path : str
+        Le fichier où est sauvegardé le modèle
+    epochs : int
+        Le nombre de passages sur le sous-corpus train (au moins 1)
+    chunksize : int
+        Le nombre de reviews par appel à partial_fit
+    n_features : int
+        Le nombre de colonnes des vecteurs hachés (pour les mots et pour les caractères)
+    alpha : float
+        La force de la régularisation
+    seed : int
+        Le seed du découpage et de l'ordre des morceaux
+
+    Returns
+    -------
+    metrics : dict
+        La durée et le débit de l'entraînement, et les mesures sur le sous-corpus validation après le dernier passage
+    """
+
+    if epochs < 1 :
+        # sans passage, le modèle n'est jamais entraîné ni évalué
+        raise ValueError(f"Il faut au moins un passage sur le sous-corpus train (epochs = {epochs})")
+
+    import joblib
+    from sklearn.linear_model import SGDClassifier
+
+    splits = split_dataset(load_dataset(data), seed)
+    vectorizer = make_vectorizer(n_features)
+    classifier = SGDClassifier(loss="log_loss", alpha=alpha, random_state=seed)
+
+    rng = np.random.default_rng(seed)
+    train = splits["train"]
+    starts = np.arange(0, len(train), chunksize)
+
+    start_time = time.perf_counter()
+    for epoch in range(epochs) :
+        #L'ordre des morceaux change à chaque passage, et les reviews sont mélangées dans chaque morceau
+        for start in rng.permutation(starts) :
+            chunk = train[int(start):int(start) + chunksize]
+            order = rng.permutation(len(chunk["reviews"]))
+            X = vectorizer.transform([chunk["reviews"][i] for i in order])
+            classifier.partial_fit(X, _labels(chunk["notes"])[order], classes=CLASSES)
+
+        val_metrics = compute_metrics(predict_log_proba(vectorizer, classifier, splits["validation"]["reviews"]), _labels(splits["validation"]["notes"]))
+        print(f"Epoch {epoch + 1} : accuracy {val_metrics['accuracy']:.2%}, f-mesure {val_metrics['f1']:.2%} (validation)")
+    runtime = time.perf_counter() - start_time
+
+    # les poids sont surtout des zéros (colonnes de hachage jamais vues) : la compression réduit fortement le fichier
+    joblib.dump({"vectorizer": vectorizer, "classifier": classifier}, path, compress=3)
+
+    metrics = {
+        "train_runtime": runtime,
+        "train_samples_per_second": len(train) * epochs / runtime if runtime > 0 else 0.0,
+        "eval_accuracy": val_metrics["accuracy"],
+        "eval_f1": val_metrics["f1"],
+        "eval_loss": val_metrics["loss"],
+    }
+    print(f"Reviews par seconde : {metrics['train_samples_per_second']:.2f}")
+
+    return metrics
+
+
+def predict_log_proba(vectorizer, classifier, reviews: list, batch_size: int = 10_000) -> np.ndarray :
+    """Retourne le logarithme des probabilités de chaque classe, par batchs de reviews"""
+
+    log_probas = np.zeros((len(reviews), len(CLASSES)), dtype=np.float64)
+    for start in range(0, len(reviews), batch_size) :
+        X = vectorizer.transform(reviews[start:start + batch_size])
+        # predict_log_proba peut renvoyer -inf : on borne pour garder une loss finie
+        log_probas[start:start + batch_size] = np.maximum(classifier.predict_log_proba(X), np.log(1e-15))
+
+    return log_probas
+
+
+def predict_proba(vectorizer, classifier, reviews: list, batch_size: int = 10_000) -> np.ndarray :
+    """Retourne les probabilités de chaque note pour une liste de reviews
+
+    Parameters
+    ----------
+    vectorizer : FeatureUnion
+        La transformation des reviews en vecteurs
+    classifier : SGDClassifier
+        Le classifieur entraîné
+    reviews : list
+        Les reviews
+    batch_size : int
+        Le nombre de reviews transformées à la fois
+
+    Returns
+    -------
+    probas : np.ndarray
+        Une ligne par review, une colonne par note (de 1 à 5)
+    """
+
+    probas = np.exp(predict_log_proba(vectorizer, classifier, reviews, batch_size))
+    return probas / probas.sum(axis=1, keepdims=True)
+
+
+def evaluate_baseline(data: str, path: str = BASELINE_PATH, metrics_path: str = "../figures/evaluation_baseline.json",
+                      figure_path: str = "../figures/matrice_confusion_baseline.png", seed: int = 42) -> dict :
+    """Evalue le modèle linéaire sur le sous-corpus test, avec les mêmes mesures que evaluate_model.py
+
+    Parameters
+    ----------
+    data : str
+        Le fichier (csv, parquet ou arrow) contenant le jeu de données
+    path : str
+        Le fichier du modèle
+    metrics_path : str
+        Le fichier json où sont écrites les mesures (None pour ne pas l'écrire)
+    figure_path : str
+        L'image où est sauvegardée la matrice de confusion (None pour ne pas la sauvegarder)
+    seed : int
+        Le seed du découpage
+
+    Returns
+    -------
+    metrics : dict
+        Les mesures d'évaluation et le débit
+    """
+
+    import joblib
+
+    model = joblib.load(path)
+    test_dataset = split_dataset(load_dataset(data), seed)["test"]
+    reviews = test_dataset["reviews"]
+
+    start = time.perf_counter()
+    log_probas = predict_log_proba(model["vectorizer"], model["classifier"], reviews)
+    runtime = time.perf_counter() - start
+
+    metrics = compute_metrics(log_probas, _labels(test_dataset["notes"]))
+    metrics.update({
+        "num_samples": len(reviews),
+        "backend": "baseline",
+        "runtime": runtime,
+        "samples_per_second": len(reviews) / runtime if runtime > 0 else 0.0,
+    })
+
+    print(f"Loss : {metrics['loss']:.4f}")
+    print(f"Accuracy : {metrics['accuracy']:.2%}")
+    print(f"F-mesure : {metrics['f1']:.2%}")
+    print(f"Reviews par seconde : {metrics['samples_per_second']:.2f}")
+
+    if metrics_path is not None :
+        with open(metrics_path, "w", encoding="utf-8") as f :
+            json.dump(metrics, f, indent=2)
+
+    if figure_path is not None :
+        save_confusion_matrix(metrics["confusion_matrix"], metrics["notes"], figure_path)
+
+    return metrics
+
+
+def predict_baseline(input_path: str, output_path: str, path: str = BASELINE_PATH, chunksize: int = 10_000) -> int :
+    """Note les reviews d'un fichier morceau par morceau, et écrit les notes prédites et leurs probabilités au fur et à mesure
+
+    Parameters
+    ----------
+    input_path : str
+        Le fichier de reviews (csv, parquet ou arrow, avec une colonne reviews)
+    output_path : str
+        Le fichier à écrire (csv, parquet ou arrow), avec les mêmes colonnes que predict.py
+    path : str
+        Le fichier du modèle
+    chunksize : int
+        Le nombre de reviews lues à la fois
+
+    Returns
+    -------
+    count : int
+        Le nombre de reviews traitées
+    """
+
+    import joblib
+
+    model = joblib.load(path)
+
+    with CorpusWriter(output_path) as writer :
+        for chunk in iter_corpus(input_path, chunksize, columns=["reviews"]) :
+            reviews = chunk["reviews"].fillna("").astype(str).tolist()
+            probas = predict_proba(model["vectorizer"], model["classifier"], reviews, chunksize)
+
+            predictions = pd.DataFrame({"reviews": reviews, "notes": (probas.argmax(axis=1) + 1).astype("int8")})
+            for label in range(probas.shape[1]) :
+                predictions[f"proba_{label + 1}"] = probas[:, label].astype("float32")
+            writer.write(predictions)
+
+    return writer.count
+
+
+if __name__ == "__main__" :
+    my_parser = argparse.ArgumentParser()
+    my_parser.add_argument("--model", help=f"Le fichier du modèle, par défaut {BASELINE_PATH}", default=BASELINE_PATH)
+    commands = my_parser.add_subparsers(dest="command", required=True)
+
+    train_parser = commands.add_parser("train", help="Entraîner le modèle sur le sous-corpus train")
+    train_parser.add_argument("data", help="Le fichier (csv, parquet ou arrow) contenant le jeu de données")
+    train_parser.add_argument("--epochs", help="Le nombre de passages sur le sous-corpus train, par défaut 5", type=int, default=5)
+    train_parser.add_argument("--chunksize", help="Le nombre de reviews par morceau, par défaut 10000", type=int, default=10_000)
+    train_parser.add_argument("--n-features", help="Le nombre de colonnes des vecteurs hachés, par défaut 2^20", type=int, default=2 ** 20)
+    train_parser.add_argument("--alpha", help="La force de la régularisation, par défaut 1e-5", type=float, default=1e-5)
+
+    evaluate_parser = commands.add_parser("evaluate", help="Evaluer le modèle sur le sous-corpus test")
+    evaluate_parser.add_argument("data", help="Le fichier (csv, parquet ou arrow) contenant le jeu de données")
+    evaluate_parser.add_argument("--metrics", help="Le fichier json où sont écrites les mesures, par défaut ../figures/evaluation_baseline.json", default="../figures/evaluation_baseline.json")
+    evaluate_parser.add_argument("--figure", help="L'image de la matrice de confusion, par défaut ../figures/matrice_confusion_baseline.png", default="../figures/matrice_confusion_baseline.png")
+
+    predict_parser = commands.add_parser("predict", help="Noter les reviews d'un fichier")
+    predict_parser.add_argument("data", help="Le fichier (csv, parquet ou arrow) contenant les reviews à noter")
+    predict_parser.add_argument("--output", help="Le fichier de sortie (csv, parquet ou arrow), par défaut ../../predictions_baseline.csv", default="../../predictions_baseline.csv")
+    predict_parser.add_argument("--chunksize", help="Le nombre de reviews lues à la fois, par défaut 10000", type=int, default=10_000)
+
+    my_args = my_parser.parse_args()
+    if my_args.command == "train" and my_args.epochs < 1 :
+        train_parser.error("--epochs doit être au moins 1")
+
+    with instrument.stage(f"baseline_{my_args.command}") :
+        if my_args.command == "train" :
+            train_baseline(my_args.data, my_args.model, my_args.epochs, my_args.chunksize, my_args.n_features, my_args.alpha)
+        elif my_args.command == "evaluate" :
+            evaluate_baseline(my_args.data, my_args.model, my_args.metrics, my_args.figure)
+        else :
+            start = time.perf_counter()
+            count = predict_baseline(my_args.data, my_args.output, my_args.model, my_args.chunksize)
+            runtime = time.perf_counter() - start
+            print(count, "reviews notées dans", my_args.output)
+            print(f"Reviews par seconde : {count / runtime if runtime > 0 else 0.0:.2f}")
@@ -0,0 +1,225 @@
+import argparse
+import csv
+import glob
+import html
+import os
+import resource
+import tempfile
+import time
+import tracemalloc
+from multiprocessing import get_context
+from extractors import get_extractor, available_extractors
+
+"""Benchmark des backends d'extraction html
+
+Ce script mesure, hors ligne, la vitesse (pages/s) et la mémoire maximale de chaque backend d'extraction du module extractors
+sur des pages Allociné enregistrées (un dossier de fichiers .html, option --fixtures).
+Sans dossier de pages, il en génère à partir d'un csv du corpus (reviews, notes) en reproduisant la structure des pages de critiques Allociné.
+Avant de mesurer, il vérifie que chaque backend renvoie exactement les mêmes liens et les mêmes (review, note) que bs4.
+
+Chaque backend est mesuré dans un processus à part, pour que la mémoire maximale (RSS) de l'un ne fausse pas celle des autres.
+
+Ce script utilise les bibliothèques argparse, csv, html, resource, tracemalloc et multiprocessing, ainsi que le module extractors.
+
+Ce script comporte ces fonctions :
+
+    * render_page - retourne le html d'une page de critiques à partir d'une liste de (review, note)
+    * write_fixtures - génère des pages de critiques à partir d'un csv
+    * load_fixtures - charge les pages html d'un dossier
+    * bench_extractor - mesure un backend sur une liste de pages
+
+"""
+
+
+TARGET_URL = "https://www.allocine.fr/film/fichefilm-227463/critiques/spectateurs/"
+
+
+def render_page(reviews: list, page: int, n_pages: int, target_url: str = TARGET_URL) -> str :
+    """Génère le html d'une page de critiques spectateurs, avec la même structure que les pages Allociné
+
+    Parameters
+    ----------
+    reviews : list
+        Les couples (review, note) à mettre sur la page
+    page : int
+        Le numéro de la page
+    n_pages : int
+        Le nombre total de pages (pour la pagination)
+    target_url : str
+        L'url de la première page de critiques
+
+    Returns
+    -------
+    html : str
+        Le code html de la page
+    """
+
+    path = target_url.split("allocine.fr", 1)[-1]
+
+    # en-tête et menu : beaucoup de liens qui ne mènent pas à des pages de reviews
+    menu = "".join(f'<li class="header-nav-item"><a class="header-nav-link" href="/rubrique-{i}/">Rubrique {i}</a></li>' for i in range(60))
+
+    cards = []
+    for i, (review, note) in enumerate(reviews) :
+        cards.append(
+            f'<div class="hred review-card cf">'
+            f'<div class="review-card-aside"><div class="meta-title"><a class="xXx meta-title-link" href="/membre-{page}-{i}/">Spectateur {i}</a></div>'
+            f'<div class="meta-sub light">{i * 7 % 300} critiques</div></div>'
+            f'<div class="review-card-review-holder">'
+            f'<div class="review-card-meta">'
+            f'<div class="stareval stareval-medium stareval-theme-default">'
+            f'<div class="rating-mdl n{note.replace(",", "")} stareval-stars">' + '<div class="stareval-star icon-star-full"></div>' * 5 + '</div>'
+            f'<span class="stareval-note">{html.escape(note)}</span></div>'
+            f'<span class="review-card-meta-date light">Publiée le {1 + i % 28} avril 2025</span></div>'
+            f'<div class="content-txt review-card-content">\n{html.escape(review)}\n</div>'
+            f'<div class="review-card-footer"><div class="reviews-users-comment-useful js-useful-reviews">'
+            f'<button class="button button-sm">Utile</button><button class="button button-sm">Pas utile</button></div></div>'
+            f'</div></div>'
+        )
+
+    pagination = "".join(
+        f'<a class="button button-md item" href="{path}?page={p}">{p}</a>' for p in range(1, n_pages + 1) if p != page
+    )
+
+    scripts = "".join(f'<script type="text/javascript">window.__DATA_{i}__ = {{"key": "{"x" * 200}"}};</script>' for i in range(20))
+
+    return (
+        '<!DOCTYPE html><html lang="fr"><head><meta charset="utf-8"><title>Critiques spectateurs</title>'
+        f'{scripts}</head><body><header class="header"><ul class="header-nav">{menu}</ul></header>'
+        f'<main id="content-layout"><section class="section">{"".join(cards)}</section>'
+        f'<nav class="pagination cf">{pagination}</nav></main>'
+        '<footer class="footer"><p>© AlloCiné</p></footer></body></html>'
+    )
+
+
+def write_fixtures(data_csv: str, out_dir: str, per_page: int = 15) -> int :
+    """Génère des pages de critiques à partir d'un csv (reviews, notes), 15 reviews par page comme sur Allociné
+
+    Parameters
+    ----------
+    data_csv : str
+        Le chemin du csv
+    out_dir : str
+        Le dossier où écrire les pages
+    per_page : int
+        Le nombre de reviews par page
+
+    Returns
+    -------
+    n_pages : int
+        Le nombre de pages écrites
+    """
+
+    with open(data_csv, newline="", encoding="utf-8") as f :
+        reader = csv.reader(f)
+        next(reader)
+        rows = [(review, note) for review, note in reader]
+
+    n_pages = (len(rows) + per_page - 1) // per_page
+    for page in range(1, n_pages + 1) :
+        with open(os.path.join(out_dir, f"page_{page:04d}.html"), "w", encoding="utf-8") as f :
+            f.write(render_page(rows[(page - 1) * per_page : page * per_page], page, n_pages))
+
+    return n_pages
+
+
+def load_fixtures(fixtures_dir: str) -> list :
+    """Charge les pages html d'un dossier, sous forme de bytes comme les renvoie requests"""
+
+    pages = []
+    for path in sorted(glob.glob(os.path.join(fixtures_dir, "*.html"))) :
+        with open(path, "rb") as f :
+            pages.append(f.read())
+
+    return pages
+
+
+def bench_extractor(name: str, pages: list, repeat: int = 3, target_url: str = TARGET_URL) -> dict :
+    """Mesure un backend d'extraction sur une liste de pages
+
+    Parameters
+    ----------
+    name : str
+        Le nom du backend
+    pages : list
+        Les pages html (bytes)
+    repeat : int
+        Le nombre de passages sur toutes les pages (on garde le meilleur)
+    target_url : str
+        L'url cible utilisée pour filtrer les liens
+
+    Returns
+    -------
+    result : dict
+        pages/s, reviews extraites, mémoire Python maximale (tracemalloc) et RSS maximal du processus
+    """
+
+    extract = get_extractor(name)
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    best = float("inf")
+    for _ in range(repeat) :
+        start = time.perf_counter()
+        n_reviews = sum(len(extract(page, target_url)[1]) for page in pages)
+        best = min(best, time.perf_counter() - start)
+
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # passage séparé pour la mémoire Python, car tracemalloc ralentit fortement l'exécution
+    tracemalloc.start()
+    for page in pages :
+        extract(page, target_url)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "backend": name,
+        "pages_per_sec": len(pages) / best,
+        "reviews": n_reviews,
+        "peak_python_mb": peak / 1e6,
+        "peak_rss_mb": rss_after / 1024,
+        "rss_growth_mb": (rss_after - rss_before) / 1024,
+    }
+
+
+def _run_in_subprocess(args) :
+    name, fixtures_dir, repeat = args
+    return bench_extractor(name, load_fixtures(fixtures_dir), repeat)
+
+
+if __name__ == "__main__" :
+    my_parser = argparse.ArgumentParser()
+    my_parser.add_argument("--fixtures", help="Dossier de pages Allociné enregistrées (.html). Sans ce dossier, des pages sont générées à partir de --data.", default=None)
+    my_parser.add_argument("--data", help="Le csv (reviews, notes) utilisé pour générer des pages, par défaut ../data/data.csv.", default="../data/data.csv")
+    my_parser.add_argument("--repeat", help="Le nombre de passages sur toutes les pages, par défaut 3.", type=int, default=3)
+    my_parser.add_argument("--backends", help="Les backends à mesurer, par défaut tous ceux qui sont installés.", nargs="*", default=available_extractors())
+    my_args = my_parser.parse_args()
+
+    tmp_dir = None
+    fixtures_dir = my_args.fixtures
+    if fixtures_dir is None :
+        tmp_dir = tempfile.TemporaryDirectory()
+        fixtures_dir = tmp_dir.name
+        print(write_fixtures(my_args.data, fixtures_dir), "pages générées à partir de", my_args.data)
+
+    pages = load_fixtures(fixtures_dir)
+
+    # on vérifie d'abord que chaque backend donne exactement le même résultat que les sélecteurs d'origine
+    reference = [get_extractor("bs4")(page, TARGET_URL) for page in pages]
+    for name in my_args.backends :
+        extract = get_extractor(name)
+        for i, page in enumerate(pages) :
+            if extract(page, TARGET_URL) != reference[i] :
+                raise AssertionError(f"Le backend {name} ne donne pas le même résultat que bs4 sur la page {i}")
+    print("Résultats identiques pour :", ", ".join(my_args.backends))
+
+    # un processus neuf par backend, pour que le RSS maximal soit propre à chacun
+    ctx = get_context("spawn")
+    print(f"{'backend':<14}{'pages/s':>10}{'reviews':>10}{'pic Python (Mo)':>18}{'pic RSS (Mo)':>15}")
+    for name in my_args.backends :
+        with ctx.Pool(1) as pool :
+            result = pool.map(_run_in_subprocess, [(name, fixtures_dir, my_args.repeat)])[0]
+        print(f"{result['backend']:<14}{result['pages_per_sec']:>10.1f}{result['reviews']:>10}{result['peak_python_mb']:>18.2f}{result['peak_rss_mb']:>15.1f}")
+
+    if tmp_dir is not None :
+        tmp_dir.cleanup()
@@ -0,0 +1,495 @@
+import argparse
+import json
+import os
+import re
+import sys
+import tempfile
+from multiprocessing import get_context
+import numpy as np
+import pandas as pd
+from corpus_io import CorpusWriter, iter_corpus, read_corpus
+from bench_parsers import render_page, TARGET_URL
+import instrument
+
+"""Benchmark des étapes du pipeline sur des corpus synthétiques
+
+Le corpus du projet ne fait que quelques centaines de reviews : ce script mesure le comportement de chaque étape sur des corpus
+synthétiques bien plus gros (par défaut 1k, 100k et 1M reviews, option --sizes), entièrement hors ligne. Les étapes mesurées sont :
+
+    * harmonize - harmonisation des classes, par morceaux (harmonize_classes.py)
+    * stats - statistiques du corpus (corpus_stats.py, utilisé par vis_stats.py)
+    * parse - extraction des reviews de pages Allociné synthétiques (extractors, au plus --max-pages pages)
+    * augment - augmentation avec le traducteur stub, qui renvoie le texte tel quel (augment_data.py)
+    * tokenize - tokenization du corpus avec le tokenizer du modèle (--model)
+    * inference - prédiction des notes sur CPU (predict.py, au plus --max-inference-rows reviews)
+
+tokenize et inference ne sont mesurées que si le dossier --model existe (le modèle n'est jamais téléchargé).
+
+Les reviews synthétiques suivent à peu près le corpus réel : des mots français tirés selon une loi de Zipf, une longueur (en mots)
+de loi log-normale (médiane 58 mots) et des notes de 0,5 à 5,0 écrites comme sur Allociné. Elles sont générées par morceaux
+et gardées dans --work-dir pour les lancements suivants.
+
+Chaque couple (étape, taille) est mesuré dans un processus neuf : on mesure avec le module instrument le temps réel, le temps CPU
+et le débit (reviews, pages ou tokens par seconde). L'étape est lancée au moins --repeat fois (par défaut 3) et jusqu'à totaliser
+--min-time secondes (par défaut 1), et c'est le meilleur passage qui est gardé : les étapes courtes (sur 1k reviews) sont mesurées
+sur de nombreux passages plutôt que sur un seul. La mémoire est celle de l'étape seule : sous Linux, le maximum de mémoire résidente
+est remis à zéro (/proc/self/clear_refs) après la préparation (chargement du modèle, pages html), et on garde le pic atteint pendant
+l'étape et ce qu'elle ajoute à la mémoire déjà occupée (stage_rss_mb).
+Le rapport est écrit en json (option --output). Avec --baseline, les résultats sont comparés à un rapport enregistré auparavant
+(avec --update-baseline, sur la même machine) : le script échoue si un débit baisse ou si la mémoire de l'étape augmente de plus
+de --threshold (par défaut 20 %). Les débits des passages de moins de --min-seconds (par défaut 0.2 s), trop sensibles au bruit,
+ne sont pas comparés, ni les hausses de mémoire de moins de --min-rss-mb (par défaut 32 Mo).
+Une étape qui échoue n'arrête pas le benchmark : l'erreur est affichée et écrite dans le rapport, les autres étapes sont mesurées,
+et le script échoue à la fin.
+
+Ce script utilise les bibliothèques argparse, json, re, tempfile, multiprocessing, numpy, pandas et transformers (pour tokenize et inference),
+ainsi que les modules corpus_io, bench_parsers, instrument et ceux de chaque étape
+
+Ce script comporte ces fonctions :
+
+    * parse_size - convertit une taille écrite 1k ou 1M en nombre de reviews
+    * synthetic_reviews - génère un morceau de reviews synthétiques
+    * synthetic_corpus - écrit (ou retrouve) un corpus synthétique de n reviews
+    * bench_stage - mesure une étape sur un corpus (meilleur de plusieurs passages)
+    * compare - compare des résultats à ceux d'un rapport de référence
+
+"""
+
+
+STAGES = ["harmonize", "stats", "parse", "augment", "tokenize", "inference"]
+WORK_DIR = "../cache/benchmark"
+MODEL_DIR = "../bin/model"
+NOTES = ["0,5", "1,0", "1,5", "2,0", "2,5", "3,0", "3,5", "4,0", "4,5", "5,0"]
+# fréquence des notes dans data.csv (de 0,5 à 5,0)
+NOTE_WEIGHTS = np.array([18, 19, 10, 18, 19, 22, 18, 8, 5, 13], dtype=float)
+
+_WORDS = (
+    "de la le et les des un une à il elle je en du que qui pas ne ce ça est a film on pour dans avec sur mais "
+    "plus très bien tout trop fait comme même aussi peu rien encore jamais toujours vraiment été être avoir "
+    "histoire scénario acteurs acteur actrice jeu réalisation musique images effets spéciaux personnages fin début "
+    "moment scènes scène humour émotion suspense rythme long ennuyeux drôle beau belle magnifique nul mauvais bon "
+    "bonne excellent superbe décevant réussi raté sympa original classique suite saga réalisateur cinéma salle "
+    "public enfants famille adulte voir revoir conseille déconseille aimé adoré détesté regarder passer soirée "
+    "heure heures minutes temps année années monde vie amour guerre action drame comédie horreur animation"
+).split()
+_SYLLABLES = ["ba", "ri", "con", "tel", "mu", "sa", "ne", "lo", "pi", "dé", "vor", "an", "qué", "mi", "tra", "ju", "fen", "go", "lé", "char"]
+# mots vides de stats, fixés ici pour que la mesure ne dépende pas des données NLTK (absentes hors ligne) et reste la même d'une machine à l'autre
+STOP_WORDS = frozenset(
+    "de la le et les des un une à il elle je en du que qui pas ne ce ça est a on pour dans avec sur mais plus très".split()
+)
+
+
+def parse_size(size: str) -> int :
+    """Convertit une taille écrite 1000, 1k ou 1M en nombre de reviews"""
+
+    size = size.strip().lower()
+    multiplier = {"k": 1_000, "m": 1_000_000}.get(size[-1:], 1)
+    if size[-1:] in ("k", "m") :
+        size = size[:-1]
+
+    return int(float(size) * multiplier)
+
+
+def _vocabulary(size: int = 50_000) -> np.ndarray :
+    # de vrais mots français pour les rangs les plus fréquents, puis des mots inventés à partir de syllabes
+    words = list(_WORDS)
+    n_syllables = len(_SYLLABLES)
+    i = 0
+    while len(words) < size :
+        word, j = "", i
+        while True :
+            word += _SYLLABLES[j % n_syllables]
+            j //= n_syllables
+            if j == 0 :
+                break
+        words.append(word + "s" if i % 3 == 0 else word)
+        i += 1
+
+    return np.array(words[:size], dtype=object)
+
+
+def synthetic_reviews(n: int, rng: np.random.Generator, vocabulary: np.ndarray = None) -> pd.DataFrame :
+    """Génère n reviews synthétiques (colonnes reviews et notes, comme data.csv)
+
+    Parameters
+    ----------
+    n : int
+        Le nombre de reviews
+    rng : np.random.Generator
+        Le générateur aléatoire (le même seed donne le même corpus)
+    vocabulary : np.ndarray
+        Les mots, du plus fréquent au moins fréquent (par défaut, 50 000 mots)
+
+    Returns
+    -------
+    data : DataFrame
+        Les reviews et leurs notes
+    """
+
+    if vocabulary is None :
+        vocabulary = _vocabulary()
+
+    # loi de Zipf sur les rangs des mots, tirée par la fonction de répartition
+    cdf = np.cumsum(1.0 / (np.arange(len(vocabulary)) + 2.7))
+    cdf /= cdf[-1]
+
+    lengths = np.clip(rng.lognormal(np.log(58), 1.0, size=n), 5, 1000).astype(np.int64)
+    words = vocabulary[np.minimum(np.searchsorted(cdf, rng.random(lengths.sum())), len(vocabulary) - 1)]
+    bounds = np.concatenate([[0], np.cumsum(lengths)])
+    reviews = [" ".join(words[bounds[i]:bounds[i + 1]]).capitalize() + "." for i in range(n)]
+    notes = rng.choice(NOTES, size=n, p=NOTE_WEIGHTS / NOTE_WEIGHTS.sum())
+
+    return pd.DataFrame({"reviews": reviews, "notes": notes})
+
+
+def synthetic_corpus(n: int, work_dir: str = WORK_DIR, seed: int = 42, chunksize: int = 50_000) -> str :
+    """Ecrit un corpus synthétique de n reviews dans un csv, ou retourne celui d'un précédent lancement
+
+    Parameters
+    ----------
+    n : int
+        Le nombre de reviews
+    work_dir : str
+        Le dossier des corpus synthétiques
+    seed : int
+        Le seed du générateur
+    chunksize : int
+        Le nombre de reviews générées et écrites à la fois
+
+    Returns
+    -------
+    path : str
+        Le chemin du csv
+    """
+
+    path = os.path.join(work_dir, f"synthetic_{n}_{seed}.csv")
+    if os.path.exists(path) :
+        return path
+
+    os.makedirs(work_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    vocabulary = _vocabulary()
+    # écrit à côté puis renommé : un corpus interrompu n'est jamais repris pour un corpus complet
+    tmp_path = os.path.join(work_dir, f"synthetic_{n}_{seed}.tmp.csv")
+    with CorpusWriter(tmp_path) as writer :
+        for start in range(0, n, chunksize) :
+            writer.write(synthetic_reviews(min(chunksize, n - start), rng, vocabulary))
+    os.replace(tmp_path, path)
+
+    return path
+
+
+# chaque étape prépare ce qui ne fait pas partie de la mesure (pages html, chargement du modèle) et renvoie la fonction mesurée,
+# qui retourne le nombre de reviews (et de pages ou de tokens) traitées
+def _prepare_harmonize(path: str, options: dict) :
+    from harmonize_classes import harmonize_stream
+
+    def run() :
+        with tempfile.TemporaryDirectory() as tmp_dir :
+            return {"reviews": harmonize_stream(path, os.path.join(tmp_dir, "harmonized.csv"), options["chunksize"])}
+
+    return run
+
+
+def _prepare_stats(path: str, options: dict) :
+    from corpus_stats import compute_stats
+
+    def run() :
+        return {"reviews": compute_stats(path, options["chunksize"], stop_words=STOP_WORDS).n_reviews}
+
+    return run
+
+
+def _prepare_parse(path: str, options: dict, per_page: int = 15, pages_per_film: int = 50) :
+    from extractors import get_extractor
+
+    extract = get_extractor(options["parser"])
+    rows = []
+    for chunk in iter_corpus(path, options["chunksize"]) :
+        rows.extend(zip(chunk["reviews"].astype(str), chunk["notes"].astype(str)))
+        if len(rows) >= options["max_pages"] * per_page :
+            break
+    n_pages = min(options["max_pages"], (len(rows) + per_page - 1) // per_page)
+    # les pages sont réparties en films de pages_per_film pages : la pagination d'une page ne grandit pas avec la taille du corpus
+    pages = [render_page(rows[page * per_page : (page + 1) * per_page], page % pages_per_film + 1, pages_per_film).encode("utf-8")
+             for page in range(n_pages)]
+
+    def run() :
+        return {"pages": len(pages), "reviews": sum(len(extract(page, TARGET_URL)[1]) for page in pages)}
+
+    return run
+
+
+def _prepare_augment(path: str, options: dict) :
+    from augment_data import augment, StubTranslator
+
+    def run() :
+        data = read_corpus(path)
+        return {"reviews": len(augment(data, StubTranslator(), workers=1)) - len(data)}
+
+    return run
+
+
+def _prepare_tokenize(path: str, options: dict) :
+    from transformers import AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(options["model_dir"])
+
+    def run() :
+        reviews = tokens = 0
+        for chunk in iter_corpus(path, options["chunksize"]) :
+            encoded = tokenizer(chunk["reviews"].astype(str).tolist(), truncation=True, max_length=128)
+            reviews += len(chunk)
+            tokens += sum(len(ids) for ids in encoded["input_ids"])
+        return {"reviews": reviews, "tokens": tokens}
+
+    return run
+
+
+def _prepare_inference(path: str, options: dict) :
+    from predict import load_model, predict_proba
+
+    model, tokenizer = load_model(options["model_dir"])
+    reviews = []
+    for chunk in iter_corpus(path, options["chunksize"]) :
+        reviews.extend(chunk["reviews"].astype(str).tolist()[:options["max_inference_rows"] - len(reviews)])
+        if len(reviews) >= options["max_inference_rows"] :
+            break
+
+    def run() :
+        return {"reviews": len(predict_proba(model, tokenizer, reviews))}
+
+    return run
+
+
+_PREPARE = {
+    "harmonize": _prepare_harmonize,
+    "stats": _prepare_stats,
+    "parse": _prepare_parse,
+    "augment": _prepare_augment,
+    "tokenize": _prepare_tokenize,
+    "inference": _prepare_inference,
+}
+
+
+def _rss_mb(field: str) -> float :
+    # VmRSS (mémoire résidente actuelle) ou VmHWM (son maximum depuis la dernière remise à zéro), en kilo-octets dans /proc/self/status
+    with open("/proc/self/status", encoding="ascii") as f :
+        return int(re.search(rf"{field}:\s+(\d+)", f.read()).group(1)) / 1e3
+
+
+def _reset_peak_rss() -> bool :
+    """Remet à zéro le maximum de mémoire résidente du processus (Linux), et retourne False si ce n'est pas possible"""
+
+    try :
+        with open("/proc/self/clear_refs", "w", encoding="ascii") as f :
+            f.write("5")
+        return True
+    except OSError :
+        return False
+
+
+def bench_stage(stage: str, path: str, rows: int, options: dict, repeat: int = 3, min_time: float = 1.0, max_time: float = 60.0) -> dict :
+    """Mesure une étape sur un corpus synthétique, et garde le meilleur de plusieurs passages
+
+    Parameters
+    ----------
+    stage : str
+        Le nom de l'étape (voir STAGES)
+    path : str
+        Le chemin du corpus
+    rows : int
+        Le nombre de reviews du corpus
+    options : dict
+        Les options des étapes (chunksize, parser, max_pages, model_dir, max_inference_rows)
+    repeat : int
+        Le nombre minimum de passages
+    min_time : float
+        La durée totale minimum des passages, en secondes (les étapes courtes sont relancées jusqu'à l'atteindre)
+    max_time : float
+        La durée totale au-delà de laquelle on ne relance plus l'étape (après au moins un passage)
+
+    Returns
+    -------
+    result : dict
+        Le temps réel et CPU du meilleur passage, le maximum de mémoire résidente pendant l'étape et ce que l'étape y ajoute (Mo),
+        les quantités traitées et les débits (par seconde)
+    """
+
+    run = _PREPARE[stage](path, options)
+
+    # la mémoire occupée après la préparation (modèle chargé, pages générées) n'est pas comptée dans celle de l'étape
+    rss_before = _rss_mb("VmRSS") if _reset_peak_rss() else None
+
+    best = None
+    peak_rss = 0.0
+    runs = 0
+    total = 0.0
+    while runs < repeat or total < min_time :
+        instrument.REGISTRY.reset()
+        with instrument.stage(stage) :
+            counts = run()
+        gauges = {name: instrument.REGISTRY.gauges[name][(("stage", stage),)] for name in ("stage_wall_seconds", "stage_cpu_seconds", "stage_peak_rss_bytes")}
+
+        runs += 1
+        total += gauges["stage_wall_seconds"]
+        if best is None or gauges["stage_wall_seconds"] < best["stage_wall_seconds"] :
+            best = gauges
+        # sans remise à zéro possible, on garde le maximum de tout le processus (préparation comprise)
+        peak_rss = max(peak_rss, _rss_mb("VmHWM") if rss_before is not None else gauges["stage_peak_rss_bytes"] / 1e6)
+        if total >= max_time :
+            break
+
+    seconds = best["stage_wall_seconds"]
+    result = {
+        "stage": stage,
+        "rows": rows,
+        "runs": runs,
+        "seconds": seconds,
+        "cpu_seconds": best["stage_cpu_seconds"],
+        "peak_rss_mb": peak_rss,
+        "stage_rss_mb": peak_rss - rss_before if rss_before is not None else None,
+    }
+    for unit, count in counts.items() :
+        result[unit] = count
+        result[f"{unit}_per_second"] = count / seconds if seconds > 0 else 0.0
+
+    return result
+
+
+def _bench_in_subprocess(args) :
+    stage, path, rows, options, repeat, min_time = args
+    return bench_stage(stage, path, rows, options, repeat, min_time)
+
+
+def compare(results: list, baseline: list, threshold: float = 0.2, min_seconds: float = 0.2, min_rss_mb: float = 32.0) -> list :
+    """Compare des résultats à ceux d'un rapport de référence, pour les couples (étape, taille) présents dans les deux
+
+    Parameters
+    ----------
+    results : list
+        Les résultats de bench_stage
+    baseline : list
+        Les résultats de référence
+    threshold : float
+        La baisse de débit ou la hausse de mémoire tolérée (0.2 pour 20 %)
+    min_seconds : float
+        La durée (du meilleur passage) en dessous de laquelle les débits ne sont pas comparés, trop sensibles au bruit
+    min_rss_mb : float
+        La hausse de mémoire de l'étape (en Mo) en dessous de laquelle on ne signale pas de régression (d'un processus à l'autre,
+        la mémoire d'une même étape varie de quelques dizaines de Mo avec torch)
+
+    Returns
+    -------
+    regressions : list
+        Une phrase par régression (vide s'il n'y en a pas)
+    """
+
+    reference = {(result["stage"], result["rows"]) : result for result in baseline}
+    regressions = []
+    for result in results :
+        base = reference.get((result["stage"], result["rows"]))
+        if base is None :
+            continue
+
+        name = f"{result['stage']} ({result['rows']} reviews)"
+        if min(result["seconds"], base["seconds"]) >= min_seconds :
+            for key in result :
+                if key.endswith("_per_second") and base.get(key) and result[key] < base[key] * (1 - threshold) :
+                    regressions.append(f"{name} : {key} {result[key]:.1f} au lieu de {base[key]:.1f} ({result[key] / base[key] - 1:+.0%})")
+
+        # la mémoire comparée est celle que l'étape ajoute, sans la préparation (absente des rapports plus anciens)
+        memory, base_memory = result.get("stage_rss_mb"), base.get("stage_rss_mb")
+        if memory is not None and base_memory is not None and memory > base_memory * (1 + threshold) and memory - base_memory >= min_rss_mb :
+            regressions.append(f"{name} : mémoire de l'étape {memory:.0f} Mo au lieu de {base_memory:.0f} Mo (+{memory - base_memory:.0f} Mo)")
+
+    return regressions
+
+
+if __name__ == "__main__" :
+    my_parser = argparse.ArgumentParser()
+    my_parser.add_argument("--sizes", help="Les tailles des corpus synthétiques (1000, 1k, 1M...), par défaut 1k 100k 1M", nargs="*", default=["1k", "100k", "1M"])
+    my_parser.add_argument("--stages", help=f"Les étapes à mesurer, par défaut toutes ({', '.join(STAGES)})", nargs="*", default=STAGES)
+    my_parser.add_argument("--work-dir", help=f"Le dossier des corpus synthétiques, par défaut {WORK_DIR}", default=WORK_DIR)
+    my_parser.add_argument("--seed", help="Le seed des corpus synthétiques, par défaut 42", type=int, default=42)
+    my_parser.add_argument("--chunksize", help="Le nombre de reviews lues à la fois, par défaut 50000", type=int, default=50_000)
+    my_parser.add_argument("--parser", help="Le backend d'extraction html (voir extractors.py), par défaut bs4", default="bs4")
+    my_parser.add_argument("--max-pages", help="Le nombre maximum de pages html pour parse, par défaut 1000", type=int, default=1000)
+    my_parser.add_argument("--model", help=f"Le dossier du modèle pour tokenize et inference, par défaut {MODEL_DIR}", default=MODEL_DIR)
+    my_parser.add_argument("--max-inference-rows", help="Le nombre maximum de reviews pour inference, par défaut 2000", type=int, default=2000)
+    my_parser.add_argument("--output", help="Le fichier json du rapport, par défaut ../figures/benchmark.json", default="../figures/benchmark.json")
+    my_parser.add_argument("--baseline", help="Le rapport de référence auquel comparer les résultats, par défaut aucun", default=None)
+    my_parser.add_argument("--update-baseline", help="Ecrire les résultats dans --baseline au lieu de les comparer", action="store_true")
+    my_parser.add_argument("--threshold", help="La baisse de débit ou la hausse de mémoire tolérée, par défaut 0.2 (20 %%)", type=float, default=0.2)
+    my_parser.add_argument("--repeat", help="Le nombre minimum de passages par mesure (on garde le meilleur), par défaut 3", type=int, default=3)
+    my_parser.add_argument("--min-time", help="La durée totale minimum des passages d'une mesure, en secondes, par défaut 1", type=float, default=1.0)
+    my_parser.add_argument("--min-seconds", help="La durée en dessous de laquelle les débits ne sont pas comparés à --baseline, par défaut 0.2", type=float, default=0.2)
+    my_parser.add_argument("--min-rss-mb", help="La hausse de mémoire (Mo) en dessous de laquelle on ne signale pas de régression, par défaut 32", type=float, default=32.0)
+    my_args = my_parser.parse_args()
+
+    unknown = [stage for stage in my_args.stages if stage not in STAGES]
+    if unknown :
+        my_parser.error(f"étape inconnue : {', '.join(unknown)}")
+    if my_args.update_baseline and my_args.baseline is None :
+        my_parser.error("--update-baseline demande un fichier --baseline")
+    if my_args.repeat < 1 :
+        my_parser.error("--repeat doit être au moins 1")
+
+    # entièrement hors ligne : transformers ne cherche jamais le modèle sur internet (les processus des étapes en héritent)
+    os.environ["HF_HUB_OFFLINE"] = "1"
+    os.environ["TRANSFORMERS_OFFLINE"] = "1"
+
+    stages = my_args.stages
+    if not os.path.isdir(my_args.model) :
+        skipped = [stage for stage in stages if stage in ("tokenize", "inference")]
+        if skipped :
+            print(f"Pas de modèle dans {my_args.model} : {', '.join(skipped)} ne sont pas mesurées")
+        stages = [stage for stage in stages if stage not in skipped]
+
+    options = {"chunksize": my_args.chunksize, "parser": my_args.parser, "max_pages": my_args.max_pages, "model_dir": my_args.model,
+               "max_inference_rows": my_args.max_inference_rows}
+
+    # un processus neuf par mesure, pour que le RSS maximal soit propre à chaque étape et chaque taille
+    ctx = get_context("spawn")
+    results, failures = [], []
+    print(f"{'étape':<11}{'reviews':>10}{'passages':>10}{'durée (s)':>11}{'CPU (s)':>10}{'reviews/s':>12}{'pic RSS (Mo)':>14}{'étape (Mo)':>12}")
+    for size in my_args.sizes :
+        rows = parse_size(size)
+        path = synthetic_corpus(rows, my_args.work_dir, my_args.seed, my_args.chunksize)
+        for stage in stages :
+            # une étape qui échoue est signalée, et les autres sont quand même mesurées
+            try :
+                with ctx.Pool(1) as pool :
+                    result = pool.map(_bench_in_subprocess, [(stage, path, rows, options, my_args.repeat, my_args.min_time)])[0]
+            except Exception as error :
+                message = f"{type(error).__name__}: {error}"
+                print(f"{stage:<11}{rows:>10}   échec : {message.splitlines()[0]}")
+                failures.append({"stage": stage, "rows": rows, "error": message})
+                continue
+            results.append(result)
+            stage_rss = f"{result['stage_rss_mb']:.1f}" if result["stage_rss_mb"] is not None else "-"
+            print(f"{stage:<11}{rows:>10}{result['runs']:>10}{result['seconds']:>11.3f}{result['cpu_seconds']:>10.3f}{result['reviews_per_second']:>12.1f}"
+                  f"{result['peak_rss_mb']:>14.1f}{stage_rss:>12}")
+
+    os.makedirs(os.path.dirname(os.path.abspath(my_args.output)), exist_ok=True)
+    with open(my_args.output, "w", encoding="utf-8") as f :
+        json.dump(results + failures, f, indent=2)
+    print("Rapport écrit dans", my_args.output)
+
+    if my_args.update_baseline :
+        with open(my_args.baseline, "w", encoding="utf-8") as f :
+            json.dump(results, f, indent=2)
+        print("Référence écrite dans", my_args.baseline)
+    elif my_args.baseline is not None :
+        with open(my_args.baseline, encoding="utf-8") as f :
+            regressions = compare(results, json.load(f), my_args.threshold, my_args.min_seconds, my_args.min_rss_mb)
+        if regressions :
+            print(f"{len(regressions)} régression(s) de plus de {my_args.threshold:.0%} par rapport à {my_args.baseline} :")
+            for regression in regressions :
+                print("   ", regression)
+            sys.exit(1)
+        print(f"Aucune régression de plus de {my_args.threshold:.0%} par rapport à", my_args.baseline)
+
+    if failures :
+        print(f"{len(failures)} mesure(s) en échec :", ", ".join(f"{failure['stage']} ({failure['rows']} reviews)" for failure in failures))
+        sys.exit(1)
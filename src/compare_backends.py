@@ -0,0 +1,175 @@
+import argparse
+import json
+import os
+import resource
+import time
+from multiprocessing import get_context
+import numpy as np
+from export_model import available_backends, backend_dir, load_backend, BACKENDS, MODEL_DIR
+from tokenized_splits import tokenized_splits, CACHE_DIR
+
+"""Comparaison des versions du modèle
+
+Ce script compare les versions du modèle exportées par export_model.py (pytorch, int8, onnx, onnx-int8) sur le sous-corpus test
+mis de côté par model_train.py : accuracy et f-mesure d'un côté, latence, débit et mémoire de l'autre.
+Pour chaque version, il mesure :
+
+    * l'accuracy, la f-mesure et la loss sur tout le sous-corpus test
+    * le débit (reviews par seconde) par batchs de --batch-size reviews
+    * la latence d'une review seule (p50 et p99, en millisecondes) sur les --latency-samples premières reviews
+    * le temps de chargement, la mémoire maximale (RSS) du processus et la taille des poids sur le disque
+
+Chaque version est mesurée dans un processus à part, pour que la mémoire de l'une ne fausse pas celle des autres.
+Le script indique ensuite la version la plus rapide dont la f-mesure ne perd pas plus de --budget points par rapport
+à la version pytorch d'origine, et écrit le rapport dans un fichier json (option --output).
+
+Ce script utilise les bibliothèques argparse, json, resource, multiprocessing et numpy, ainsi que les modules export_model, tokenized_splits et evaluate_model
+
+Ce script comporte ces fonctions :
+
+    * weights_size - retourne la taille des poids d'une version du modèle sur le disque
+    * bench_backend - mesure une version du modèle sur le sous-corpus test
+    * choose_backend - choisit la version la plus rapide qui respecte le budget de précision
+
+"""
+
+
+def weights_size(path: str) -> int :
+    """Retourne la taille (en octets) des fichiers de poids d'une version du modèle"""
+
+    extensions = (".safetensors", ".bin", ".pt", ".onnx", ".onnx_data")
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path) if name.endswith(extensions))
+
+
+def bench_backend(data: str, backend: str, model_dir: str = MODEL_DIR, batch_size: int = 32, latency_samples: int = 100,
+                  threads: int = None, cache_dir: str = CACHE_DIR, max_length: int = 128) -> dict :
+    """Mesure une version du modèle sur le sous-corpus test
+
+    Parameters
+    ----------
+    data : str
+        Le fichier (csv, parquet ou arrow) contenant le jeu de données
+    backend : str
+        La version du modèle
+    model_dir : str
+        Le dossier contenant le modèle généré par model_train.py
+    batch_size : int
+        Le nombre de reviews par batch pour mesurer le débit
+    latency_samples : int
+        Le nombre de reviews notées une par une pour mesurer la latence
+    threads : int
+        Le nombre de threads utilisés pour l'inférence (par défaut, le choix de torch ou d'ONNX Runtime)
+    cache_dir : str
+        Le dossier où sont sauvegardés les sous-corpus tokenizés
+    max_length : int
+        Le nombre maximum de tokens par review, le même que pour l'entraînement
+
+    Returns
+    -------
+    result : dict
+        Les mesures de précision, de vitesse et de mémoire
+    """
+
+    from evaluate_model import predict_logits, compute_metrics
+
+    start = time.perf_counter()
+    model, tokenizer = load_backend(model_dir, backend, threads)
+    load_time = time.perf_counter() - start
+
+    test_dataset = tokenized_splits(data, tokenizer, max_length=max_length, seed=42, cache_dir=cache_dir)["test"]
+
+    # un premier passage pour la mise en route (allocations, choix des noyaux de calcul), qui n'est pas compté
+    predict_logits(model, tokenizer, test_dataset.select(range(min(len(test_dataset), batch_size))), batch_size)
+
+    start = time.perf_counter()
+    logits = predict_logits(model, tokenizer, test_dataset, batch_size)
+    runtime = time.perf_counter() - start
+    metrics = compute_metrics(logits, test_dataset["labels"])
+
+    latencies = []
+    for i in range(min(len(test_dataset), latency_samples)) :
+        start = time.perf_counter()
+        predict_logits(model, tokenizer, test_dataset.select([i]), 1)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    return {
+        "backend": backend,
+        "accuracy": metrics["accuracy"],
+        "f1": metrics["f1"],
+        "loss": metrics["loss"],
+        "samples_per_second": len(test_dataset) / runtime if runtime > 0 else 0.0,
+        "latency_p50_ms": float(np.percentile(latencies, 50)) if latencies else None,
+        "latency_p99_ms": float(np.percentile(latencies, 99)) if latencies else None,
+        "load_seconds": load_time,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "weights_mb": weights_size(backend_dir(model_dir, backend)) / 1e6,
+    }
+
+
+def choose_backend(results: list, budget: float = 0.01, reference: str = "pytorch") :
+    """Choisit la version la plus rapide (latence p50) dont la f-mesure reste dans le budget
+
+    Parameters
+    ----------
+    results : list
+        Les mesures de chaque version (renvoyées par bench_backend)
+    budget : float
+        La perte de f-mesure acceptée par rapport à la version de référence (0.01 = 1 point)
+    reference : str
+        La version de référence (la première mesurée si elle n'est pas dans les résultats)
+
+    Returns
+    -------
+    backend : str
+        Le nom de la version choisie
+    """
+
+    by_name = {result["backend"]: result for result in results}
+    reference_f1 = by_name.get(reference, results[0])["f1"]
+
+    allowed = [result for result in results if result["f1"] >= reference_f1 - budget]
+    return min(allowed, key=lambda result : result["latency_p50_ms"])["backend"]
+
+
+def _run_in_subprocess(args) :
+    return bench_backend(*args)
+
+
+if __name__ == "__main__" :
+    my_parser = argparse.ArgumentParser()
+    my_parser.add_argument("data", help="Le fichier (csv, parquet ou arrow) contenant le jeu de données")
+    my_parser.add_argument("--model", help=f"Le dossier contenant le modèle, par défaut {MODEL_DIR}", default=MODEL_DIR)
+    my_parser.add_argument("--backends", help="Les versions à comparer, par défaut toutes celles qui sont exportées et utilisables", nargs="*", choices=BACKENDS, default=None)
+    my_parser.add_argument("--batch-size", help="Le nombre de reviews par batch pour le débit, par défaut 32", type=int, default=32)
+    my_parser.add_argument("--latency-samples", help="Le nombre de reviews notées une par une pour la latence, par défaut 100", type=int, default=100)
+    my_parser.add_argument("--threads", help="Le nombre de threads utilisés pour l'inférence (par défaut, le choix de torch ou d'ONNX Runtime)", type=int, default=None)
+    my_parser.add_argument("--budget", help="La perte de f-mesure acceptée par rapport à la version pytorch, par défaut 0.01 (1 point)", type=float, default=0.01)
+    my_parser.add_argument("--cache-dir", help=f"Le dossier où sont sauvegardés les sous-corpus tokenizés, par défaut {CACHE_DIR}", default=CACHE_DIR)
+    my_parser.add_argument("--max-length", help="Le nombre maximum de tokens par review (celui de model_train.py --max-length), par défaut 128", type=int, default=128)
+    my_parser.add_argument("--output", help="Le fichier json du rapport, par défaut ../figures/comparaison_backends.json", default="../figures/comparaison_backends.json")
+    my_args = my_parser.parse_args()
+
+    backends = my_args.backends
+    if backends is None :
+        backends = [backend for backend in available_backends() if os.path.isdir(backend_dir(my_args.model, backend))]
+
+    # le sous-corpus test est tokenizé une fois ici, puis relu depuis le disque par chaque processus
+    tokenized_splits(my_args.data, load_backend(my_args.model, "pytorch")[1], max_length=my_args.max_length, seed=42, cache_dir=my_args.cache_dir)
+
+    # un processus neuf par version, pour que le RSS maximal soit propre à chacune
+    ctx = get_context("spawn")
+    results = []
+    print(f"{'version':<11}{'accuracy':>10}{'f1':>8}{'reviews/s':>11}{'p50 (ms)':>10}{'p99 (ms)':>10}{'RSS (Mo)':>10}{'poids (Mo)':>12}")
+    for backend in backends :
+        with ctx.Pool(1) as pool :
+            result = pool.map(_run_in_subprocess, [(my_args.data, backend, my_args.model, my_args.batch_size, my_args.latency_samples,
+                                                    my_args.threads, my_args.cache_dir, my_args.max_length)])[0]
+        results.append(result)
+        print(f"{backend:<11}{result['accuracy']:>10.2%}{result['f1']:>8.2%}{result['samples_per_second']:>11.1f}"
+              f"{result['latency_p50_ms']:>10.2f}{result['latency_p99_ms']:>10.2f}{result['peak_rss_mb']:>10.1f}{result['weights_mb']:>12.1f}")
+
+    choice = choose_backend(results, my_args.budget)
+    print(f"Version la plus rapide dans le budget ({my_args.budget:.1%} de f-mesure) : {choice}")
+
+    with open(my_args.output, "w", encoding="utf-8") as f :
+        json.dump({"budget": my_args.budget, "choice": choice, "results": results}, f, indent=2)
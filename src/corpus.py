@@ -0,0 +1,191 @@
+import argparse
+import json
+import os
+import runpy
+import subprocess
+import sys
+import time
+
+"""Commande corpus
+
+Ce script rassemble tous les scripts du projet sous une seule commande, avec une sous-commande par étape :
+
+    python corpus.py harmonize ../data/data_augmented.csv --output ../data/data_harmonized.csv
+    python corpus.py train ../data/data_harmonized.csv --epochs 5
+    python corpus.py evaluate --help
+
+(avec par exemple alias corpus="python /chemin/vers/src/corpus.py", on tape directement corpus harmonize ...)
+
+Chaque sous-commande lance le script correspondant avec les arguments qui suivent, exactement comme python <script>.py :
+les options, les chemins d'entrée et de sortie et leurs valeurs par défaut sont ceux du script (voir corpus <sous-commande> --help).
+Ce script n'importe lui-même que des bibliothèques standard, et seul le script de la sous-commande est importé : corpus --help
+et les sous-commandes légères (harmonize, dedup, stats...) ne paient jamais l'import de transformers, torch, datasets ou sklearn.
+Les scripts eux-mêmes n'importent ces bibliothèques qu'au moment de s'en servir, ce qui garde aussi leur --help rapide.
+
+La sous-commande startup mesure, pour chaque sous-commande et dans un interpréteur neuf, le temps d'import de son script
+(avec python -X importtime, qui donne aussi les imports les plus coûteux) et le temps total de corpus <sous-commande> --help.
+
+Ce script utilise les bibliothèques argparse, json, runpy, subprocess et time
+
+Ce script comporte ces fonctions :
+
+    * run_command - lance le script d'une sous-commande avec ses arguments
+    * import_time - mesure le temps d'import d'un module dans un interpréteur neuf
+    * startup_times - mesure le temps de démarrage de chaque sous-commande
+
+"""
+
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# sous-commande : (script, description)
+COMMANDS = {
+    "crawl": ("crawler_scraper", "crawl et scrape des reviews d'un film"),
+    "crawl-catalogue": ("crawl_scheduler", "crawl de plusieurs films, reprenable"),
+    "convert": ("corpus_io", "conversion d'un fichier du corpus (csv, parquet, arrow)"),
+    "stats": ("vis_stats", "statistiques et visualisations du corpus"),
+    "corpus-stats": ("corpus_stats", "statistiques du corpus, sans les figures"),
+    "augment": ("augment_data", "augmentation des données par rétro-traduction"),
+    "harmonize": ("harmonize_classes", "harmonisation des classes"),
+    "dedup": ("dedup", "retrait des doublons et des quasi-doublons"),
+    "splits": ("tokenized_splits", "découpage et tokenization des sous-corpus"),
+    "train": ("model_train", "entraînement du modèle"),
+    "evaluate": ("evaluate_model", "évaluation du modèle sur le sous-corpus test"),
+    "baseline": ("baseline_model", "modèle linéaire de référence (train, evaluate, predict)"),
+    "export": ("export_model", "export du modèle pour l'inférence sur CPU"),
+    "compare-backends": ("compare_backends", "comparaison des versions exportées du modèle"),
+    "predict": ("predict", "prédiction des notes d'un fichier de reviews"),
+    "serve": ("serve_model", "serveur HTTP de prédiction"),
+    "score": ("score_client", "client de charge du serveur de prédiction"),
+    "pipeline": ("pipeline", "toutes les étapes, avec cache"),
+    "bench-parsers": ("bench_parsers", "benchmark des backends d'extraction html"),
+    "bench": ("bench_pipeline", "benchmark des étapes sur des corpus synthétiques"),
+}
+
+
+def run_command(name: str, args: list) :
+    """Lance le script d'une sous-commande comme python <script>.py <args>
+
+    Parameters
+    ----------
+    name : str
+        La sous-commande
+    args : list
+        Les arguments passés au script
+    """
+
+    module = COMMANDS[name][0]
+    # sys.argv[0] est le chemin du script, comme avec python <script>.py : les mesures du module instrument gardent son nom
+    sys.argv = [os.path.join(SRC_DIR, module + ".py")] + list(args)
+    # alter_sys : le script devient le module __main__, que les processus lancés en spawn (pools, pipeline) savent réimporter
+    runpy.run_module(module, run_name="__main__", alter_sys=True)
+
+
+def import_time(module: str, top: int = 3) -> dict :
+    """Mesure le temps d'import d'un module dans un interpréteur neuf, avec python -X importtime
+
+    Parameters
+    ----------
+    module : str
+        Le nom du module
+    top : int
+        Le nombre d'imports directs les plus coûteux à garder
+
+    Returns
+    -------
+    result : dict
+        Le temps d'import du module (en secondes) et ses imports directs les plus coûteux
+    """
+
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=SRC_DIR,
+                             capture_output=True, text=True, check=True)
+
+    # chaque ligne : "import time: <self en µs> | <cumulé en µs> | <nom indenté de 2 espaces par niveau>", un module après ses imports :
+    # les imports directs du module sont les lignes de niveau 1 entre la ligne de niveau 0 précédente et celle du module
+    total, children = 0.0, []
+    for line in process.stderr.splitlines() :
+        if not line.startswith("import time:") or "|" not in line :
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit() :
+            continue
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth == 0 :
+            if name.strip() == module :
+                total = int(cumulative) / 1e6
+                break
+            children = []
+        elif depth == 1 :
+            children.append((name.strip(), int(cumulative) / 1e6))
+
+    heaviest = sorted(children, key=lambda child : child[1], reverse=True)[:top]
+
+    return {"import_seconds": total, "heaviest": [{"module": name, "seconds": seconds} for name, seconds in heaviest]}
+
+
+def startup_times(names: list = None, repeat: int = 3) -> list :
+    """Mesure le temps de démarrage de chaque sous-commande, dans des interpréteurs neufs (le meilleur de repeat essais)
+
+    Parameters
+    ----------
+    names : list
+        Les sous-commandes (par défaut toutes)
+    repeat : int
+        Le nombre d'essais par mesure
+
+    Returns
+    -------
+    results : list
+        Pour chaque sous-commande, le temps d'import de son script, ses imports les plus coûteux et le temps de corpus <sous-commande> --help
+    """
+
+    results = []
+    for name in names or COMMANDS :
+        module = COMMANDS[name][0]
+        imports = min((import_time(module) for _ in range(repeat)), key=lambda result : result["import_seconds"])
+
+        help_seconds = float("inf")
+        for _ in range(repeat) :
+            start = time.perf_counter()
+            subprocess.run([sys.executable, os.path.abspath(__file__), name, "--help"], cwd=SRC_DIR, capture_output=True, check=True)
+            help_seconds = min(help_seconds, time.perf_counter() - start)
+
+        results.append({"command": name, "module": module, **imports, "help_seconds": help_seconds})
+
+    return results
+
+
+if __name__ == "__main__" :
+    commands = "\n".join(f"  {name:<18}{description} ({module}.py)" for name, (module, description) in COMMANDS.items())
+    my_parser = argparse.ArgumentParser(prog="corpus", formatter_class=argparse.RawDescriptionHelpFormatter,
+                                        description="Les étapes du projet sous une seule commande (corpus <sous-commande> --help pour ses options)",
+                                        epilog=f"sous-commandes :\n{commands}\n  {'startup':<18}temps de démarrage de chaque sous-commande")
+    my_parser.add_argument("command", help="La sous-commande (voir la liste ci-dessous)", choices=list(COMMANDS) + ["startup"], metavar="sous-commande")
+    my_parser.add_argument("args", help="Les arguments de la sous-commande", nargs=argparse.REMAINDER)
+    my_args = my_parser.parse_args()
+
+    if my_args.command != "startup" :
+        run_command(my_args.command, my_args.args)
+    else :
+        startup_parser = argparse.ArgumentParser(prog="corpus startup")
+        startup_parser.add_argument("commands", help="Les sous-commandes à mesurer, par défaut toutes", nargs="*", default=[])
+        startup_parser.add_argument("--repeat", help="Le nombre d'essais par mesure (on garde le meilleur), par défaut 3", type=int, default=3)
+        startup_parser.add_argument("--output", help="Le fichier json où écrire les mesures, par défaut aucun", default=None)
+        startup_args = startup_parser.parse_args(my_args.args)
+        unknown = [name for name in startup_args.commands if name not in COMMANDS]
+        if unknown :
+            startup_parser.error(f"sous-commande inconnue : {', '.join(unknown)}")
+
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "pass"], check=True)
+        print(f"Démarrage de l'interpréteur seul : {time.perf_counter() - start:.2f} s\n")
+
+        results = startup_times(startup_args.commands, startup_args.repeat)
+        print(f"{'sous-commande':<18}{'import (s)':>11}{'--help (s)':>12}   imports les plus coûteux")
+        for result in results :
+            heaviest = ", ".join(f"{child['module']} {child['seconds']:.2f}" for child in result["heaviest"])
+            print(f"{result['command']:<18}{result['import_seconds']:>11.2f}{result['help_seconds']:>12.2f}   {heaviest}")
+
+        if startup_args.output is not None :
+            with open(startup_args.output, "w", encoding="utf-8") as f :
+                json.dump(results, f, indent=2)
@@ -0,0 +1,317 @@
+import argparse
+import csv
+import os
+import pandas as pd
+
+"""Lecture et écriture du corpus
+
+Ce module est utilisé par tous les scripts du projet pour lire et écrire le corpus (colonnes reviews et notes).
+Le format est choisi d'après l'extension du fichier :
+
+    * .csv - le format d'origine, gardé pour la compatibilité
+    * .parquet - format en colonnes compressé (zstd), beaucoup plus compact et rapide à relire que le csv pour de longs textes
+    * .arrow - format Arrow IPC non compressé, lu par memory-mapping sans copie (le plus rapide à ouvrir)
+
+Les notes entières (après harmonisation) sont stockées sur un octet (int8), et les notes sous forme de texte ("3,5")
+sont encodées par dictionnaire dans les fichiers parquet. Les lectures peuvent se limiter à certaines colonnes, et les
+fichiers parquet et arrow sont memory-mappés.
+
+Lancé comme script, il convertit un fichier du corpus d'un format à l'autre (par exemple data.csv vers data.parquet).
+
+Ce module utilise les bibliothèques pandas, csv et argparse, et pyarrow pour les formats parquet et arrow.
+
+Ce module comporte ces fonctions et classes :
+
+    * corpus_format - retourne le format d'un fichier d'après son extension
+    * compact_dtypes - retourne le DataFrame avec les notes entières stockées en int8
+    * read_corpus - lit un fichier du corpus dans un DataFrame
+    * iter_corpus - lit un fichier du corpus morceau par morceau
+    * write_corpus - écrit un DataFrame dans un fichier du corpus
+    * CorpusWriter - écrit un fichier du corpus morceau par morceau
+    * write_rows - écrit des couples (review, note) au fur et à mesure qu'ils arrivent
+    * load_dataset - charge un fichier du corpus comme Dataset huggingface
+
+"""
+
+
+FORMATS = {".csv": "csv", ".parquet": "parquet", ".arrow": "arrow", ".feather": "arrow"}
+
+
+def corpus_format(path: str) -> str :
+    """Retourne le format d'un fichier du corpus (csv, parquet ou arrow) d'après son extension
+
+    Parameters
+    ----------
+    path : str
+        Le chemin du fichier
+
+    Returns
+    -------
+    format : str
+        Le nom du format
+    """
+
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in FORMATS :
+        raise ValueError(f"Format de corpus inconnu : {path} (extensions possibles : {', '.join(FORMATS)})")
+
+    return FORMATS[extension]
+
+
+def compact_dtypes(data: pd.DataFrame) -> pd.DataFrame :
+    """Stocke les notes entières (de 0 à 5 après harmonisation) sur un octet au lieu de huit
+
+    Parameters
+    ----------
+    data : DataFrame
+        Le corpus
+
+    Returns
+    -------
+    data : DataFrame
+        Le corpus, avec la colonne notes en int8 si elle est entière
+    """
+
+    if "notes" in data.columns and pd.api.types.is_integer_dtype(data["notes"]) :
+        data = data.assign(notes=data["notes"].astype("int8"))
+
+    return data
+
+
+def read_corpus(path: str, columns: list = None) -> pd.DataFrame :
+    """Lit un fichier du corpus
+
+    Parameters
+    ----------
+    path : str
+        Le chemin du fichier (csv, parquet ou arrow)
+    columns : list
+        Les colonnes à lire (toutes par défaut) : en parquet et en arrow, les autres ne sont pas lues du tout
+
+    Returns
+    -------
+    data : DataFrame
+        Le corpus
+    """
+
+    file_format = corpus_format(path)
+
+    if file_format == "csv" :
+        return pd.read_csv(path, usecols=columns)
+
+    import pyarrow as pa
+
+    if file_format == "parquet" :
+        import pyarrow.parquet as pq
+
+        table = pq.read_table(path, columns=columns, memory_map=True)
+    else :
+        table = pa.ipc.open_file(pa.memory_map(path)).read_all()
+        if columns is not None :
+            table = table.select(columns)
+
+    return table.to_pandas()
+
+
+def iter_corpus(path: str, chunksize: int = 100_000, columns: list = None) :
+    """Lit un fichier du corpus morceau par morceau, pour que la mémoire ne dépende pas de la taille du fichier
+
+    Parameters
+    ----------
+    path : str
+        Le chemin du fichier (csv, parquet ou arrow)
+    chunksize : int
+        Le nombre de lignes par morceau
+    columns : list
+        Les colonnes à lire (toutes par défaut)
+
+    Yields
+    ------
+    chunk : DataFrame
+        Un morceau du corpus
+    """
+
+    file_format = corpus_format(path)
+
+    if file_format == "csv" :
+        yield from pd.read_csv(path, chunksize=chunksize, usecols=columns)
+        return
+
+    import pyarrow as pa
+
+    if file_format == "parquet" :
+        import pyarrow.parquet as pq
+
+        batches = pq.ParquetFile(path, memory_map=True).iter_batches(batch_size=chunksize, columns=columns)
+        for batch in batches :
+            yield batch.to_pandas()
+        return
+
+    with pa.memory_map(path) as source :
+        table = pa.ipc.open_file(source).read_all()
+        if columns is not None :
+            table = table.select(columns)
+        for batch in table.to_batches(max_chunksize=chunksize) :
+            yield batch.to_pandas()
+
+
+class CorpusWriter :
+    """Ecrit un fichier du corpus morceau par morceau (csv, parquet ou arrow)
+
+    Parameters
+    ----------
+    path : str
+        Le chemin du fichier à écrire
+    """
+
+    def __init__(self, path: str) :
+        self.path = path
+        self.format = corpus_format(path)
+        self.count = 0
+        self._writer = None
+        self._file = None
+        self._schema = None
+
+    def write(self, chunk: pd.DataFrame) :
+        """Ajoute un morceau (DataFrame) à la fin du fichier"""
+
+        chunk = compact_dtypes(chunk)
+
+        if self.format == "csv" :
+            if self._file is None :
+                self._file = open(self.path, "w", newline="", encoding="utf-8")
+                chunk.to_csv(self._file, index=False)
+            else :
+                chunk.to_csv(self._file, index=False, header=False)
+        else :
+            import pyarrow as pa
+
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if self._writer is None :
+                # le schéma du premier morceau sert pour tout le fichier
+                self._schema = table.schema
+                if self.format == "parquet" :
+                    import pyarrow.parquet as pq
+
+                    self._writer = pq.ParquetWriter(self.path, table.schema, compression="zstd")
+                else :
+                    self._writer = pa.ipc.new_file(self.path, table.schema)
+            else :
+                table = table.cast(self._schema)
+            self._writer.write_table(table)
+
+        self.count += len(chunk)
+
+    def close(self, columns: list = None) :
+        """Termine le fichier (s'il n'a reçu aucun morceau, on écrit un fichier vide avec les colonnes données)"""
+
+        if self._file is None and self._writer is None :
+            self.write(pd.DataFrame({column: pd.Series(dtype="str") for column in (columns or ["reviews", "notes"])}))
+
+        if self._file is not None :
+            self._file.close()
+        if self._writer is not None :
+            self._writer.close()
+
+    def __enter__(self) :
+        return self
+
+    def __exit__(self, *exc) :
+        self.close()
+
+
+def write_corpus(data: pd.DataFrame, path: str) :
+    """Ecrit un DataFrame dans un fichier du corpus
+
+    Parameters
+    ----------
+    data : DataFrame
+        Le corpus
+    path : str
+        Le chemin du fichier (csv, parquet ou arrow)
+    """
+
+    with CorpusWriter(path) as writer :
+        writer.write(data)
+
+
+def write_rows(rows, path: str, batch_size: int = 10_000) -> int :
+    """Ecrit des couples (review, note) dans un fichier du corpus au fur et à mesure qu'ils arrivent
+
+    Parameters
+    ----------
+    rows : iterable
+        Les couples (review, note), par exemple renvoyés par le crawler
+    path : str
+        Le chemin du fichier (csv, parquet ou arrow)
+    batch_size : int
+        Le nombre de lignes gardées en mémoire avant d'être écrites (en csv, chaque ligne est écrite dès qu'elle arrive)
+
+    Returns
+    -------
+    count : int
+        Le nombre de lignes écrites
+    """
+
+    if corpus_format(path) == "csv" :
+        count = 0
+        with open(path, "w", newline="", encoding="utf-8") as f :
+            writer = csv.writer(f)
+            writer.writerow(["reviews", "notes"])
+            for row in rows :
+                writer.writerow(row)
+                count += 1
+        return count
+
+    with CorpusWriter(path) as writer :
+        batch = []
+        for row in rows :
+            batch.append(row)
+            if len(batch) >= batch_size :
+                writer.write(pd.DataFrame(batch, columns=["reviews", "notes"]))
+                batch = []
+        if batch :
+            writer.write(pd.DataFrame(batch, columns=["reviews", "notes"]))
+
+    return writer.count
+
+
+def load_dataset(path: str) :
+    """Charge un fichier du corpus comme Dataset huggingface (stocké en Arrow et memory-mappé)
+
+    Parameters
+    ----------
+    path : str
+        Le chemin du fichier (csv, parquet ou arrow)
+
+    Returns
+    -------
+    dataset : Dataset
+        Le corpus
+    """
+
+    import datasets
+
+    file_format = corpus_format(path)
+
+    if file_format == "arrow" :
+        import pyarrow as pa
+
+        # la table memory-mappée devient directement le Dataset, sans passer par pandas : les reviews ne sont pas copiées en mémoire
+        return datasets.Dataset(pa.ipc.open_file(pa.memory_map(path)).read_all())
+
+    return datasets.load_dataset(file_format, data_files=path)["train"]
+
+
+if __name__ == "__main__" :
+    my_parser = argparse.ArgumentParser()
+    my_parser.add_argument("source", help="Le fichier du corpus à convertir (csv, parquet ou arrow)")
+    my_parser.add_argument("destination", help="Le fichier à écrire, dont l'extension donne le format")
+    my_parser.add_argument("--chunksize", help="Le nombre de lignes converties à la fois, par défaut 100000", type=int, default=100_000)
+    my_args = my_parser.parse_args()
+
+    with CorpusWriter(my_args.destination) as writer :
+        for chunk in iter_corpus(my_args.source, my_args.chunksize) :
+            writer.write(chunk)
+
+    print(writer.count, "lignes écrites dans", my_args.destination)
@@ -0,0 +1,592 @@
+import argparse
+import base64
+import csv
+import hashlib
+import json
+import os
+import re
+from collections import Counter, deque
+from itertools import chain
+from multiprocessing import get_context
+import numpy as np
+import pandas as pd
+from corpus_io import corpus_format, iter_corpus
+import instrument
+
+"""Statistiques du corpus
+
+Ce module calcule les statistiques utilisées par vis_stats.py sans jamais garder le corpus entier en mémoire.
+Le corpus est lu morceau par morceau (option --chunksize), chaque morceau est découpé en mots et compté dans un processus
+(option --workers), puis les résultats de tous les morceaux sont additionnés dans un objet CorpusStats, qui contient :
+
+    * le nombre de reviews et de mots, et la somme des notes (pour les moyennes)
+    * le nombre de reviews par note
+    * l'histogramme des longueurs (en mots) des reviews pour chaque note
+    * le nombre d'occurrences de chaque mot, sans les stopwords (pour la loi de Zipf)
+
+La mémoire utilisée dépend donc du vocabulaire et du nombre de longueurs différentes, et non de la taille du corpus.
+Le découpage en mots est le même que celui de vis_stats.py : minuscules, ponctuation remplacée par des espaces, puis découpage sur les espaces.
+
+Deux résumés approchés, eux aussi additionnables, sont tenus à jour en plus des comptes exacts :
+
+    * un HyperLogLog, qui estime la taille du vocabulaire (à 1% près environ) avec quelques kilo-octets
+    * un résumé de Misra-Gries, qui garde les mots les plus fréquents avec une erreur bornée
+
+Avec l'option --sketch-only, le compte exact des mots n'est pas gardé : la mémoire et le fichier de statistiques ont alors
+une taille fixe, même pour un vocabulaire énorme, et la loi de Zipf est tracée sur les mots les plus fréquents seulement.
+
+Les statistiques d'un fichier du corpus sont sauvegardées à côté de lui (data.csv.stats.json pour data.csv), avec la taille
+et l'empreinte de la partie du fichier déjà comptée. Quand des reviews ont été ajoutées à la fin d'un csv (par exemple par
+le crawler avec --state-dir), seules les nouvelles lignes sont lues et ajoutées aux statistiques ; si le fichier a été réécrit,
+tout est recalculé. vis_stats.py régénère ensuite les figures et le fichier txt à partir de ces statistiques, sans relire le corpus.
+
+Lancé comme script, il met à jour les statistiques d'un fichier du corpus et affiche les moyennes et le nombre de reviews par note.
+
+Ce module utilise les bibliothèques pandas, numpy, re, hashlib, json, base64, csv, collections, itertools, multiprocessing et argparse, ainsi que les modules corpus_io et instrument
+
+Ce module comporte ces fonctions et classes :
+
+    * french_stopwords - retourne les stopwords français de nltk
+    * parse_notes - convertit les notes ("3,5" ou 3) en float
+    * HyperLogLog - estime le nombre de mots différents
+    * TopWords - garde les mots les plus fréquents (résumé de Misra-Gries)
+    * CorpusStats - statistiques d'une partie du corpus, qu'on peut additionner, sauvegarder et relire
+    * chunk_stats - calcule les statistiques d'un morceau du corpus
+    * compute_stats - calcule les statistiques d'un fichier du corpus, morceau par morceau et en parallèle
+    * stats_path - retourne le fichier de statistiques d'un fichier du corpus
+    * update_stats - met à jour les statistiques sauvegardées d'un fichier du corpus, en ne lisant que ce qui a changé
+
+"""
+
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+STATS_VERSION = 1
+
+
+def french_stopwords() -> frozenset :
+    """Retourne les stopwords français de nltk (il faut les avoir téléchargés avec nltk.download('stopwords'))"""
+
+    from nltk.corpus import stopwords
+
+    return frozenset(stopwords.words("french"))
+
+
+def parse_notes(notes: pd.Series) -> pd.Series :
+    """Convertit les notes en float, qu'elles soient des chaînes avec une virgule ("3,5") ou déjà des nombres"""
+
+    if pd.api.types.is_numeric_dtype(notes) :
+        return notes.astype(float)
+
+    return notes.astype(str).str.replace(",", ".", regex=False).astype(float)
+
+
+def _word_hashes(words) -> np.ndarray :
+    # empreintes sur 64 bits, identiques d'un processus à l'autre (contrairement à hash())
+    return np.fromiter((int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little") for word in words),
+                       dtype=np.uint64)
+
+
+class HyperLogLog :
+    """Estime le nombre de mots différents avec 2**precision registres d'un octet
+
+    Deux HyperLogLog s'additionnent en gardant le maximum de chaque registre, et ajouter un mot déjà vu ne change rien :
+    on peut donc n'y ajouter que les mots différents de chaque morceau. L'erreur relative est d'environ 1.04 / sqrt(2**precision).
+
+    Parameters
+    ----------
+    precision : int
+        Le nombre de bits de l'empreinte qui choisissent le registre (14 : 16384 registres, 0.8% d'erreur)
+    """
+
+    def __init__(self, precision: int = 14) :
+        self.precision = precision
+        self.registers = np.zeros(2 ** precision, dtype=np.uint8)
+
+    def add(self, words) :
+        """Ajoute des mots"""
+
+        hashes = _word_hashes(words)
+        if len(hashes) == 0 :
+            return
+
+        width = 64 - self.precision
+        index = (hashes >> np.uint64(width)).astype(np.int64)
+        rest = (hashes & np.uint64((1 << width) - 1)).astype(np.float64)
+        # rang du premier bit à 1 dans les bits restants (frexp donne la position du bit le plus fort, exacte jusqu'à 2**53)
+        ranks = (width - np.frexp(rest)[1] + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, ranks)
+
+    def merge(self, other: "HyperLogLog") -> "HyperLogLog" :
+        """Ajoute les mots d'un autre HyperLogLog"""
+
+        if other.precision != self.precision :
+            raise ValueError(f"Précisions différentes : {self.precision} et {other.precision}")
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+        return self
+
+    def estimate(self) -> float :
+        """Le nombre estimé de mots différents"""
+
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+
+        # pour les petits vocabulaires, on compte les registres vides (linear counting), plus précis
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros > 0 :
+            estimate = m * np.log(m / zeros)
+
+        return float(estimate)
+
+    def to_dict(self) -> dict :
+        return {"precision": self.precision, "registers": base64.b64encode(self.registers.tobytes()).decode("ascii")}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "HyperLogLog" :
+        sketch = cls(data["precision"])
+        sketch.registers = np.frombuffer(base64.b64decode(data["registers"]), dtype=np.uint8).copy()
+        return sketch
+
+
+class TopWords :
+    """Garde au plus k mots avec un compteur (résumé de Misra-Gries) : tout mot plus fréquent que n / (k + 1) y est,
+    et chaque compte est sous-estimé d'au plus n / (k + 1), n étant le nombre de mots comptés
+
+    Parameters
+    ----------
+    k : int
+        Le nombre de mots gardés
+    """
+
+    def __init__(self, k: int = 1000) :
+        self.k = k
+        self.counts = Counter()
+
+    def update(self, counts: Counter) :
+        """Ajoute des comptes de mots, puis retire à chaque mot le (k+1)-ième plus grand compte pour n'en garder que k"""
+
+        self.counts.update(counts)
+        if len(self.counts) > self.k :
+            threshold = int(np.partition(np.fromiter(self.counts.values(), dtype=np.int64), -(self.k + 1))[-(self.k + 1)])
+            self.counts = Counter({word: count - threshold for word, count in self.counts.items() if count > threshold})
+
+    def merge(self, other: "TopWords") -> "TopWords" :
+        """Ajoute un autre résumé (le résultat a les mêmes garanties que s'il avait tout compté)"""
+
+        self.update(other.counts)
+        return self
+
+    def most_common(self, n: int = None) -> list :
+        return self.counts.most_common(n)
+
+    def to_dict(self) -> dict :
+        return {"k": self.k, "counts": dict(self.counts)}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "TopWords" :
+        sketch = cls(data["k"])
+        sketch.counts = Counter(data["counts"])
+        return sketch
+
+
+class CorpusStats :
+    """Statistiques d'une partie du corpus : deux CorpusStats s'additionnent (merge) pour donner celles de la réunion des deux parties
+
+    Parameters
+    ----------
+    exact_words : bool
+        Garder le compte exact de chaque mot (sinon, seulement les résumés approchés du vocabulaire)
+    precision : int
+        La précision du HyperLogLog qui estime la taille du vocabulaire
+    top_k : int
+        Le nombre de mots les plus fréquents gardés par le résumé de Misra-Gries
+    """
+
+    def __init__(self, exact_words: bool = True, precision: int = 14, top_k: int = 1000) :
+        self.n_reviews = 0
+        self.n_words = 0
+        self.notes_sum = 0.0
+        self.note_counts = Counter()
+        self.length_hist = {}
+        self.word_counts = Counter() if exact_words else None
+        self.vocabulary = HyperLogLog(precision)
+        self.top_words = TopWords(top_k)
+        # la partie du fichier déjà comptée (voir update_stats)
+        self.source = None
+
+    def merge(self, other: "CorpusStats") -> "CorpusStats" :
+        """Ajoute les statistiques d'une autre partie du corpus à celles-ci"""
+
+        self.n_reviews += other.n_reviews
+        self.n_words += other.n_words
+        self.notes_sum += other.notes_sum
+        self.note_counts.update(other.note_counts)
+        for note, lengths in other.length_hist.items() :
+            self.length_hist.setdefault(note, Counter()).update(lengths)
+        self.vocabulary.merge(other.vocabulary)
+        self.top_words.merge(other.top_words)
+
+        # le compte exact n'a de sens que si les deux parties l'ont gardé
+        if self.word_counts is not None and other.word_counts is not None :
+            self.word_counts.update(other.word_counts)
+        else :
+            self.word_counts = None
+
+        return self
+
+    @property
+    def exact_words(self) -> bool :
+        return self.word_counts is not None
+
+    @property
+    def vocabulary_size(self) -> float :
+        """Le nombre de mots différents (sans les stopwords) : exact si on a gardé le compte des mots, estimé sinon"""
+        return float(len(self.word_counts)) if self.exact_words else self.vocabulary.estimate()
+
+    @property
+    def mean_length(self) -> float :
+        """La longueur moyenne des reviews, en mots"""
+        return self.n_words / self.n_reviews if self.n_reviews else 0.0
+
+    @property
+    def mean_note(self) -> float :
+        """La note moyenne"""
+        return self.notes_sum / self.n_reviews if self.n_reviews else 0.0
+
+    def count_by_note(self) -> pd.DataFrame :
+        """Le nombre de reviews par note, sous la même forme que data.groupby(['notes']).count()"""
+
+        notes = sorted(self.note_counts)
+        return pd.DataFrame({"reviews": [self.note_counts[note] for note in notes]}, index=pd.Index(notes, name="notes"))
+
+    def mean_length_by_note(self) -> pd.DataFrame :
+        """La longueur moyenne des reviews pour chaque note (colonnes notes et reviews)"""
+
+        notes = sorted(self.length_hist)
+        means = [sum(length * count for length, count in self.length_hist[note].items()) / sum(self.length_hist[note].values()) for note in notes]
+        return pd.DataFrame({"notes": notes, "reviews": means})
+
+    def zipf(self) -> tuple :
+        """Les rangs (1 pour le mot le plus fréquent) et les fréquences des mots, du plus fréquent au moins fréquent
+
+        Sans le compte exact des mots, ce sont les rangs et les fréquences (sous-estimées) des mots les plus fréquents seulement.
+        """
+
+        counts = self.word_counts if self.exact_words else self.top_words.counts
+        frequencies = np.sort(np.fromiter(counts.values(), dtype=np.int64, count=len(counts)))[::-1]
+        return np.arange(1, len(frequencies) + 1), frequencies
+
+    def length_boxplot(self, note) -> dict :
+        """Les valeurs d'une boîte à moustaches des longueurs des reviews d'une note, calculées à partir de l'histogramme
+
+        Les quartiles sont ceux de numpy (interpolation linéaire), les moustaches s'arrêtent à la dernière longueur
+        à moins de 1,5 fois l'écart interquartile, et les longueurs au-delà sont les points isolés (comme seaborn).
+        """
+
+        lengths = np.array(sorted(self.length_hist[note]))
+        counts = np.array([self.length_hist[note][length] for length in lengths])
+        cumulated = np.cumsum(counts)
+        n = cumulated[-1]
+
+        def quantile(q) :
+            # quantile d'une liste triée de n valeurs dont on ne connaît que l'histogramme
+            position = q * (n - 1)
+            low, high = int(np.floor(position)), int(np.ceil(position))
+            value_low = lengths[np.searchsorted(cumulated, low + 1)]
+            value_high = lengths[np.searchsorted(cumulated, high + 1)]
+            return value_low + (value_high - value_low) * (position - low)
+
+        q1, med, q3 = quantile(0.25), quantile(0.5), quantile(0.75)
+        iqr = q3 - q1
+        inside = lengths[(lengths >= q1 - 1.5 * iqr) & (lengths <= q3 + 1.5 * iqr)]
+
+        return {
+            "label": note,
+            "q1": q1,
+            "med": med,
+            "q3": q3,
+            "whislo": inside.min(),
+            "whishi": inside.max(),
+            "fliers": lengths[(lengths < q1 - 1.5 * iqr) | (lengths > q3 + 1.5 * iqr)],
+        }
+
+
+    def to_dict(self) -> dict :
+        """Les statistiques sous une forme qu'on peut écrire en json"""
+
+        return {
+            "version": STATS_VERSION,
+            "n_reviews": self.n_reviews,
+            "n_words": self.n_words,
+            "notes_sum": self.notes_sum,
+            # les notes sont des float : on les garde en listes de couples plutôt qu'en clés json (qui seraient des chaînes)
+            "note_counts": [[float(note), int(count)] for note, count in sorted(self.note_counts.items())],
+            "length_hist": [[float(note), [[int(length), int(count)] for length, count in sorted(lengths.items())]] for note, lengths in sorted(self.length_hist.items())],
+            "word_counts": dict(self.word_counts) if self.exact_words else None,
+            "vocabulary": self.vocabulary.to_dict(),
+            "top_words": self.top_words.to_dict(),
+            "source": self.source,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "CorpusStats" :
+        """Relit les statistiques écrites par to_dict"""
+
+        if data.get("version") != STATS_VERSION :
+            raise ValueError(f"Version de statistiques inconnue : {data.get('version')} (attendue : {STATS_VERSION})")
+
+        stats = cls()
+        stats.n_reviews = data["n_reviews"]
+        stats.n_words = data["n_words"]
+        stats.notes_sum = data["notes_sum"]
+        stats.note_counts = Counter({float(note): count for note, count in data["note_counts"]})
+        stats.length_hist = {float(note): Counter({int(length): count for length, count in lengths}) for note, lengths in data["length_hist"]}
+        stats.word_counts = Counter(data["word_counts"]) if data["word_counts"] is not None else None
+        stats.vocabulary = HyperLogLog.from_dict(data["vocabulary"])
+        stats.top_words = TopWords.from_dict(data["top_words"])
+        stats.source = data["source"]
+
+        return stats
+
+    def save(self, path: str) :
+        """Sauvegarde les statistiques dans un fichier json (écrit à côté puis renommé, pour ne jamais laisser un fichier à moitié écrit)"""
+
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f :
+            json.dump(self.to_dict(), f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "CorpusStats" :
+        """Relit des statistiques sauvegardées par save"""
+
+        with open(path, encoding="utf-8") as f :
+            return cls.from_dict(json.load(f))
+
+
+def chunk_stats(chunk: pd.DataFrame, stop_words: frozenset) -> CorpusStats :
+    """Calcule les statistiques d'un morceau du corpus
+
+    Parameters
+    ----------
+    chunk : DataFrame
+        Un morceau du corpus (colonnes reviews et notes)
+    stop_words : frozenset
+        Les mots à ne pas compter pour la loi de Zipf
+
+    Returns
+    -------
+    stats : CorpusStats
+        Les statistiques du morceau
+    """
+
+    # On transforme le texte des reviews en une liste de mots
+    words = chunk["reviews"].fillna("").astype(str).str.lower().str.replace(_PUNCTUATION, " ", regex=True).str.split()
+    lengths = words.str.len()
+    notes = parse_notes(chunk["notes"])
+
+    stats = CorpusStats()
+    stats.n_reviews = len(chunk)
+    stats.n_words = int(lengths.sum())
+    stats.notes_sum = float(notes.sum())
+    stats.note_counts = Counter(notes.value_counts().to_dict())
+
+    for (note, length), count in pd.DataFrame({"notes": notes, "lengths": lengths}).value_counts().items() :
+        stats.length_hist.setdefault(note, Counter())[int(length)] += int(count)
+
+    # On compte tous les mots du morceau, puis on retire les stopwords du compte (plus rapide que de les filtrer un par un)
+    word_counts = Counter(chain.from_iterable(words))
+    for word in stop_words.intersection(word_counts) :
+        del word_counts[word]
+    stats.word_counts = word_counts
+
+    # les résumés approchés sont calculés ici, dans le processus du morceau, avant d'être additionnés
+    stats.vocabulary.add(word_counts.keys())
+    stats.top_words.update(word_counts)
+
+    return stats
+
+
+def _merge_chunks(stats: CorpusStats, chunks, stop_words: frozenset, workers: int) -> CorpusStats :
+    # ajoute aux statistiques celles de chaque morceau, calculées dans ce processus ou dans un pool de processus
+
+    if workers <= 1 :
+        for chunk in chunks :
+            stats.merge(chunk_stats(chunk, stop_words))
+        return stats
+
+    # fenêtre glissante : au plus 2 morceaux en attente par processus, pour que la mémoire ne dépende pas de la taille du fichier
+    with get_context("spawn").Pool(workers) as pool :
+        in_flight = deque()
+        for chunk in chunks :
+            in_flight.append(pool.apply_async(chunk_stats, (chunk, stop_words)))
+            if len(in_flight) >= 2 * workers :
+                stats.merge(in_flight.popleft().get())
+        while in_flight :
+            stats.merge(in_flight.popleft().get())
+
+    return stats
+
+
+def compute_stats(path: str, chunksize: int = 50_000, workers: int = 1, stop_words: frozenset = None, exact_words: bool = True) -> CorpusStats :
+    """Calcule les statistiques d'un fichier du corpus, morceau par morceau et en parallèle
+
+    Parameters
+    ----------
+    path : str
+        Le fichier du corpus (csv, parquet ou arrow)
+    chunksize : int
+        Le nombre de reviews par morceau
+    workers : int
+        Le nombre de processus qui comptent les morceaux
+    stop_words : frozenset
+        Les mots à ne pas compter pour la loi de Zipf (par défaut, les stopwords français de nltk)
+    exact_words : bool
+        Garder le compte exact de chaque mot (sinon, seulement les résumés approchés du vocabulaire)
+
+    Returns
+    -------
+    stats : CorpusStats
+        Les statistiques du corpus entier
+    """
+
+    if stop_words is None :
+        stop_words = french_stopwords()
+
+    chunks = iter_corpus(path, chunksize, columns=["reviews", "notes"])
+
+    return _merge_chunks(CorpusStats(exact_words), chunks, stop_words, workers)
+
+
+def stats_path(path: str) -> str :
+    """Retourne le fichier de statistiques d'un fichier du corpus (data.csv.stats.json pour data.csv)"""
+
+    return f"{path}.stats.json"
+
+
+def _prefix_hashes(path: str, sizes: list) -> list :
+    # empreintes (blake2b) des premiers octets du fichier pour chaque taille demandée, en une seule lecture
+    digest = hashlib.blake2b(digest_size=16)
+    hashes = {}
+    position = 0
+
+    with open(path, "rb") as f :
+        for size in sorted(sizes) :
+            while position < size :
+                block = f.read(min(1 << 20, size - position))
+                if not block :
+                    break
+                digest.update(block)
+                position += len(block)
+            hashes[size] = digest.hexdigest()
+
+    return [hashes[size] for size in sizes]
+
+
+def _stop_words_hash(stop_words: frozenset) -> str :
+    return hashlib.blake2b("\n".join(sorted(stop_words)).encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _iter_csv_tail(path: str, offset: int, chunksize: int) :
+    # lit les lignes d'un csv à partir d'un octet donné (le début d'une ligne), avec les colonnes de l'en-tête du fichier
+    with open(path, newline="", encoding="utf-8") as f :
+        header = next(csv.reader(f))
+
+    with open(path, "rb") as f :
+        f.seek(offset)
+        yield from pd.read_csv(f, header=None, names=header, usecols=["reviews", "notes"], chunksize=chunksize, encoding="utf-8")
+
+
+def update_stats(path: str, chunksize: int = 50_000, workers: int = 1, stop_words: frozenset = None, exact_words: bool = True,
+                 stats_file: str = None) -> CorpusStats :
+    """Met à jour les statistiques sauvegardées d'un fichier du corpus, en ne lisant que ce qui a changé
+
+    Si le fichier n'a pas changé depuis la dernière fois, les statistiques sont simplement relues. Si des lignes ont été
+    ajoutées à la fin d'un csv (le début du fichier a toujours la même empreinte), seules ces lignes sont lues. Sinon
+    (fichier réécrit, parquet ou arrow modifié, autres stopwords, autre mode de comptage des mots), tout est recalculé.
+
+    Parameters
+    ----------
+    path : str
+        Le fichier du corpus (csv, parquet ou arrow)
+    chunksize : int
+        Le nombre de reviews par morceau
+    workers : int
+        Le nombre de processus qui comptent les morceaux
+    stop_words : frozenset
+        Les mots à ne pas compter pour la loi de Zipf (par défaut, les stopwords français de nltk)
+    exact_words : bool
+        Garder le compte exact de chaque mot (sinon, seulement les résumés approchés du vocabulaire)
+    stats_file : str
+        Le fichier de statistiques (par défaut, à côté du fichier du corpus, voir stats_path)
+
+    Returns
+    -------
+    stats : CorpusStats
+        Les statistiques du corpus entier, sauvegardées dans stats_file
+    """
+
+    if stop_words is None :
+        stop_words = french_stopwords()
+    if stats_file is None :
+        stats_file = stats_path(path)
+
+    stop_hash = _stop_words_hash(stop_words)
+    before = os.stat(path)
+
+    stats = None
+    if os.path.exists(stats_file) :
+        try :
+            stats = CorpusStats.load(stats_file)
+        except (ValueError, KeyError) :
+            # fichier d'une autre version ou abîmé : on recalcule tout
+            stats = None
+
+    source = stats.source if stats is not None else None
+    if source is not None and source["stop_words"] == stop_hash and stats.exact_words == exact_words :
+        if source["size"] == before.st_size and source["mtime_ns"] == before.st_mtime_ns :
+            return stats
+
+        if corpus_format(path) == "csv" and before.st_size > source["size"] :
+            old_hash, new_hash = _prefix_hashes(path, [source["size"], before.st_size])
+            if old_hash == source["hash"] :
+                _merge_chunks(stats, _iter_csv_tail(path, source["size"], chunksize), stop_words, workers)
+                return _save_with_source(stats, path, stats_file, before, new_hash, stop_hash)
+
+    stats = compute_stats(path, chunksize, workers, stop_words, exact_words)
+    new_hash = _prefix_hashes(path, [before.st_size])[0]
+
+    return _save_with_source(stats, path, stats_file, before, new_hash, stop_hash)
+
+
+def _save_with_source(stats: CorpusStats, path: str, stats_file: str, before: os.stat_result, file_hash: str, stop_hash: str) -> CorpusStats :
+    # on note la partie du fichier comptée, sauf si le fichier a changé pendant la lecture (la prochaine mise à jour recalculera tout)
+    after = os.stat(path)
+    if (after.st_size, after.st_mtime_ns) == (before.st_size, before.st_mtime_ns) :
+        stats.source = {"size": before.st_size, "mtime_ns": before.st_mtime_ns, "hash": file_hash, "stop_words": stop_hash}
+    else :
+        stats.source = None
+
+    stats.save(stats_file)
+
+    return stats
+
+
+if __name__ == "__main__" :
+    my_parser = argparse.ArgumentParser()
+    my_parser.add_argument("data", help="Fichier (csv, parquet ou arrow) sur lequel calculer les statistiques")
+    my_parser.add_argument("--chunksize", help="Le nombre de reviews par morceau, par défaut 50000", type=int, default=50_000)
+    my_parser.add_argument("--workers", help="Le nombre de processus, par défaut 1", type=int, default=1)
+    my_parser.add_argument("--sketch-only", help="Ne pas garder le compte exact des mots, seulement les résumés approchés", action="store_true")
+    my_parser.add_argument("--stats-file", help="Le fichier de statistiques, par défaut <data>.stats.json", default=None)
+    my_args = my_parser.parse_args()
+
+    with instrument.stage("corpus_stats") :
+        stats = update_stats(my_args.data, my_args.chunksize, my_args.workers, exact_words=not my_args.sketch_only, stats_file=my_args.stats_file)
+
+        print(f"{stats.n_reviews} reviews, {stats.vocabulary_size:.0f} mots différents (sans les stopwords)")
+        print(f"Longueur moyenne : {stats.mean_length} mots")
+        print(f"Note moyenne : {stats.mean_note} étoiles")
+        print("Mots les plus fréquents :", ", ".join(word for word, _ in stats.top_words.most_common(10)))
+        print(stats.count_by_note())
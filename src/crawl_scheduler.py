@@ -0,0 +1,339 @@
+import argparse
+import hashlib
+import heapq
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse, parse_qs
+import requests
+from crawler_scraper import HostThrottle, make_session, fetch
+from extractors import get_extractor, available_extractors
+from crawl_state import HttpCache, ReviewSink
+from corpus_io import corpus_format
+import instrument
+
+"""Ordonnanceur de crawl multi-films
+
+Ce script prend en argument un fichier contenant des URLs de pages de critiques spectateurs Allociné (une par ligne)
+et crawle et scrape tous ces films en une seule passe, en parallèle.
+
+Pour chaque film on garde une frontière à priorité (les pages sont visitées dans l'ordre de leur numéro) et un budget de pages
+(max_crawl compte les pages téléchargées, et non plus les liens). Les urls déjà vues sont gardées dans un ensemble d'empreintes
+commun à tous les films. Les films actifs sont servis à tour de rôle, et le délai entre deux requêtes vers un même hôte s'adapte :
+il augmente quand le serveur répond 429 ou 5xx (la page est alors remise dans la frontière) et diminue quand les réponses sont rapides.
+La latence prise en compte est celle de la requête seule, sans l'attente du délai de politesse. Une erreur réseau (connexion coupée,
+timeout) est traitée comme une réponse 5xx : la page est redemandée plus tard, et le crawl des autres films continue.
+
+Les reviews sont ajoutées au csv de sortie sans doublons, et les films terminés sont notés dans un fichier à côté du csv :
+relancer le script ne recrawle pas les films déjà terminés. Un film dont une page a été abandonnée (après max_retries essais)
+ou a renvoyé une erreur (404...) n'est pas noté comme terminé : il est recrawlé au lancement suivant, et le csv garde ses reviews sans doublons.
+
+Ce script utilise les bibliothèques argparse, hashlib, heapq, concurrent.futures et requests,
+ainsi que les modules crawler_scraper, crawl_state, extractors et instrument.
+
+Ce script comporte ces fonctions et classes :
+
+    * AdaptiveThrottle - délai de politesse par hôte qui s'adapte aux réponses du serveur
+    * FilmCrawl - l'état du crawl d'un film (frontière à priorité et budget de pages)
+    * page_number - retourne le numéro de page d'une url de critiques
+    * read_targets - retourne la liste des urls cibles contenues dans un fichier
+    * crawl_catalogue - crawl et scrape une liste de films, et renvoie les reviews au fur et à mesure
+
+"""
+
+
+class AdaptiveThrottle(HostThrottle) :
+    """Délai de politesse par hôte qui recule quand le serveur sature et accélère quand il répond vite
+
+Parameters
+----------
+delay : float
+    Le délai initial en secondes entre deux requêtes vers un même hôte
+min_delay : float
+    Le délai minimal
+max_delay : float
+    Le délai maximal
+target_latency : float
+    La latence (en secondes) en dessous de laquelle on considère que le serveur n'est pas chargé
+"""
+
+    def __init__(self, delay: float = 0.5, min_delay: float = 0.05, max_delay: float = 30.0, target_latency: float = 0.5) :
+        super().__init__(delay)
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.target_latency = target_latency
+        self._delays = {}
+
+    def delay_for(self, host: str) -> float :
+        return self._delays.get(host, self.delay)
+
+    def record(self, url: str, status: int, latency: float, retry_after: str = None) :
+        """Met à jour le délai de l'hôte d'après la réponse reçue
+
+    Parameters
+    ----------
+    url : str
+        L'url qui a été demandée
+    status : int
+        Le code HTTP de la réponse
+    latency : float
+        Le temps de réponse en secondes
+    retry_after : str
+        La valeur de l'en-tête Retry-After, si le serveur en a envoyé un
+    """
+        host = urlparse(url).netloc
+
+        with self._lock :
+            delay = self._delays.get(host, self.delay)
+
+            if status == 429 or status >= 500 :
+                # le serveur sature : on double le délai, et on respecte Retry-After s'il est donné en secondes
+                delay = max(delay * 2, self.min_delay)
+                if retry_after is not None and retry_after.isdigit() :
+                    self._next_slot[host] = max(self._next_slot.get(host, 0.0), time.monotonic() + int(retry_after))
+            elif latency < self.target_latency :
+                delay *= 0.9
+            else :
+                delay *= 1.1
+
+            self._delays[host] = min(self.max_delay, max(self.min_delay, delay))
+
+
+def page_number(url: str) -> int :
+    """Retourne le numéro de page d'une url de critiques (1 pour la page cible, qui n'a pas de paramètre page)"""
+
+    page = parse_qs(urlparse(url).query).get("page")
+
+    if page and page[0].isdigit() :
+        return int(page[0])
+
+    return 1
+
+
+class FilmCrawl :
+    """L'état du crawl d'un film : sa frontière à priorité, le nombre de pages téléchargées et celui des pages en échec
+
+Parameters
+----------
+target_url : str
+    L'url de la première page de critiques du film
+max_crawl : int
+    Le nombre maximum de pages à télécharger pour ce film
+"""
+
+    def __init__(self, target_url: str, max_crawl: int) :
+        self.target_url = target_url
+        self.max_crawl = max_crawl
+        self.frontier = [(1, target_url)]
+        self.fetched = 0
+        self.failed = 0
+        self.in_flight = 0
+
+    def push(self, url: str) :
+        heapq.heappush(self.frontier, (page_number(url), url))
+
+    def pop(self) -> str :
+        return heapq.heappop(self.frontier)[1]
+
+    def can_dispatch(self) -> bool :
+        return bool(self.frontier) and self.fetched + self.in_flight < self.max_crawl
+
+    def finished(self) -> bool :
+        return self.in_flight == 0 and not self.can_dispatch()
+
+
+def read_targets(path: str) -> list :
+    """Lit un fichier contenant une url cible par ligne (les lignes vides et celles commençant par # sont ignorées)
+
+Parameters
+----------
+path : str
+    Le chemin du fichier
+
+Returns
+-------
+targets : list
+    Les urls cibles, sans doublons, dans l'ordre du fichier
+"""
+    with open(path, encoding="utf-8") as f :
+        targets = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+    return list(dict.fromkeys(targets))
+
+
+def _url_key(url: str) -> bytes :
+    """Empreinte de 8 octets d'une url, pour garder en mémoire des millions d'urls vues à moindre coût"""
+
+    return hashlib.blake2b(url.encode("utf-8"), digest_size=8).digest()
+
+
+def crawl_catalogue(targets: list, max_crawl: int = 20, workers: int = 4, throttle: AdaptiveThrottle = None,
+                    session=None, cache: HttpCache = None, max_retries: int = 3, on_film_done=None, parser: str = "bs4") :
+    """Crawl et scrape une liste de films en une seule passe, en parallèle
+
+Parameters
+----------
+targets : list
+    Les urls des premières pages de critiques des films
+max_crawl : int
+    Le nombre maximum de pages téléchargées par film (par défaut 20)
+workers : int
+    Le nombre de pages téléchargées en parallèle
+throttle : AdaptiveThrottle
+    Le délai de politesse adaptatif (si None, on en créé un)
+session : Session
+    Une session HTTP à réutiliser (si None, on en créé une)
+cache : HttpCache
+    Le cache HTTP sur disque (optionnel)
+max_retries : int
+    Le nombre de fois qu'une page est redemandée après une réponse 429 ou 5xx, ou une erreur réseau
+on_film_done : callable
+    Fonction appelée avec l'url cible de chaque film terminé sans page en échec (optionnelle) : un film dont une page a été
+    abandonnée ou a renvoyé une erreur n'est pas signalé, pour être recrawlé au prochain lancement
+parser : str
+    Le backend d'extraction (voir le module extractors)
+
+Yields
+------
+review : tuple
+    Un triplet (url cible du film, review, note)
+"""
+    if session is None :
+        session = make_session(workers)
+    if throttle is None :
+        throttle = AdaptiveThrottle()
+    extract = get_extractor(parser)
+
+    # les films en attente sont créés au fur et à mesure, pour ne pas garder des milliers de frontières en mémoire d'un coup
+    waiting = deque(targets)
+    active = deque()
+    visited = set()
+    retries = {}
+    in_flight = deque()
+
+    def timed_fetch(url) :
+        # fetch mesure la requête seule : l'attente du délai de politesse ne doit pas compter dans la latence du serveur
+        response = fetch(url, session, throttle, cache)
+        throttle.record(url, response.status_code, response.latency, response.headers.get("Retry-After"))
+        return response
+
+    def next_film() :
+        # on sert les films actifs à tour de rôle, et on en active un nouveau quand aucun n'a de page à proposer
+        for _ in range(len(active)) :
+            film = active[0]
+            active.rotate(-1)
+            if film.can_dispatch() :
+                return film
+        while waiting :
+            target = waiting.popleft()
+            if _url_key(target) in visited :
+                continue
+            visited.add(_url_key(target))
+            film = FilmCrawl(target, max_crawl)
+            active.append(film)
+            return film
+        return None
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool :
+        while True :
+            while len(in_flight) < workers :
+                film = next_film()
+                if film is None :
+                    break
+                url = film.pop()
+                film.in_flight += 1
+                in_flight.append((film, url, pool.submit(timed_fetch, url)))
+
+            if not in_flight :
+                break
+
+            # on traite les pages dans l'ordre où elles ont été demandées, ce qui rend l'ordre des reviews déterministe
+            film, url, future = in_flight.popleft()
+            try :
+                response = future.result()
+            except requests.RequestException as error :
+                # erreur réseau (connexion coupée, timeout...) : traitée comme une réponse 5xx, on recule sur l'hôte
+                print("Erreur réseau sur", url, ":", error)
+                throttle.record(url, 503, 0.0)
+                response = None
+            film.in_flight -= 1
+
+            if response is None or response.status_code == 429 or response.status_code >= 500 :
+                # le serveur sature : la page est remise dans la frontière, le délai de l'hôte a déjà été augmenté
+                retries[url] = retries.get(url, 0) + 1
+                if retries[url] <= max_retries :
+                    film.push(url)
+                else :
+                    film.failed += 1
+                    print("Abandon de", url, "après", max_retries, "essais")
+            elif response.ok :
+                retries.pop(url, None)
+                film.fetched += 1
+                links, reviews = extract(response.content, film.target_url)
+
+                for link in links :
+                    key = _url_key(link)
+                    if key not in visited :
+                        visited.add(key)
+                        film.push(link)
+
+                for review, note in reviews :
+                    yield film.target_url, review, note
+            else :
+                film.failed += 1
+                print("Page ignorée", url, ":", response.status_code)
+
+            if film.finished() :
+                active.remove(film)
+                if film.failed :
+                    print("Film incomplet", film.target_url, ":", film.failed, "page(s) en échec, il sera recrawlé au prochain lancement")
+                elif on_film_done is not None :
+                    on_film_done(film.target_url)
+
+
+if __name__ == "__main__" :
+    my_parser = argparse.ArgumentParser()
+    my_parser.add_argument("targets", help="Le fichier contenant les urls des pages de critiques à crawler, une par ligne.")
+    my_parser.add_argument("--max-crawl", help="Le nombre maximum de pages téléchargées par film, par défaut 20.", type=int, default=20)
+    my_parser.add_argument("--workers", help="Le nombre de pages téléchargées en parallèle, par défaut 4.", type=int, default=4)
+    my_parser.add_argument("--delay", help="Le délai initial (en secondes) entre deux requêtes vers un même hôte, par défaut 0.5.", type=float, default=0.5)
+    my_parser.add_argument("--min-delay", help="Le délai minimal entre deux requêtes vers un même hôte, par défaut 0.05.", type=float, default=0.05)
+    my_parser.add_argument("--state-dir", help="Dossier du cache HTTP (requêtes conditionnelles), optionnel.", default=None)
+    my_parser.add_argument("--output", help="Le fichier csv de sortie, par défaut ../../data.csv.", default="../../data.csv")
+    my_parser.add_argument("--parser", help="Le backend d'extraction html, par défaut bs4.", choices=available_extractors(), default="bs4")
+    my_args = my_parser.parse_args()
+
+    with instrument.stage("crawl_catalogue") :
+        if corpus_format(my_args.output) != "csv" :
+            my_parser.error("les reviews sont ajoutées à un fichier existant : la sortie doit être un csv")
+
+        targets = read_targets(my_args.targets)
+
+        # les films déjà terminés lors d'un précédent lancement sont notés à côté du csv de sortie
+        done_path = my_args.output + ".done"
+        done = set(read_targets(done_path)) if os.path.exists(done_path) else set()
+        targets = [target for target in targets if target not in done]
+        print(len(targets), "films à crawler,", len(done), "déjà terminés")
+
+        cache = None
+        if my_args.state_dir is not None :
+            os.makedirs(my_args.state_dir, exist_ok=True)
+            cache = HttpCache(os.path.join(my_args.state_dir, "http_cache.sqlite"))
+
+        throttle = AdaptiveThrottle(my_args.delay, min_delay=my_args.min_delay)
+
+        with ReviewSink(my_args.output) as sink, open(done_path, "a", encoding="utf-8") as done_file :
+
+            def film_done(target) :
+                done_file.write(target + "\n")
+                done_file.flush()
+
+            reviews = crawl_catalogue(targets, my_args.max_crawl, my_args.workers, throttle, cache=cache, on_film_done=film_done, parser=my_args.parser)
+            for _, review, note in reviews :
+                sink.add(review, note)
+
+        if cache is not None :
+            cache.close()
+
+        print(sink.added, "nouvelles reviews ajoutées à", my_args.output)
@@ -0,0 +1,203 @@
+import csv
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import zlib
+
+"""État persistant du crawl
+
+Ce module contient ce qui permet de reprendre un crawl interrompu et de ne re-télécharger que ce qui a changé :
+un cache HTTP sur disque avec requêtes conditionnelles (ETag / Last-Modified), un point de reprise de la frontière
+(pages à visiter et pages déjà vues) et un fichier csv de reviews en ajout seul, dédoublonné par empreinte du contenu.
+
+Ce module utilise les bibliothèques csv, hashlib, json, os, sqlite3, threading et zlib.
+
+Ce module comporte ces classes et fonctions :
+
+    * HttpCache - cache des réponses HTTP dans une base sqlite
+    * Checkpoint - sauvegarde et recharge la frontière du crawl
+    * ReviewSink - ajoute les reviews à un fichier csv sans doublons
+    * review_hash - retourne l'empreinte d'un couple (review, note)
+
+"""
+
+
+def review_hash(review: str, note: str) -> str :
+    """Calcule l'empreinte d'un couple (review, note)
+
+    Parameters
+    ----------
+    review : str
+        Le texte de la review
+    note : str
+        La note associée
+
+    Returns
+    -------
+    hash : str
+        L'empreinte sha1 en hexadécimal
+    """
+
+    return hashlib.sha1(f"{review}\x1f{note}".encode("utf-8")).hexdigest()
+
+
+class HttpCache :
+    """Cache des réponses HTTP dans une base sqlite, utilisable depuis plusieurs threads
+
+    Pour chaque url on garde le corps de la réponse (compressé) et ses en-têtes ETag et Last-Modified,
+    qu'on renvoie au serveur lors de la requête suivante pour qu'il réponde 304 si la page n'a pas changé.
+
+    Parameters
+    ----------
+    path : str
+        Le chemin du fichier sqlite
+    """
+
+    def __init__(self, path: str) :
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses (url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, body BLOB)"
+        )
+        self._db.commit()
+
+    def get(self, url: str) :
+        """Retourne (etag, last_modified, body) pour une url, ou None si elle n'est pas dans le cache"""
+
+        with self._lock :
+            row = self._db.execute(
+                "SELECT etag, last_modified, body FROM responses WHERE url = ?", (url,)
+            ).fetchone()
+
+        if row is None :
+            return None
+
+        etag, last_modified, body = row
+        return etag, last_modified, zlib.decompress(body)
+
+    def put(self, url: str, etag: str, last_modified: str, body: bytes) :
+        """Enregistre la réponse d'une url (on ne garde que les réponses qui peuvent être revalidées)"""
+
+        if etag is None and last_modified is None :
+            return
+
+        with self._lock :
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                (url, etag, last_modified, zlib.compress(body)),
+            )
+            self._db.commit()
+
+    def conditional_headers(self, url: str) -> dict :
+        """Retourne les en-têtes If-None-Match / If-Modified-Since à envoyer pour une url"""
+
+        cached = self.get(url)
+        if cached is None :
+            return {}
+
+        etag, last_modified, _ = cached
+        headers = {}
+        if etag :
+            headers["If-None-Match"] = etag
+        if last_modified :
+            headers["If-Modified-Since"] = last_modified
+
+        return headers
+
+    def close(self) :
+        with self._lock :
+            self._db.close()
+
+
+class Checkpoint :
+    """Sauvegarde la frontière d'un crawl dans un fichier json pour pouvoir le reprendre après une interruption
+
+    Parameters
+    ----------
+    path : str
+        Le chemin du fichier json
+    """
+
+    def __init__(self, path: str) :
+        self.path = path
+
+    def exists(self) -> bool :
+        return os.path.exists(self.path)
+
+    def load(self) :
+        """Retourne (pending, seen, fetched) : les pages restant à visiter, les pages déjà découvertes et le nombre de pages traitées"""
+
+        with open(self.path, encoding="utf-8") as f :
+            state = json.load(f)
+
+        return state["pending"], set(state["seen"]), state["fetched"]
+
+    def save(self, pending: list, seen: set, fetched: int) :
+        """Ecrit l'état du crawl de manière atomique (fichier temporaire puis renommage)"""
+
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f :
+            json.dump({"pending": list(pending), "seen": sorted(seen), "fetched": fetched}, f)
+        os.replace(tmp_path, self.path)
+
+    def clear(self) :
+        """Supprime le point de reprise une fois le crawl terminé"""
+
+        if self.exists() :
+            os.remove(self.path)
+
+
+class ReviewSink :
+    """Ajoute des reviews à un fichier csv (colonnes reviews, notes) en ignorant celles qui y sont déjà
+
+    Les empreintes des lignes existantes sont chargées à l'ouverture, puis chaque nouvelle review est écrite
+    immédiatement : rien n'est perdu si le crawl s'arrête en cours de route.
+
+    Parameters
+    ----------
+    path : str
+        Le chemin du fichier csv (créé s'il n'existe pas)
+    """
+
+    def __init__(self, path: str) :
+        self.path = path
+        self.hashes = set()
+        self.added = 0
+
+        exists = os.path.exists(path) and os.path.getsize(path) > 0
+        if exists :
+            with open(path, newline="", encoding="utf-8") as f :
+                reader = csv.reader(f)
+                next(reader, None)
+                for row in reader :
+                    self.hashes.add(review_hash(*row))
+
+        self._file = open(path, "a", newline="", encoding="utf-8")
+        self._writer = csv.writer(self._file)
+        if not exists :
+            self._writer.writerow(["reviews", "notes"])
+
+    def add(self, review: str, note: str) -> bool :
+        """Ajoute une review si elle est nouvelle, et retourne True dans ce cas"""
+
+        key = review_hash(review, note)
+        if key in self.hashes :
+            return False
+
+        self.hashes.add(key)
+        self._writer.writerow([review, note])
+        self._file.flush()
+        self.added += 1
+
+        return True
+
+    def close(self) :
+        self._file.close()
+
+    def __enter__(self) :
+        return self
+
+    def __exit__(self, *exc) :
+        self.close()
@@ -1,21 +1,56 @@
 from bs4 import BeautifulSoup
 import requests
+from requests.adapters import HTTPAdapter
 import argparse
 import pandas as pd
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+import hashlib
+import os
+from crawl_state import HttpCache, Checkpoint, ReviewSink
+from extractors import extract_links, extract_reviews, get_extractor, available_extractors
+from corpus_io import corpus_format, write_corpus, write_rows
+import instrument
 
 """Crawler et scraper
 
 Ce script crawl à partir d'une URL donnée en argument du script.
 Il crawle par défaut jusqu'à une profondeur de 20, mais il est possible d'indiquer une autre valeur en second argument.
 Ce script est adapté pour crawler des pages de reviews sur Allociné.
-Ce script créé un fichier csv contenant les données scrapées.
+Ce script créé un fichier csv (ou parquet / arrow selon l'extension, voir le module corpus_io) contenant les données scrapées.
 
-Ce script utilise les bibliothèques BeautifulSoup, requests, argparse et pandas.
+Les pages peuvent être téléchargées en parallèle (option --workers) grâce à un pool de threads qui partagent une même session HTTP
+(connexions réutilisées, keep-alive), avec un délai de politesse minimal entre deux requêtes vers un même hôte (option --delay).
+Le résultat reste identique et dans le même ordre qu'en mode séquentiel. Avec --two-pass, seul le scraping est parallèle :
+le crawl de l'ancien fonctionnement suit les liens page après page (le mode par défaut, crawl_scrape, télécharge les pages en parallèle).
 
-Ce script comporte ces deux fonctions : 
+Par défaut, le crawl et le scraping se font en une seule passe (crawl_scrape) : chaque page n'est téléchargée qu'une fois,
+on y récupère à la fois les liens vers les pages suivantes et les reviews, et les reviews sont écrites dans le fichier de sortie au fur et à mesure.
+L'option --two-pass permet de retrouver l'ancien fonctionnement (crawler puis scraper).
 
+Avec l'option --state-dir, le crawl devient reprenable et incrémental : les réponses sont gardées dans un cache HTTP sur disque
+(requêtes conditionnelles ETag / Last-Modified), la frontière est sauvegardée après chaque page, et les reviews sont ajoutées
+au csv existant sans doublons (la sortie doit alors être un csv). Relancer le script reprend un crawl interrompu, ou ne récupère que les nouvelles reviews.
+
+L'extraction des liens et des reviews se trouve dans le module extractors, qui propose plusieurs backends (option --parser) :
+bs4 (par défaut), bs4-strained, lxml et selectolax, qui donnent tous le même résultat.
+
+Ce script utilise les bibliothèques BeautifulSoup, requests, argparse, pandas, threading et concurrent.futures,
+ainsi que les modules crawl_state, extractors, corpus_io et instrument.
+
+Ce script comporte ces fonctions et classes : 
+
+    * make_session - retourne une session HTTP avec un pool de connexions
+    * HostThrottle - impose un délai minimal entre deux requêtes vers un même hôte
+    * fetch - télécharge une page avec la session partagée en respectant le délai de politesse
+    * fetch_ordered - télécharge une suite de pages en parallèle et les renvoie dans l'ordre des urls
     * crawler - retourne la liste des URLs récupérées
     * scraper - retourne un DataFrame comportant deux colonnes : celle des reviews et celle des notes
+    * crawl_scrape - crawl et scrape en une seule passe, et renvoie les reviews au fur et à mesure
+    * checkpoint_path - retourne le chemin du point de reprise d'un film
 
 """
 
@@ -24,15 +59,166 @@ Ce script comporte ces deux fonctions :
 # "https://www.allocine.fr/film/fichefilm-227463/critiques/spectateurs/"
 
 
-def crawler(target_url: str, max_crawl: int) -> list :
+def make_session(pool_size: int = 10) -> requests.Session :
+    """Créé une session HTTP dont les connexions sont gardées ouvertes et réutilisées
+
+Parameters
+----------
+pool_size : int
+    Le nombre maximum de connexions gardées ouvertes par hôte (à aligner sur le nombre de workers)
+
+Returns
+-------
+session : Session
+    La session requests à partager entre les workers
+"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    return session
+
+
+class HostThrottle :
+    """Impose un délai minimal entre deux requêtes envoyées à un même hôte, quel que soit le thread qui les envoie
+
+Parameters
+----------
+delay : float
+    Le délai minimal en secondes entre deux requêtes vers un même hôte (0 pour désactiver)
+"""
+
+    def __init__(self, delay: float = 0.0) :
+        self.delay = delay
+        self._lock = threading.Lock()
+        self._next_slot = {}
+
+    def delay_for(self, host: str) -> float :
+        """Retourne le délai à respecter pour un hôte (le même pour tous ici, les sous-classes peuvent l'adapter)"""
+
+        return self.delay
+
+    def wait(self, url: str) :
+        """Bloque le thread appelant jusqu'à ce qu'il puisse envoyer une requête vers l'hôte de l'url"""
+
+        host = urlparse(url).netloc
+
+        # on réserve le prochain créneau libre pour cet hôte sous le verrou, puis on attend en dehors du verrou
+        with self._lock :
+            delay = self.delay_for(host)
+            now = time.monotonic()
+            next_slot = self._next_slot.get(host, now)
+            if delay <= 0 and next_slot <= now :
+                return
+            slot = max(now, next_slot)
+            self._next_slot[host] = slot + delay
+
+        time.sleep(max(0.0, slot - now))
+
+
+def fetch(url: str, session: requests.Session = None, throttle: HostThrottle = None, cache: HttpCache = None) -> requests.Response :
+    """Télécharge une page en réutilisant la session partagée et en respectant le délai de politesse
+
+Parameters
+----------
+url : str
+    L'url de la page à télécharger
+session : Session
+    La session partagée (si None, on utilise requests.get comme avant)
+throttle : HostThrottle
+    Le limiteur de débit par hôte (optionnel)
+cache : HttpCache
+    Le cache HTTP sur disque (optionnel) : si la page y est, on envoie une requête conditionnelle
+    et on reprend le contenu du cache quand le serveur répond 304
+
+Returns
+-------
+response : Response
+    La réponse HTTP (response.from_cache vaut True si le contenu vient du cache, et response.latency
+    est la durée de la requête seule en secondes, sans l'attente du délai de politesse)
+"""
+    if throttle is not None :
+        throttle.wait(url)
+
+    headers = cache.conditional_headers(url) if cache is not None else {}
+
+    # la latence mesurée est celle de la requête seule, sans l'attente du délai de politesse
+    start = time.perf_counter()
+    if session is None :
+        response = requests.get(url, headers=headers)
+    else :
+        response = session.get(url, headers=headers)
+    latency = time.perf_counter() - start
+    instrument.observe("http_request_duration_seconds", latency, help="Latence des requêtes HTTP du crawler, en secondes")
+    instrument.inc("http_requests_total", help="Requêtes HTTP du crawler, par code de réponse", status=response.status_code)
+    instrument.inc("http_response_bytes_total", len(response.content), help="Octets téléchargés par le crawler (corps des réponses)")
+
+    response.from_cache = False
+    response.latency = latency
+
+    if cache is not None :
+        if response.status_code == 304 :
+            # la page n'a pas changé : on reprend le contenu enregistré
+            response._content = cache.get(url)[2]
+            response.status_code = 200
+            response.from_cache = True
+        elif response.ok :
+            cache.put(url, response.headers.get("ETag"), response.headers.get("Last-Modified"), response.content)
+
+    return response
+
+
+def fetch_ordered(urls, session: requests.Session = None, throttle: HostThrottle = None, workers: int = 1) :
+    """Télécharge une suite de pages avec au plus `workers` requêtes en cours, et les renvoie dans l'ordre des urls
+
+Parameters
+----------
+urls : iterable
+    Les urls à télécharger
+session : Session
+    La session partagée entre les workers
+throttle : HostThrottle
+    Le limiteur de débit par hôte (optionnel)
+workers : int
+    Le nombre maximum de requêtes simultanées
+
+Yields
+------
+response : Response
+    Les réponses, dans le même ordre que les urls (quel que soit l'ordre d'arrivée)
+"""
+    if workers <= 1 :
+        for url in urls :
+            yield fetch(url, session, throttle)
+        return
+
+    # fenêtre glissante : on garde au plus `workers` téléchargements en cours et on rend toujours le plus ancien
+    with ThreadPoolExecutor(max_workers=workers) as pool :
+        in_flight = deque()
+        for url in urls :
+            in_flight.append(pool.submit(fetch, url, session, throttle))
+            if len(in_flight) >= workers :
+                yield in_flight.popleft().result()
+        while in_flight :
+            yield in_flight.popleft().result()
+
+
+def crawler(target_url: str, max_crawl: int, delay: float = 0.0, session: requests.Session = None) -> list :
     """Crawl un site web à partir d'une URL donnée, et jusqu'à une certaine profondeur donnée
 
+Le parcours est séquentiel (chaque page donne les liens de la suivante) : pour télécharger en parallèle, utiliser crawl_scrape.
+
 Parameters
 ----------
 target_url : str
     L'url cible à partir de laquelle crawler
 max_crawl: int
     La profondeur max jusqu'à laquelle crawl (par défaut 20)
+delay : float
+    Le délai minimal en secondes entre deux requêtes vers un même hôte
+session : Session
+    Une session HTTP à réutiliser (si None, on en créé une)
 
 Returns
 -------
@@ -40,10 +226,17 @@ urls_to_visit : list
     La liste des urls qui ont été crawlées
 """
  
+    if session is None :
+        session = make_session()
+    throttle = HostThrottle(delay)
+
     # la liste contenant les urls à visiter, commençant par l'url cible
 
     urls_to_visit = [target_url]
 
+    # ensemble qui reflète le contenu de la liste, pour tester la présence d'une url sans parcourir la liste
+    queued = {target_url}
+
     # compteur de crawls
     crawl_count = 0
 
@@ -51,38 +244,27 @@ urls_to_visit : list
 
         # on récupère l'url à visiter de la liste
         current_url = urls_to_visit.pop()
+        queued.discard(current_url)
 
         # on envoie une requête pour accéder au contenu de la page
-        response = requests.get(current_url)
+        response = fetch(current_url, session, throttle)
         response.raise_for_status()
-        
+
         # on parse le code html du site
-        
+
         soup = BeautifulSoup(response.text, "html.parser")
 
-        # on récupère tous les liens présents sur lapage
-        link_elements = soup.select("a[href]")
-        for link_element in link_elements:
-            url = link_element["href"]
-
-            # si besoin on convertit les url en url absolue
-            if not url.startswith("http"):
-                absolute_url = requests.compat.urljoin(target_url, url)
-            else:
-                absolute_url = url
-
-            # on fait en sorte que l'url commence bien par l'url cible, qu'elle n'est pas déjà présente dans la liste et qu'elle contienne "?page="
-            #cette dernière condition est spécifique à mes besoins afin de ne récupérer que les pages contenant des reviews 
-            if (
-                absolute_url.startswith(target_url)
-                and absolute_url not in urls_to_visit
-                and "?page=" in absolute_url 
-            ):
+        # on récupère les liens vers les pages de reviews présents sur la page (urls absolues, voir le module extractors)
+        for absolute_url in extract_links(soup, target_url):
+
+            # on fait en sorte que l'url ne soit pas déjà présente dans la liste
+            if absolute_url not in queued :
                 urls_to_visit.append(absolute_url)
+                queued.add(absolute_url)
 
             # on incrémente le compteur
             crawl_count += 1
-    
+
     #on rajoute l'url cible de base qui a été retirée de la liste car ne comportant pas "?page=", car c'est la première page et on en a besoin
     urls_to_visit.append(target_url)    
 
@@ -92,19 +274,32 @@ urls_to_visit : list
     return urls_to_visit
 
 
-def scraper(urls: list) -> pd.DataFrame :
+def scraper(urls: list, workers: int = 1, delay: float = 0.0, session: requests.Session = None, parser: str = "bs4") -> pd.DataFrame :
     """Scrape le contenu d'une liste de sites webs précédemment crawlés
 
 Parameters
 ----------
 urls : list
     Une liste contenant des URL à scraper
+workers : int
+    Le nombre de pages téléchargées en parallèle (par défaut 1, c'est-à-dire séquentiel)
+delay : float
+    Le délai minimal en secondes entre deux requêtes vers un même hôte
+session : Session
+    Une session HTTP à réutiliser (si None, on en créé une)
+parser : str
+    Le backend d'extraction (voir le module extractors)
 
 Returns
 -------
 data: DataFrame
     Les données scrapées sous forme de dataframe pandas.
 """
+    if session is None :
+        session = make_session(workers)
+    throttle = HostThrottle(delay)
+    extract = get_extractor(parser)
+
     # On initialise le dictionnaire qui va contenir les données, une colonne reviews contenant le texte des reviews et une colonne notes contenant les notes associées
     data = {
         'reviews': [],
@@ -112,19 +307,12 @@ data: DataFrame
     }
 
     # On itère sur les urls, pour chaque url on parse le code html pour récupérer les reviews sur la page
-    for url in urls :
-        response = requests.get(url)
-        soup = BeautifulSoup(response.content, "html.parser")
-        reviews = soup.find_all("div", class_="review-card-review-holder")
-
-        # On itère sur chaque review de la page et on y récupère le texte de la review ainsi que la note donnée par l'utilisateur
-        for review in reviews :
-            text_review = review.find("div", class_="content-txt review-card-content").text.strip()
-            note_review = review.find("div", class_="review-card-meta")\
-                .find("div", class_="stareval stareval-medium stareval-theme-default")\
-                .find("span", class_="stareval-note").text
-
-            # On ajoute ce qu'on a trouvé au dictionnaire
+    # (les pages sont téléchargées en parallèle mais rendues dans l'ordre des urls : l'ordre des lignes est le même qu'en séquentiel)
+    for url, response in zip(urls, fetch_ordered(urls, session, throttle, workers)) :
+        _, reviews = extract(response.content, url)
+
+        # On ajoute ce qu'on a trouvé au dictionnaire
+        for text_review, note_review in reviews :
             data['reviews'].append(text_review)
             data['notes'].append(note_review)
 
@@ -136,15 +324,145 @@ data: DataFrame
                             
            
 
+def crawl_scrape(target_url: str, max_crawl: int = 20, workers: int = 1, delay: float = 0.0, session: requests.Session = None,
+                 cache: HttpCache = None, checkpoint: Checkpoint = None, parser: str = "bs4") :
+    """Crawl et scrape en une seule passe : chaque page n'est téléchargée et parsée qu'une seule fois
+
+Les liens vers les pages suivantes et les reviews sont extraits de la même réponse.
+C'est un générateur : les reviews sont renvoyées dès que leur page est arrivée, et le html n'est pas gardé en mémoire.
+
+Parameters
+----------
+target_url : str
+    L'url cible à partir de laquelle crawler
+max_crawl : int
+    Le nombre maximum de pages à télécharger (par défaut 20)
+workers : int
+    Le nombre de pages téléchargées en parallèle (par défaut 1, c'est-à-dire séquentiel)
+delay : float
+    Le délai minimal en secondes entre deux requêtes vers un même hôte
+session : Session
+    Une session HTTP à réutiliser (si None, on en créé une)
+cache : HttpCache
+    Le cache HTTP sur disque (optionnel)
+checkpoint : Checkpoint
+    Le point de reprise (optionnel) : s'il existe on reprend le crawl là où il s'était arrêté, il est mis à jour
+    après chaque page traitée et supprimé à la fin du crawl
+parser : str
+    Le backend d'extraction (voir le module extractors)
+
+Yields
+------
+review : tuple
+    Un couple (review, note)
+"""
+    if session is None :
+        session = make_session(workers)
+    throttle = HostThrottle(delay)
+
+    # file d'attente des pages à visiter (dans l'ordre de découverte) et ensemble des pages déjà vues
+    extract = get_extractor(parser)
+
+    if checkpoint is not None and checkpoint.exists() :
+        pending, seen, fetched = checkpoint.load()
+        frontier = deque(pending)
+    else :
+        frontier = deque([target_url])
+        seen = {target_url}
+        fetched = 0
+
+    in_flight = deque()
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool :
+        while frontier or in_flight :
+
+            # on garde au plus `workers` téléchargements en cours, dans la limite du nombre de pages autorisé
+            while frontier and len(in_flight) < workers and fetched + len(in_flight) < max_crawl :
+                url = frontier.popleft()
+                in_flight.append((url, pool.submit(fetch, url, session, throttle, cache)))
+
+            if not in_flight :
+                break
+
+            # on traite les pages dans l'ordre où elles ont été demandées, ce qui rend l'ordre des reviews déterministe
+            _, future = in_flight.popleft()
+            response = future.result()
+            response.raise_for_status()
+            links, reviews = extract(response.content, target_url)
+
+            for link in links :
+                if link not in seen :
+                    seen.add(link)
+                    frontier.append(link)
+
+            yield from reviews
+            fetched += 1
+
+            # les reviews de la page ont été consommées : on peut enregistrer que la page est traitée
+            # (les pages encore en cours de téléchargement restent à visiter en cas de reprise)
+            if checkpoint is not None :
+                checkpoint.save([url for url, _ in in_flight] + list(frontier), seen, fetched)
+
+    if checkpoint is not None :
+        checkpoint.clear()
+
+
+def checkpoint_path(state_dir: str, target_url: str) -> str :
+    """Retourne le chemin du point de reprise associé à une url cible
+
+Parameters
+----------
+state_dir : str
+    Le dossier contenant l'état du crawl
+target_url : str
+    L'url cible du crawl
+
+Returns
+-------
+path : str
+    Le chemin du fichier json
+"""
+    key = hashlib.sha1(target_url.encode("utf-8")).hexdigest()[:16]
+
+    return os.path.join(state_dir, f"checkpoint-{key}.json")
+
+
 if __name__ == "__main__" :
     my_parser = argparse.ArgumentParser()
     my_parser.add_argument("target", help="L'url à partir de laquelle on souhaite commencer le crawling.")
-    my_parser.add_argument("max_crawl", help="Le nombre maximum de crawls à effectuer, par défaut 20.", nargs="?", default=20)
+    my_parser.add_argument("max_crawl", help="Le nombre maximum de crawls à effectuer, par défaut 20.", nargs="?", type=int, default=20)
+    my_parser.add_argument("--workers", help="Le nombre de pages téléchargées en parallèle, par défaut 1.", type=int, default=1)
+    my_parser.add_argument("--delay", help="Le délai minimal (en secondes) entre deux requêtes vers un même hôte, par défaut 0.", type=float, default=0.0)
+    my_parser.add_argument("--two-pass", help="Crawler puis scraper séparément (ancien fonctionnement, chaque page est téléchargée deux fois).", action="store_true")
+    my_parser.add_argument("--state-dir", help="Dossier du cache HTTP et du point de reprise : rend le crawl reprenable et incrémental.", default=None)
+    my_parser.add_argument("--output", help="Le fichier de sortie (csv, parquet ou arrow), par défaut ../../data.csv.", default="../../data.csv")
+    my_parser.add_argument("--parser", help="Le backend d'extraction html, par défaut bs4.", choices=available_extractors(), default="bs4")
     my_args = my_parser.parse_args()
 
-    urls = crawler(my_args.target, my_args.max_crawl)
-    data = scraper(urls)
-
-    data.to_csv('../../data.csv', index=False)  
-
-    
\ No newline at end of file
+    with instrument.stage("crawl") :
+        if my_args.state_dir is not None and corpus_format(my_args.output) != "csv" :
+            my_parser.error("--state-dir ajoute les reviews à un fichier existant : la sortie doit être un csv")
+
+        # une seule session partagée par le crawler et le scraper, pour réutiliser les connexions ouvertes
+        session = make_session(my_args.workers)
+
+        if my_args.two_pass :
+            urls = crawler(my_args.target, my_args.max_crawl, my_args.delay, session)
+            data = scraper(urls, my_args.workers, my_args.delay, session, my_args.parser)
+
+            write_corpus(data, my_args.output)
+        elif my_args.state_dir is None :
+            reviews = crawl_scrape(my_args.target, my_args.max_crawl, my_args.workers, my_args.delay, session, parser=my_args.parser)
+            print(write_rows(reviews, my_args.output), "reviews récupérées")
+        else :
+            os.makedirs(my_args.state_dir, exist_ok=True)
+            cache = HttpCache(os.path.join(my_args.state_dir, "http_cache.sqlite"))
+            checkpoint = Checkpoint(checkpoint_path(my_args.state_dir, my_args.target))
+
+            # les reviews sont ajoutées au csv existant au fur et à mesure, celles déjà présentes sont ignorées
+            with ReviewSink(my_args.output) as sink :
+                for review, note in crawl_scrape(my_args.target, my_args.max_crawl, my_args.workers, my_args.delay, session, cache, checkpoint, my_args.parser) :
+                    sink.add(review, note)
+
+            cache.close()
+            print(sink.added, "nouvelles reviews ajoutées à", my_args.output)
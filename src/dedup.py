@@ -0,0 +1,318 @@
+import argparse
+import hashlib
+import json
+import re
+import zlib
+from multiprocessing import get_context
+import numpy as np
+import pandas as pd
+from corpus_io import read_corpus, write_corpus
+import instrument
+
+"""Dédoublonnage du corpus
+
+Ce script retire les doublons d'un fichier du corpus avant l'entraînement :
+
+    * les doublons exacts - reviews identiques une fois mises en minuscules, sans ponctuation ni espaces en trop
+      (Allociné affiche parfois les mêmes reviews sur plusieurs pages), trouvés avec une empreinte de chaque texte
+    * les quasi-doublons - reviews dont les ensembles de n-grammes de mots (shingles) se ressemblent à plus de --threshold
+      (similarité de Jaccard), trouvés avec MinHash et LSH
+
+MinHash résume chaque review par --num-perm valeurs minimales de fonctions de hachage : la proportion de valeurs égales entre
+deux résumés estime leur similarité de Jaccard. LSH découpe ces résumés en bandes, et seules les reviews qui ont une bande
+identique sont comparées : le temps de calcul est proportionnel au nombre de reviews, et non à son carré.
+Dans chaque groupe de quasi-doublons, seule la première review (dans l'ordre du fichier) est gardée.
+
+Les fichiers écrits par augment_data.py ont une colonne group, qui relie chaque rétro-traduction à sa review d'origine.
+Une rétro-traduction n'est gardée que si elle diffère assez de sa review d'origine (similarité inférieure à --augment-threshold) :
+une rétro-traduction identique ou presque n'apporte rien à l'entraînement. Pour un fichier plus ancien sans colonne group,
+l'option --augmented-pairs indique que la seconde moitié du fichier est la rétro-traduction de la première (ce qu'écrit augment_data.py).
+La colonne group est gardée dans le fichier de sortie : le découpage en train, validation et test (module tokenized_splits)
+met alors une review et sa rétro-traduction dans le même sous-corpus.
+
+Le nombre de lignes retirées à chaque étape est affiché et écrit dans un rapport json (option --report).
+
+Ce script utilise les bibliothèques argparse, hashlib, json, re, zlib, multiprocessing, numpy et pandas, ainsi que les modules corpus_io et instrument
+
+Ce script comporte ces fonctions et classes :
+
+    * normalize - met une review sous la forme utilisée pour la comparer aux autres
+    * shingles - retourne les empreintes des n-grammes de mots d'une review
+    * MinHasher - calcule les résumés MinHash des reviews
+    * lsh_params - choisit le nombre de bandes et de lignes par bande pour un seuil de similarité
+    * near_duplicates - regroupe les quasi-doublons avec LSH
+    * dedup - retire les doublons exacts et les quasi-doublons d'un corpus
+
+"""
+
+
+GROUP_COLUMN = "group"
+_PUNCTUATION = re.compile(r"[^\w\s]")
+# nombre premier de Mersenne (2**61 - 1) pour les fonctions de hachage universelles de MinHash
+_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+
+def normalize(text: str) -> str :
+    """Met une review en minuscules, sans ponctuation et avec un seul espace entre les mots"""
+
+    return " ".join(_PUNCTUATION.sub(" ", str(text).lower()).split())
+
+
+def shingles(text: str, size: int = 3) -> np.ndarray :
+    """Retourne les empreintes (32 bits) des n-grammes de `size` mots d'une review normalisée
+
+    Une review de moins de `size` mots est un seul n-gramme.
+    """
+
+    words = text.split()
+    grams = {" ".join(words[i:i + size]) for i in range(max(1, len(words) - size + 1))}
+
+    return np.fromiter((zlib.crc32(gram.encode("utf-8")) for gram in grams), dtype=np.uint64, count=len(grams))
+
+
+class MinHasher :
+    """Calcule les résumés MinHash des reviews : num_perm fonctions (a * x + b) mod p, dont on garde le minimum sur les n-grammes
+
+    Parameters
+    ----------
+    num_perm : int
+        Le nombre de fonctions de hachage (la longueur des résumés)
+    shingle_size : int
+        Le nombre de mots par n-gramme
+    seed : int
+        Le seed des fonctions de hachage (deux résumés ne sont comparables que s'ils ont le même)
+    """
+
+    def __init__(self, num_perm: int = 128, shingle_size: int = 3, seed: int = 1) :
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        # a et b restent sous 2**32, comme les empreintes : a * x + b tient dans 64 bits sans dépassement
+        self.a = rng.integers(1, _MAX_HASH, size=num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, _MAX_HASH, size=num_perm, dtype=np.uint64)
+
+    def signature(self, text: str) -> np.ndarray :
+        """Le résumé d'une review normalisée"""
+
+        hashes = shingles(text, self.shingle_size)
+        values = (np.outer(self.a, hashes) + self.b[:, None]) % np.uint64(_PRIME) & np.uint64(_MAX_HASH)
+
+        return values.min(axis=1).astype(np.uint32)
+
+    def signatures(self, texts: list) -> np.ndarray :
+        """Les résumés d'une liste de reviews normalisées, une ligne par review"""
+
+        result = np.empty((len(texts), self.num_perm), dtype=np.uint32)
+        for i, text in enumerate(texts) :
+            result[i] = self.signature(text)
+
+        return result
+
+
+def _signatures_chunk(args) :
+    hasher, texts = args
+    return hasher.signatures(texts)
+
+
+def lsh_params(threshold: float, num_perm: int) -> tuple :
+    """Choisit le nombre de bandes b et de lignes par bande r (b * r = num_perm) pour un seuil de similarité
+
+    Deux reviews de similarité s ont une bande identique avec la probabilité 1 - (1 - s**r)**b, qui passe brusquement
+    de 0 à 1 autour de (1 / b)**(1 / r) : on prend le découpage dont ce point est le plus proche du seuil, un peu en dessous
+    pour rater le moins possible de vrais quasi-doublons (les faux candidats sont de toute façon vérifiés ensuite).
+    """
+
+    candidates = [(num_perm // rows, rows) for rows in range(1, num_perm + 1) if num_perm % rows == 0]
+
+    return min(candidates, key=lambda br : abs((1 / br[0]) ** (1 / br[1]) - (threshold - 0.05)))
+
+
+def _find(parents: np.ndarray, i: int) -> int :
+    # racine d'un élément dans l'union-find, avec compression des chemins
+    root = i
+    while parents[root] != root :
+        root = parents[root]
+    while parents[i] != root :
+        parents[i], i = root, parents[i]
+
+    return root
+
+
+def near_duplicates(signatures: np.ndarray, threshold: float = 0.8, groups: np.ndarray = None, bands: int = None) -> np.ndarray :
+    """Regroupe les quasi-doublons avec LSH
+
+    Dans chaque bande, les reviews qui ont les mêmes valeurs sont comparées, dans l'ordre du fichier, à chacune des reviews déjà
+    retenues comme représentantes de ce panier : si leur similarité estimée (la proportion de valeurs égales dans les résumés)
+    atteint le seuil, elles sont réunies dans le même groupe (union-find) ; une review qui ne ressemble à aucune représentante
+    le devient à son tour. Deux quasi-doublons ne sont donc pas ratés parce que la première review du panier n'y est que par hasard.
+    Deux reviews d'un même groupe d'augmentation (même valeur dans groups) ne sont pas réunies ici : c'est --augment-threshold qui les départage.
+
+    Parameters
+    ----------
+    signatures : np.ndarray
+        Les résumés MinHash, une ligne par review
+    threshold : float
+        La similarité de Jaccard à partir de laquelle deux reviews sont des quasi-doublons
+    groups : np.ndarray
+        Le groupe d'augmentation de chaque review (par défaut, chaque review est seule dans son groupe)
+    bands : int
+        Le nombre de bandes (par défaut, choisi par lsh_params)
+
+    Returns
+    -------
+    roots : np.ndarray
+        Pour chaque review, l'indice de la première review de son groupe de quasi-doublons (elle-même si elle n'en a pas)
+    """
+
+    n, num_perm = signatures.shape
+    if bands is None :
+        bands, rows = lsh_params(threshold, num_perm)
+    else :
+        rows = num_perm // bands
+
+    parents = np.arange(n)
+    multipliers = np.random.default_rng(0).integers(1, 1 << 62, size=rows, dtype=np.uint64) | np.uint64(1)
+
+    for band in range(bands) :
+        # une empreinte de 64 bits par review pour la bande (les collisions accidentelles sont éliminées par la vérification)
+        keys = (signatures[:, band * rows:(band + 1) * rows].astype(np.uint64) * multipliers).sum(axis=1, dtype=np.uint64)
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+        ends = np.r_[starts[1:], n]
+
+        for start, end in zip(starts[ends - starts > 1], ends[ends - starts > 1]) :
+            # le tri est stable : les reviews du panier sont dans l'ordre du fichier
+            representatives = [order[start]]
+            for member in order[start + 1:end] :
+                candidates = np.array(representatives)
+                if groups is not None :
+                    candidates = candidates[groups[candidates] != groups[member]]
+
+                similar = candidates[(signatures[candidates] == signatures[member]).mean(axis=1) >= threshold] if len(candidates) else candidates
+                if len(similar) == 0 :
+                    representatives.append(member)
+                for other in similar :
+                    a, b = _find(parents, other), _find(parents, member)
+                    if a != b :
+                        # la racine est toujours la première review dans l'ordre du fichier, c'est elle qu'on garde
+                        parents[max(a, b)] = min(a, b)
+
+    return np.array([_find(parents, i) for i in range(n)])
+
+
+def dedup(data: pd.DataFrame, threshold: float = 0.8, augment_threshold: float = None, num_perm: int = 128, shingle_size: int = 3,
+          workers: int = 1, chunksize: int = 10_000) -> tuple :
+    """Retire les doublons exacts et les quasi-doublons d'un corpus
+
+    Parameters
+    ----------
+    data : DataFrame
+        Le corpus (colonnes reviews et notes, et éventuellement group, écrite par augment_data.py)
+    threshold : float
+        La similarité de Jaccard (estimée) à partir de laquelle deux reviews sont des quasi-doublons
+    augment_threshold : float
+        La similarité à partir de laquelle une rétro-traduction est retirée car trop proche de sa review d'origine (par défaut, threshold)
+    num_perm : int
+        La longueur des résumés MinHash
+    shingle_size : int
+        Le nombre de mots par n-gramme
+    workers : int
+        Le nombre de processus qui calculent les résumés MinHash
+    chunksize : int
+        Le nombre de reviews envoyées à un processus à la fois
+
+    Returns
+    -------
+    data, report : DataFrame, dict
+        Le corpus sans doublons (dans l'ordre d'origine) et le nombre de lignes retirées à chaque étape
+    """
+
+    if augment_threshold is None :
+        augment_threshold = threshold
+
+    texts = [normalize(text) for text in data["reviews"].fillna("")]
+    groups = data[GROUP_COLUMN].to_numpy() if GROUP_COLUMN in data.columns else None
+
+    # doublons exacts : même texte normalisé, on garde la première occurrence
+    keys = pd.Series([hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest() for text in texts])
+    keep = ~keys.duplicated().to_numpy()
+    exact = int((~keep).sum())
+
+    index = np.flatnonzero(keep)
+    kept_texts = [texts[i] for i in index]
+
+    hasher = MinHasher(num_perm, shingle_size)
+    if workers <= 1 :
+        signatures = hasher.signatures(kept_texts)
+    else :
+        chunks = [(hasher, kept_texts[i:i + chunksize]) for i in range(0, len(kept_texts), chunksize)]
+        with get_context("spawn").Pool(workers) as pool :
+            signatures = np.concatenate(pool.map(_signatures_chunk, chunks)) if chunks else hasher.signatures([])
+
+    # rétro-traductions trop proches de leur review d'origine (la première ligne de leur groupe)
+    augmented = 0
+    kept_groups = groups[index] if groups is not None else None
+    if kept_groups is not None and len(index) > 0 :
+        first_of_group = pd.Series(np.arange(len(index))).groupby(kept_groups).transform("first").to_numpy()
+        is_copy = first_of_group != np.arange(len(index))
+        similarity = (signatures[is_copy] == signatures[first_of_group[is_copy]]).mean(axis=1)
+        too_close = np.flatnonzero(is_copy)[similarity >= augment_threshold]
+        augmented = len(too_close)
+
+        mask = np.ones(len(index), dtype=bool)
+        mask[too_close] = False
+        index, signatures, kept_groups = index[mask], signatures[mask], kept_groups[mask]
+
+    # quasi-doublons entre reviews de groupes différents
+    roots = near_duplicates(signatures, threshold, kept_groups)
+    is_root = roots == np.arange(len(index))
+    near = int((~is_root).sum())
+    index = index[is_root]
+
+    report = {
+        "rows": len(data),
+        "exact_duplicates": exact,
+        "augmentations_too_close": augmented,
+        "near_duplicates": near,
+        "removed": len(data) - len(index),
+        "kept": len(index),
+        "threshold": threshold,
+        "augment_threshold": augment_threshold,
+        "num_perm": num_perm,
+        "shingle_size": shingle_size,
+    }
+
+    return data.iloc[index].reset_index(drop=True), report
+
+
+if __name__ == "__main__" :
+    my_parser = argparse.ArgumentParser()
+    my_parser.add_argument("data", help="Le fichier (csv, parquet ou arrow) contenant le jeu de données")
+    my_parser.add_argument("--output", help="Le fichier de sortie (csv, parquet ou arrow), par défaut ../../data_dedup.csv", default="../../data_dedup.csv")
+    my_parser.add_argument("--threshold", help="La similarité de Jaccard à partir de laquelle deux reviews sont des quasi-doublons, par défaut 0.8", type=float, default=0.8)
+    my_parser.add_argument("--augment-threshold", help="La similarité à partir de laquelle une rétro-traduction est retirée, par défaut --threshold", type=float, default=None)
+    my_parser.add_argument("--augmented-pairs", help="Le fichier n'a pas de colonne group mais la seconde moitié est la rétro-traduction de la première (ancien augment_data.py)", action="store_true")
+    my_parser.add_argument("--num-perm", help="La longueur des résumés MinHash, par défaut 128", type=int, default=128)
+    my_parser.add_argument("--shingle-size", help="Le nombre de mots par n-gramme, par défaut 3", type=int, default=3)
+    my_parser.add_argument("--workers", help="Le nombre de processus qui calculent les résumés MinHash, par défaut 1", type=int, default=1)
+    my_parser.add_argument("--report", help="Le rapport json, par défaut ../figures/dedup.json", default="../figures/dedup.json")
+    my_args = my_parser.parse_args()
+
+    with instrument.stage("dedup") :
+        data = read_corpus(my_args.data)
+
+        if my_args.augmented_pairs and GROUP_COLUMN not in data.columns :
+            if len(data) % 2 != 0 :
+                my_parser.error("--augmented-pairs : le fichier a un nombre impair de lignes, ce n'est pas une sortie d'augment_data.py")
+            data[GROUP_COLUMN] = np.tile(np.arange(len(data) // 2), 2)
+
+        data, report = dedup(data, my_args.threshold, my_args.augment_threshold, my_args.num_perm, my_args.shingle_size, my_args.workers)
+        write_corpus(data, my_args.output)
+
+        print(f"{report['rows']} lignes : {report['exact_duplicates']} doublons exacts, {report['augmentations_too_close']} rétro-traductions trop proches, "
+              f"{report['near_duplicates']} quasi-doublons retirés, {report['kept']} lignes gardées dans {my_args.output}")
+
+        with open(my_args.report, "w", encoding="utf-8") as f :
+            json.dump(report, f, indent=2)
@@ -1,105 +1,237 @@
-from transformers import AutoModelForSequenceClassification, Trainer, AutoTokenizer, TrainingArguments
-from datasets import load_dataset
+from tokenized_splits import tokenized_splits, CACHE_DIR
 import argparse
-from sklearn.metrics import accuracy_score, f1_score, confusion_matrix, ConfusionMatrixDisplay
+import json
+import time
 import numpy as np
-import matplotlib.pyplot as plt
+import instrument
 
 """ Evaluate model
 
-Ce script prend en argument un fichier csv contenant les données sur lesquelles on souhaite évaluer un modèle. 
-Il calcule l'accuracy et la f-mesure et génère une matrice de confusion.
-Ce script utilise les bibliothèques transformers, datasets, argparse, sklearn, numpy et matplotlib
-
-Ce script comporte  une fonction :
+Ce script prend en argument un fichier csv (ou parquet / arrow, voir le module corpus_io) contenant les données sur lesquelles on souhaite évaluer un modèle.
+Il calcule la loss, l'accuracy et la f-mesure et génère une matrice de confusion.
+Le sous-corpus test est celui que model_train.py a mis de côté, relu depuis le disque s'il a déjà été tokenizé (voir le module tokenized_splits).
+Le modèle ne passe qu'une seule fois sur le sous-corpus test, par batchs (option --batch-size) et sans calcul de gradient : toutes les mesures
+sont calculées à partir de ces mêmes prédictions. Les mesures sont écrites dans un fichier json (option --metrics) et la matrice de confusion
+dans une image (option --figure), sans ouvrir de fenêtre. Le nombre de reviews traitées par seconde est affiché.
+L'option --backend choisit la version du modèle : d'origine (pytorch), ou exportée par export_model.py (int8, onnx ou onnx-int8).
+Ce script utilise les bibliothèques torch, argparse, json, sklearn, numpy et matplotlib, ainsi que les modules tokenized_splits, export_model et instrument
+(torch et export_model ne sont importés que pour appliquer le modèle : compute_metrics et save_confusion_matrix servent aussi à baseline_model.py ;
+sklearn et matplotlib ne sont importés que par compute_metrics et save_confusion_matrix)
+
+Ce script comporte ces fonctions :
+    predict_logits - applique un modèle à un sous-corpus tokenizé, par batchs, et retourne ses sorties
+    compute_metrics - calcule la loss, l'accuracy, la f-mesure et la matrice de confusion à partir des sorties du modèle
+    save_confusion_matrix - sauvegarde la matrice de confusion dans une image
     evaluate_model - évalue un modèle sur un sous-corpus de test
 
 """
 
 
-def evaluate_model(dataset) :
-    
+MODEL_DIR = "../bin/model"
+
+
+def predict_logits(model, tokenizer, dataset, batch_size=32) :
+
     """
-    Evalue un modèle qu'on a train sur un jeu de données test
+    Applique un modèle à un sous-corpus tokenizé, par batchs et sans calcul de gradient
 
     Parameters
     ---
-    dataset : str
-    Le chemin vers le fichier contenant nos données
+    model : PreTrainedModel
+    Le modèle
+    tokenizer : PreTrainedTokenizer
+    Le tokenizer, qui complète chaque batch jusqu'à sa plus longue review si le sous-corpus n'est pas déjà complété
+    dataset : Dataset
+    Le sous-corpus, avec les colonnes input_ids et attention_mask
+    batch_size : int
+    Le nombre de reviews par batch
+
+    Returns
+    ---
+    logits : np.ndarray
+    Les sorties du modèle (une ligne par review, une colonne par classe)
+
+    """
+
+    import torch
+
+    model.eval()
+    device = model.device
+    columns = dataset.select_columns(["input_ids", "attention_mask"])
+
+    logits = []
+    with torch.inference_mode() :
+        for start in range(0, len(columns), batch_size) :
+            batch = tokenizer.pad(columns[start:start + batch_size], return_tensors="pt")
+            batch = {name: tensor.to(device) for name, tensor in batch.items()}
+            logits.append(model(**batch).logits.float().cpu().numpy())
+
+    if not logits :
+        return np.zeros((0, model.config.num_labels), dtype=np.float32)
+
+    return np.concatenate(logits)
+
+
+def compute_metrics(logits, labels) :
+
+    """
+    Calcule les mesures d'évaluation à partir des sorties du modèle
+
+    Parameters
+    ---
+    logits : np.ndarray
+    Les sorties du modèle (ou les log-probabilités de chaque classe)
+    labels : array
+    Les vraies classes (les notes décalées de 1 vers la gauche, de 0 à 4)
+
+    Returns
+    ---
+    metrics : dict
+    La loss (entropie croisée moyenne), l'accuracy, la f-mesure et la matrice de confusion (sur les notes de 1 à 5)
 
     """
 
-    #Le dossier contenant le modèle qu'on a généré grâce au script model_train.py
-    model_dir = "../bin/model"
-    tokenizer = AutoTokenizer.from_pretrained(model_dir)
-    model = AutoModelForSequenceClassification.from_pretrained(model_dir)
+    from sklearn.metrics import accuracy_score, f1_score, confusion_matrix
 
-    #On charge notre jeu de données et on le split de la même manière que pour train le modèle (grâce au seed)
-    #sauf qu'ici on utilisera que le jeu de test qu'on n'avait pas utilisé avant
-    dataset = load_dataset("csv", data_files=dataset)["train"]
-    train_valtest = dataset.train_test_split(test_size = 0.2, seed=42)
-    valtest = train_valtest["test"].train_test_split(test_size=0.5, seed=42)
+    labels = np.asarray(labels)
+    y_pred = np.argmax(logits, axis=1)
 
-    train_dataset = train_valtest['train']
-    val_dataset = valtest['train']
-    test_dataset = valtest['test']
+    #La même loss que celle calculée par le modèle pendant l'entraînement (entropie croisée moyenne, à partir du log-softmax des sorties)
+    shifted = logits - logits.max(axis=1, keepdims=True)
+    log_probas = shifted - np.log(np.exp(shifted).sum(axis=1, keepdims=True))
+    loss = float(-log_probas[np.arange(len(labels)), labels].mean()) if len(labels) else 0.0
 
-    #On tokenize les reviews du jeu de données test et on ajoute les labels qui sont les notes (décalées de 1 vers la gauche encore une fois)
-    def preprocess_function(dataset):
-        return tokenizer(dataset["reviews"], truncation=True, padding="max_length", max_length=128)
+    #La matrice porte sur les classes de 0 à 4, mais on l'affiche avec les notes redécalées vers la droite (de 1 à 5)
+    classes = np.arange(logits.shape[1])
+    matrice_confusion = confusion_matrix(labels, y_pred, labels=classes)
 
-    test_dataset = test_dataset.map(preprocess_function)
+    return {
+        "loss": loss,
+        "accuracy": accuracy_score(labels, y_pred),
+        "f1": f1_score(labels, y_pred, average="weighted"),
+        "confusion_matrix": matrice_confusion.tolist(),
+        "notes": (classes + 1).tolist(),
+    }
 
-    def add_labels(dataset):
-        dataset["labels"] = dataset["notes"] - 1
-        return dataset
 
-    test_dataset = test_dataset.map(add_labels)
+def save_confusion_matrix(matrice_confusion, notes, path) :
+
+    """
+    Sauvegarde la matrice de confusion dans une image, sans ouvrir de fenêtre
+
+    Parameters
+    ---
+    matrice_confusion : array
+    La matrice de confusion
+    notes : list
+    Les notes correspondant aux lignes et aux colonnes de la matrice
+    path : str
+    Le chemin de l'image
+
+    """
+
+    from matplotlib.figure import Figure
+    from sklearn.metrics import ConfusionMatrixDisplay
+
+    fig = Figure()
+    ax = fig.subplots()
+    disp = ConfusionMatrixDisplay(confusion_matrix=np.asarray(matrice_confusion), display_labels=notes)
+    disp.plot(ax=ax, cmap="Blues", values_format="d")
+    ax.set_title("Matrice de confusion")
+    fig.savefig(path, bbox_inches="tight")
+
+
+def evaluate_model(dataset, batch_size=32, metrics_path="../figures/evaluation_model.json",
+                   figure_path="../figures/matrice_confusion_model.png", model_dir=MODEL_DIR, cache_dir=CACHE_DIR, backend="pytorch", max_length=128) :
+
+    """
+    Evalue un modèle qu'on a train sur un jeu de données test
+
+    Parameters
+    ---
+    dataset : str
+    Le chemin vers le fichier contenant nos données
+    batch_size : int
+    Le nombre de reviews par batch
+    metrics_path : str
+    Le fichier json où sont écrites les mesures (None pour ne pas l'écrire)
+    figure_path : str
+    L'image où est sauvegardée la matrice de confusion (None pour ne pas la sauvegarder)
+    model_dir : str
+    Le dossier contenant le modèle qu'on a généré grâce au script model_train.py
+    cache_dir : str
+    Le dossier où sont sauvegardés les sous-corpus tokenizés (None pour ne rien sauvegarder)
+    backend : str
+    La version du modèle (pytorch, int8, onnx ou onnx-int8, voir le module export_model)
+    max_length : int
+    Le nombre maximum de tokens par review, le même que pour l'entraînement (sinon le sous-corpus test est tokenizé à nouveau, et tronqué autrement)
+
+    Returns
+    ---
+    metrics : dict
+    Les mesures d'évaluation et le débit
+
+    """
+
+    import torch
+    from export_model import load_backend
 
-    #On initialise le trainer et ses arguments, avec le dataset d'évaluation étant le sous-corpus test qui représente 10% du corpus total
-    args = TrainingArguments(
-        output_dir="./tmp", 
-        per_device_eval_batch_size=1
-        )
-    
-    trainer = Trainer(
-    model=model,
-    args=args,
-    eval_dataset= test_dataset
-    )
+    model, tokenizer = load_backend(model_dir, backend)
+    if backend == "pytorch" and torch.cuda.is_available() :
+        model = model.to("cuda")
 
+    #On charge le sous-corpus test, découpé de la même manière que pour train le modèle (grâce au seed) et déjà tokenizé avec les labels
+    #(notes décalées de 1 vers la gauche) : si model_train.py a été lancé sur les mêmes données, il est relu depuis le disque sans rien recalculer
+    test_dataset = tokenized_splits(dataset, tokenizer, max_length=max_length, seed=42, cache_dir=cache_dir)["test"]
 
-    #On affiche les résultats et on calcule l'accuracy et la f-mesure
-    eval_result = trainer.evaluate(test_dataset)
-    print("Résultats bruts :", eval_result)
+    #Un seul passage du modèle sur le sous-corpus test, dont on garde les sorties pour calculer toutes les mesures
+    start = time.perf_counter()
+    logits = predict_logits(model, tokenizer, test_dataset, batch_size)
+    runtime = time.perf_counter() - start
 
-    predictions = trainer.predict(test_dataset)
-    y_pred = np.argmax(predictions.predictions, axis=1)
-    y_true = predictions.label_ids
+    metrics = compute_metrics(logits, test_dataset["labels"])
+    metrics.update({
+        "num_samples": len(test_dataset),
+        "backend": backend,
+        "batch_size": batch_size,
+        "runtime": runtime,
+        "samples_per_second": len(test_dataset) / runtime if runtime > 0 else 0.0,
+    })
+    #Les tokens comptés sont les vrais tokens des reviews (sans le padding), comme pour le débit de model_train.py
+    tokens = sum(sum(mask) for mask in test_dataset["attention_mask"])
+    metrics["tokens_per_second"] = tokens / runtime if runtime > 0 else 0.0
+    instrument.set_gauge("inference_samples_per_second", metrics["samples_per_second"], "Reviews évaluées par seconde", backend=backend)
+    instrument.set_gauge("inference_tokens_per_second", metrics["tokens_per_second"], "Tokens (sans le padding) évalués par seconde", backend=backend)
 
-    acc = accuracy_score(y_true, y_pred)
-    f1 = f1_score(y_true, y_pred, average="weighted")
+    print(f"Loss : {metrics['loss']:.4f}")
+    print(f"Accuracy : {metrics['accuracy']:.2%}")
+    print(f"F-mesure : {metrics['f1']:.2%}")
+    print(f"Reviews par seconde : {metrics['samples_per_second']:.2f}")
+    print(f"Tokens par seconde : {metrics['tokens_per_second']:.1f}")
 
-    print(f"Accuracy : {acc:.2%}")
-    print(f"F-mesure : {f1:.2%}")
+    if metrics_path is not None :
+        with open(metrics_path, "w", encoding="utf-8") as f :
+            json.dump(metrics, f, indent=2)
 
-    #Avant de faire la matrice de confusion on redécale les notes vers la droite (on les remet de 1 à 5)
-    y_pred_notes = y_pred + 1
-    y_true_notes = test_dataset["labels"]
-    y_true_notes = [label + 1 for label in y_true_notes]
+    if figure_path is not None :
+        save_confusion_matrix(metrics["confusion_matrix"], metrics["notes"], figure_path)
 
-    #On créé la matrice de confusion et on l'affiche
-    matrice_confusion = confusion_matrix(y_true_notes, y_pred_notes)
-    disp = ConfusionMatrixDisplay(confusion_matrix=matrice_confusion, display_labels=[1, 2, 3, 4, 5])
-    disp.plot(cmap="Blues", values_format="d")
-    plt.title("Matrice de confusion")
-    plt.show()
+    return metrics
 
 
 
 if __name__ == "__main__" :
     my_parser = argparse.ArgumentParser()
-    my_parser.add_argument("data", help="Le fichier csv contenant le jeu de données")
+    my_parser.add_argument("data", help="Le fichier (csv, parquet ou arrow) contenant le jeu de données")
+    my_parser.add_argument("--batch-size", help="Le nombre de reviews par batch, par défaut 32", type=int, default=32)
+    my_parser.add_argument("--metrics", help="Le fichier json où sont écrites les mesures, par défaut ../figures/evaluation_model.json", default="../figures/evaluation_model.json")
+    my_parser.add_argument("--figure", help="L'image de la matrice de confusion, par défaut ../figures/matrice_confusion_model.png", default="../figures/matrice_confusion_model.png")
+    my_parser.add_argument("--model", help=f"Le dossier contenant le modèle, par défaut {MODEL_DIR}", default=MODEL_DIR)
+    my_parser.add_argument("--backend", help="La version du modèle (pytorch, int8, onnx ou onnx-int8, voir export_model.py), par défaut pytorch", default="pytorch")
+    my_parser.add_argument("--cache-dir", help=f"Le dossier où sont sauvegardés les sous-corpus tokenizés, par défaut {CACHE_DIR}", default=CACHE_DIR)
+    my_parser.add_argument("--max-length", help="Le nombre maximum de tokens par review (celui de model_train.py --max-length), par défaut 128", type=int, default=128)
     my_args = my_parser.parse_args()
 
-    evaluate_model(my_args.data)
+    with instrument.stage("evaluate") :
+        evaluate_model(my_args.data, my_args.batch_size, my_args.metrics, my_args.figure, my_args.model, my_args.cache_dir, my_args.backend,
+                       my_args.max_length)
@@ -0,0 +1,249 @@
+import argparse
+import os
+
+"""Export du modèle pour l'inférence sur CPU
+
+Ce script exporte le modèle finetuné (../bin/model, généré par model_train.py) dans des versions plus rapides sur CPU.
+Chaque version est rangée dans un dossier à côté du modèle (../bin/model-int8, ../bin/model-onnx, ...) avec le tokenizer et la configuration :
+
+    * pytorch - le modèle d'origine, en float32 (rien à exporter)
+    * int8 - les couches linéaires quantifiées dynamiquement en int8 par torch (poids en int8, activations quantifiées à la volée)
+    * onnx - le modèle exporté au format ONNX et exécuté par ONNX Runtime (si onnx et onnxruntime sont installés)
+    * onnx-int8 - le modèle ONNX quantifié dynamiquement en int8 par ONNX Runtime
+
+La fonction load_backend charge n'importe laquelle de ces versions avec la même interface que le modèle d'origine
+(model(**batch).logits) : evaluate_model.py, predict.py et serve_model.py choisissent leur version avec l'option --backend,
+et compare_backends.py compare leur précision, leur vitesse et leur mémoire.
+
+Ce script utilise les bibliothèques argparse, torch et transformers, et optionnellement onnx et onnxruntime.
+torch et transformers ne sont importés que par les fonctions qui s'en servent : backend_dir et available_backends restent rapides à importer.
+
+Ce script comporte ces fonctions et classes :
+
+    * backend_dir - retourne le dossier d'une version du modèle
+    * available_backends - retourne les versions utilisables avec les bibliothèques installées
+    * quantize_model - quantifie dynamiquement les couches linéaires d'un modèle en int8
+    * export_int8 - exporte la version int8
+    * export_onnx - exporte la version onnx (et onnx-int8)
+    * OnnxModel - exécute un modèle ONNX avec ONNX Runtime, avec la même interface qu'un modèle transformers
+    * load_backend - charge une version du modèle et son tokenizer
+
+"""
+
+
+MODEL_DIR = "../bin/model"
+BACKENDS = ("pytorch", "int8", "onnx", "onnx-int8")
+INT8_WEIGHTS = "model_int8.pt"
+ONNX_FILES = {"onnx": "model.onnx", "onnx-int8": "model_int8.onnx"}
+
+
+def backend_dir(model_dir: str, backend: str) -> str :
+    """Retourne le dossier d'une version du modèle (../bin/model-int8 pour ../bin/model et int8)"""
+
+    if backend not in BACKENDS :
+        raise ValueError(f"Version du modèle inconnue : {backend} (choix possibles : {', '.join(BACKENDS)})")
+    if backend == "pytorch" :
+        return model_dir
+
+    return f"{os.path.normpath(model_dir)}-{backend}"
+
+
+def available_backends() -> list :
+    """Retourne les versions du modèle utilisables avec les bibliothèques installées"""
+
+    names = ["pytorch", "int8"]
+    try :
+        import onnxruntime
+    except ImportError :
+        return names
+
+    return names + ["onnx", "onnx-int8"]
+
+
+def quantize_model(model) :
+    """Quantifie dynamiquement les couches linéaires d'un modèle en int8 (les embeddings et les normalisations restent en float32)"""
+
+    import torch
+
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def _save_companions(model_dir: str, out_dir: str) :
+    # la configuration et le tokenizer accompagnent chaque version, pour qu'elle puisse être chargée seule
+    from transformers import AutoConfig, AutoTokenizer
+
+    os.makedirs(out_dir, exist_ok=True)
+    AutoConfig.from_pretrained(model_dir).save_pretrained(out_dir)
+    AutoTokenizer.from_pretrained(model_dir).save_pretrained(out_dir)
+
+
+def export_int8(model_dir: str = MODEL_DIR) -> str :
+    """Exporte la version int8 du modèle
+
+    Parameters
+    ----------
+    model_dir : str
+        Le dossier contenant le modèle généré par model_train.py
+
+    Returns
+    -------
+    out_dir : str
+        Le dossier de la version int8
+    """
+
+    import torch
+    from transformers import AutoModelForSequenceClassification
+
+    out_dir = backend_dir(model_dir, "int8")
+    _save_companions(model_dir, out_dir)
+
+    model = AutoModelForSequenceClassification.from_pretrained(model_dir).eval()
+    torch.save(quantize_model(model).state_dict(), os.path.join(out_dir, INT8_WEIGHTS))
+
+    return out_dir
+
+
+def export_onnx(model_dir: str = MODEL_DIR, quantize: bool = True, opset: int = 17) -> list :
+    """Exporte la version onnx du modèle, et sa version quantifiée en int8
+
+    Parameters
+    ----------
+    model_dir : str
+        Le dossier contenant le modèle généré par model_train.py
+    quantize : bool
+        Exporter aussi la version onnx-int8
+    opset : int
+        La version de l'opset ONNX
+
+    Returns
+    -------
+    out_dirs : list
+        Les dossiers des versions exportées
+    """
+
+    import torch
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+    out_dir = backend_dir(model_dir, "onnx")
+    _save_companions(model_dir, out_dir)
+
+    model = AutoModelForSequenceClassification.from_pretrained(model_dir).eval()
+    tokenizer = AutoTokenizer.from_pretrained(model_dir)
+
+    # les dimensions batch et séquence restent variables, pour garder le padding dynamique
+    example = dict(tokenizer(["Un exemple de review.", "Un autre exemple"], padding=True, return_tensors="pt"))
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in example}
+    dynamic_axes["logits"] = {0: "batch"}
+    onnx_path = os.path.join(out_dir, ONNX_FILES["onnx"])
+
+    with torch.no_grad() :
+        torch.onnx.export(model, (), onnx_path, kwargs=example, input_names=list(example), output_names=["logits"],
+                          dynamic_axes=dynamic_axes, opset_version=opset, dynamo=False)
+
+    out_dirs = [out_dir]
+    if quantize :
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+
+        int8_dir = backend_dir(model_dir, "onnx-int8")
+        _save_companions(model_dir, int8_dir)
+        quantize_dynamic(onnx_path, os.path.join(int8_dir, ONNX_FILES["onnx-int8"]), weight_type=QuantType.QInt8)
+        out_dirs.append(int8_dir)
+
+    return out_dirs
+
+
+class OnnxModel :
+    """Exécute un modèle ONNX avec ONNX Runtime sur CPU, avec la même interface qu'un modèle transformers (model(**batch).logits)
+
+    Parameters
+    ----------
+    path : str
+        Le fichier .onnx
+    config : PretrainedConfig
+        La configuration du modèle (pour le nombre de classes)
+    threads : int
+        Le nombre de threads utilisés par ONNX Runtime (par défaut, le choix d'ONNX Runtime)
+    """
+
+    def __init__(self, path: str, config, threads: int = None) :
+        import onnxruntime
+        import torch
+
+        options = onnxruntime.SessionOptions()
+        if threads is not None :
+            options.intra_op_num_threads = threads
+
+        self.config = config
+        self.device = torch.device("cpu")
+        self.session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_names = [model_input.name for model_input in self.session.get_inputs()]
+
+    def eval(self) :
+        return self
+
+    def __call__(self, **inputs) :
+        import torch
+        from transformers.modeling_outputs import SequenceClassifierOutput
+
+        feeds = {name: inputs[name].cpu().numpy() for name in self.input_names}
+        logits = self.session.run(["logits"], feeds)[0]
+
+        return SequenceClassifierOutput(logits=torch.from_numpy(logits))
+
+
+def load_backend(model_dir: str = MODEL_DIR, backend: str = "pytorch", threads: int = None) :
+    """Charge une version du modèle et son tokenizer
+
+    Parameters
+    ----------
+    model_dir : str
+        Le dossier contenant le modèle généré par model_train.py (les autres versions sont dans les dossiers voisins)
+    backend : str
+        La version (pytorch, int8, onnx ou onnx-int8)
+    threads : int
+        Le nombre de threads utilisés pour l'inférence (par défaut, le choix de torch ou d'ONNX Runtime)
+
+    Returns
+    -------
+    model, tokenizer : PreTrainedModel (ou OnnxModel), PreTrainedTokenizer
+        Le modèle, prêt pour l'inférence, et son tokenizer
+    """
+
+    import torch
+    from transformers import AutoConfig, AutoModelForSequenceClassification, AutoTokenizer
+
+    path = backend_dir(model_dir, backend)
+    if not os.path.isdir(path) :
+        raise FileNotFoundError(f"La version {backend} du modèle n'existe pas ({path}) : lancer d'abord export_model.py")
+
+    if threads is not None :
+        torch.set_num_threads(threads)
+
+    tokenizer = AutoTokenizer.from_pretrained(path)
+
+    if backend == "pytorch" :
+        model = AutoModelForSequenceClassification.from_pretrained(path)
+    elif backend == "int8" :
+        # on reconstruit le modèle quantifié à partir de sa configuration, puis on y charge les poids int8
+        model = quantize_model(AutoModelForSequenceClassification.from_config(AutoConfig.from_pretrained(path)).eval())
+        model.load_state_dict(torch.load(os.path.join(path, INT8_WEIGHTS), weights_only=True))
+    else :
+        model = OnnxModel(os.path.join(path, ONNX_FILES[backend]), AutoConfig.from_pretrained(path), threads)
+
+    return model.eval(), tokenizer
+
+
+if __name__ == "__main__" :
+    my_parser = argparse.ArgumentParser()
+    my_parser.add_argument("--model", help=f"Le dossier contenant le modèle, par défaut {MODEL_DIR}", default=MODEL_DIR)
+    my_parser.add_argument("--backends", help="Les versions à exporter, par défaut int8, et onnx et onnx-int8 si onnxruntime est installé",
+                           nargs="*", choices=BACKENDS[1:], default=[backend for backend in available_backends() if backend != "pytorch"])
+    my_args = my_parser.parse_args()
+
+    if "int8" in my_args.backends :
+        out_dir = export_int8(my_args.model)
+        print(os.path.basename(out_dir), ":", out_dir)
+    if "onnx" in my_args.backends or "onnx-int8" in my_args.backends :
+        # la version onnx-int8 est quantifiée à partir de la version onnx, qui est donc toujours exportée
+        for out_dir in export_onnx(my_args.model, quantize="onnx-int8" in my_args.backends) :
+            print(os.path.basename(out_dir), ":", out_dir)
@@ -0,0 +1,260 @@
+from bs4 import BeautifulSoup, SoupStrainer, UnicodeDammit
+from urllib.parse import urljoin
+
+try :
+    from bs4.filter import ElementFilter
+except ImportError :  # bs4 < 4.13
+    ElementFilter = None
+
+try :
+    import lxml.html
+except ImportError :
+    lxml = None
+
+try :
+    from selectolax.lexbor import LexborHTMLParser as HTMLParser
+except ImportError :
+    HTMLParser = None
+
+"""Extraction des liens et des reviews d'une page Allociné
+
+Ce module regroupe les différentes manières d'extraire d'une page html les liens vers les pages de reviews et les couples (review, note).
+Toutes renvoient exactement le même résultat que les sélecteurs BeautifulSoup d'origine, seule la vitesse change :
+
+    * bs4 - arbre BeautifulSoup complet avec html.parser (le fonctionnement d'origine)
+    * bs4-strained - BeautifulSoup avec html.parser, mais seuls les liens et les blocs de reviews sont construits dans l'arbre
+    * lxml - parseur C de lxml et requêtes XPath (si lxml est installé)
+    * selectolax - parseur C lexbor de selectolax et sélecteurs CSS (si selectolax est installé)
+
+Ce module utilise les bibliothèques BeautifulSoup et urllib, et optionnellement lxml et selectolax.
+
+Ce module comporte ces fonctions :
+
+    * extract_links - retourne les liens vers les pages de reviews présents sur une page parsée par BeautifulSoup
+    * extract_reviews - retourne les couples (review, note) présents sur une page parsée par BeautifulSoup
+    * get_extractor - retourne la fonction d'extraction d'un backend
+    * available_extractors - retourne les noms des backends utilisables
+
+"""
+
+
+REVIEW_CLASS = "review-card-review-holder"
+CONTENT_CLASS = "content-txt review-card-content"
+META_CLASS = "review-card-meta"
+STAREVAL_CLASS = "stareval stareval-medium stareval-theme-default"
+NOTE_CLASS = "stareval-note"
+
+
+def _review_link(url: str, target_url: str) :
+    """Retourne l'url absolue d'un lien si c'est un lien vers une page de reviews de l'url cible, None sinon"""
+
+    # si besoin on convertit les url en url absolue
+    if not url.startswith("http"):
+        absolute_url = urljoin(target_url, url)
+    else:
+        absolute_url = url
+
+    #la condition sur "?page=" est spécifique à mes besoins afin de ne récupérer que les pages contenant des reviews
+    if absolute_url.startswith(target_url) and "?page=" in absolute_url :
+        return absolute_url
+
+    return None
+
+
+def extract_links(soup: BeautifulSoup, target_url: str) -> list :
+    """Récupère les liens vers les pages de reviews présents sur une page
+
+Parameters
+----------
+soup : BeautifulSoup
+    La page parsée
+target_url : str
+    L'url cible, qui sert à résoudre les liens relatifs et à filtrer les liens
+
+Returns
+-------
+links : list
+    Les urls absolues commençant par l'url cible et contenant "?page=", dans l'ordre de la page
+"""
+    links = []
+
+    for link_element in soup.select("a[href]"):
+        absolute_url = _review_link(link_element["href"], target_url)
+        if absolute_url is not None :
+            links.append(absolute_url)
+
+    return links
+
+
+def extract_reviews(soup: BeautifulSoup) -> list :
+    """Récupère les reviews et les notes présentes sur une page
+
+Parameters
+----------
+soup : BeautifulSoup
+    La page parsée
+
+Returns
+-------
+reviews : list
+    Les couples (review, note), dans l'ordre de la page
+"""
+    reviews = []
+
+    # On itère sur chaque review de la page et on y récupère le texte de la review ainsi que la note donnée par l'utilisateur
+    for review in soup.find_all("div", class_=REVIEW_CLASS) :
+        text_review = review.find("div", class_=CONTENT_CLASS)
+        note_review = review.find("div", class_=META_CLASS)
+        if note_review is not None :
+            note_review = note_review.find("div", class_=STAREVAL_CLASS)
+        if note_review is not None :
+            note_review = note_review.find("span", class_=NOTE_CLASS)
+
+        # une review sans texte ou sans note ne peut pas servir à la classification : on l'ignore au lieu d'arrêter le crawl
+        if text_review is None or note_review is None :
+            continue
+
+        reviews.append((text_review.text.strip(), note_review.text))
+
+    return reviews
+
+
+def _extract_bs4(html: bytes, target_url: str) :
+    soup = BeautifulSoup(html, "html.parser")
+
+    return extract_links(soup, target_url), extract_reviews(soup)
+
+
+def _keep_tag(name: str, attrs: dict) -> bool :
+    """Indique si une balise de premier niveau doit être construite : un lien ou un bloc de review"""
+
+    if name == "a" :
+        return "href" in attrs
+
+    classes = attrs.get("class") or ""
+    if isinstance(classes, str) :
+        classes = classes.split()
+
+    return name == "div" and REVIEW_CLASS in classes
+
+
+if ElementFilter is not None :
+
+    class _LinksAndReviews(ElementFilter) :
+        """Filtre BeautifulSoup qui ne construit que les liens et les blocs de reviews (et leur contenu)"""
+
+        def allow_tag_creation(self, nsprefix, name, attrs) :
+            return _keep_tag(name, attrs or {})
+
+        def allow_string_creation(self, string) :
+            return False
+
+    _STRAINER = _LinksAndReviews()
+else :
+    # avant bs4 4.13, une fonction donnée comme nom reçoit le nom et les attributs de la balise
+    _STRAINER = SoupStrainer(lambda name, attrs : _keep_tag(name, dict(attrs)))
+
+
+def _extract_bs4_strained(html: bytes, target_url: str) :
+    soup = BeautifulSoup(html, "html.parser", parse_only=_STRAINER)
+
+    return extract_links(soup, target_url), extract_reviews(soup)
+
+
+def _has_class(name: str) -> str :
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+# mêmes règles que les sélecteurs BeautifulSoup : class_="a b" compare la chaîne entière, class_="a" cherche parmi les classes
+_XPATH_REVIEWS = f"//div[{_has_class(REVIEW_CLASS)}]"
+_XPATH_CONTENT = f".//div[@class='{CONTENT_CLASS}']"
+_XPATH_NOTE = (
+    f"(.//div[{_has_class(META_CLASS)}])[1]"
+    f"/descendant::div[@class='{STAREVAL_CLASS}'][1]"
+    f"/descendant::span[{_has_class(NOTE_CLASS)}][1]"
+)
+
+
+def _extract_lxml(html: bytes, target_url: str) :
+    tree = lxml.html.fromstring(UnicodeDammit(html, ["utf-8"]).unicode_markup)
+
+    links = []
+    for url in tree.xpath("//a/@href") :
+        absolute_url = _review_link(url, target_url)
+        if absolute_url is not None :
+            links.append(absolute_url)
+
+    reviews = []
+    for review in tree.xpath(_XPATH_REVIEWS) :
+        text_review = review.xpath(_XPATH_CONTENT)
+        note_review = review.xpath(_XPATH_NOTE)
+        if not text_review or not note_review :
+            continue
+        reviews.append((text_review[0].text_content().strip(), note_review[0].text_content()))
+
+    return links, reviews
+
+
+def _extract_selectolax(html: bytes, target_url: str) :
+    tree = HTMLParser(UnicodeDammit(html, ["utf-8"]).unicode_markup)
+
+    links = []
+    for link_element in tree.css("a[href]") :
+        absolute_url = _review_link(link_element.attributes["href"] or "", target_url)
+        if absolute_url is not None :
+            links.append(absolute_url)
+
+    reviews = []
+    for review in tree.css(f"div.{REVIEW_CLASS}") :
+        text_review = review.css_first(f'div[class="{CONTENT_CLASS}"]')
+        note_review = review.css_first(f"div.{META_CLASS}")
+        if note_review is not None :
+            note_review = note_review.css_first(f'div[class="{STAREVAL_CLASS}"]')
+        if note_review is not None :
+            note_review = note_review.css_first(f"span.{NOTE_CLASS}")
+        if text_review is None or note_review is None :
+            continue
+        reviews.append((text_review.text(deep=True).strip(), note_review.text(deep=True)))
+
+    return links, reviews
+
+
+EXTRACTORS = {
+    "bs4": _extract_bs4,
+    "bs4-strained": _extract_bs4_strained,
+    "lxml": _extract_lxml,
+    "selectolax": _extract_selectolax,
+}
+
+
+def available_extractors() -> list :
+    """Retourne les noms des backends dont les bibliothèques sont installées"""
+
+    names = ["bs4", "bs4-strained"]
+    if lxml is not None :
+        names.append("lxml")
+    if HTMLParser is not None :
+        names.append("selectolax")
+
+    return names
+
+
+def get_extractor(name: str = "bs4") :
+    """Retourne la fonction d'extraction d'un backend
+
+Parameters
+----------
+name : str
+    Le nom du backend (bs4, bs4-strained, lxml ou selectolax)
+
+Returns
+-------
+extract : callable
+    Une fonction (html: bytes, target_url: str) -> (links, reviews)
+"""
+    if name not in EXTRACTORS :
+        raise ValueError(f"Backend d'extraction inconnu : {name} (choix possibles : {', '.join(EXTRACTORS)})")
+    if name not in available_extractors() :
+        raise ImportError(f"Le backend d'extraction {name} n'est pas installé")
+
+    return EXTRACTORS[name]
@@ -1,29 +1,58 @@
 import pandas as pd
+import numpy as np
 import argparse
+from corpus_io import read_corpus, iter_corpus, CorpusWriter
+import instrument
 
 """Harmoniser les classes
 
-Ce script prend en argument un fichier csv qu'on souhaite modifier. 
+Ce script prend en argument un fichier csv (ou parquet / arrow, voir le module corpus_io) qu'on souhaite modifier.
 Ce script sert à adapter les classes en vue d'utiliser certains modèles (ici, le script transforme les float en int et retire les 0)
-Ce script utilise les bibliothèques pandas et argparse
+Le fichier est lu et écrit par morceaux (option --chunksize), avec une conversion des notes entièrement vectorisée :
+la mémoire utilisée ne dépend pas de la taille du fichier, et le résultat est identique à celui de la fonction harmonize.
+Ce script utilise les bibliothèques pandas, numpy et argparse, ainsi que les modules corpus_io et instrument
 
-Ce script comporte deux fonctions :
+Ce script comporte trois fonctions :
 
     harmonize - permet de transformer les float en int dans le dataframe et drop les lignes qui ont une note de 0 afin de garder 5 classes (1, 2, 3, 4, 5)
-    remove_decimal : permet de transformer un float en int 
+    harmonize_notes : transforme une colonne de notes ("3,5") en entiers sans décimale (3), stockés sur un octet
+    harmonize_stream : harmonise un fichier csv morceau par morceau et écrit le résultat au fur et à mesure
 
 
 """
 
 
+def harmonize_notes(notes: pd.Series) -> pd.Series :
+    """Retire les décimales des notes et les transforme en int
+
+    Parameters
+    ----------
+    notes : Series
+        Les notes, sous forme de chaînes avec une virgule ("3,5") ou de nombres
+
+    Returns
+    -------
+    notes : Series
+        Les notes sans décimale (3,5 devient 3), en int8
+    """
+
+    #On remplace les virgules par des points pour pouvoir convertir ces chiffres en float
+    if not pd.api.types.is_numeric_dtype(notes) :
+        notes = notes.astype(str).str.replace(",", ".", regex=False)
+    values = pd.to_numeric(notes).to_numpy(dtype=np.float64)
+
+    #Les notes sont positives : arrondir à l'entier inférieur revient à retirer les décimales
+    return pd.Series(np.floor(values).astype(np.int8), index=notes.index, name="notes")
+
+
 def harmonize(data) :
 
     """Harmonise les classes dans un dataframe
 
     Parameters
     ----------
-    data : str 
-        Le chemin vers le fichier csv contenant les données
+    data : str or DataFrame
+        Le chemin vers le fichier contenant les données, ou les données elles-mêmes
 
     Returns
     -------
@@ -31,47 +60,49 @@ def harmonize(data) :
         Le dataframe modifié
     """
 
-    data = pd.read_csv(data)
-    
-    #On remplace les virgules par des points pour pouvoir convertir ces chiffres en float
-    data['notes'] = data['notes'].str.replace(",", ".").apply(float)
+    if isinstance(data, str) :
+        data = read_corpus(data)
 
+    data = data.copy()
+    data['notes'] = harmonize_notes(data['notes'])
 
-    def remove_decimal(x) :
-        """Retire les décimales d'un chiffre et le transforme en int
+    #On retire les lignes dont la note est de 0 afin de conserver 5 classes
+    return data[data['notes'] != 0]
 
-        Parameters
-        ----------
-        x: int, float
-            Le nombre qu'on souhaite transformer en int
 
-        Returns
-        -------
-        x : int
-            Le nombre transformé en int
-        """
+def harmonize_stream(input_path: str, output_path: str, chunksize: int = 100_000) -> int :
 
-        #Si x est un int ou un float, et que x modulo 1 = 0,5, on convertit x en int
-        if isinstance(x, (int, float)) and x % 1 == 0.5:
-            return int(x)
-        #Si x est un float, mais qui ne finit pas par 0.5 (par exemple 2.0), on le convertit en int
-        return int(x) if isinstance(x, float) else x
-    
-    #On applique cette fonction à toutes les lignes pour la colonne "notes"
-    data['notes'] = data['notes'].apply(remove_decimal)
+    """Harmonise un fichier morceau par morceau, et écrit chaque morceau dans le fichier de sortie dès qu'il est prêt
 
-    #On retire les lignes dont la note est de 0 afin de conserver 5 classes
-    data.drop(data[data['notes'] == 0].index, inplace = True)
+    Parameters
+    ----------
+    input_path : str
+        Le chemin vers le fichier contenant les données (csv, parquet ou arrow)
+    output_path : str
+        Le chemin du fichier à écrire (csv, parquet ou arrow)
+    chunksize : int
+        Le nombre de lignes lues à la fois
 
-    return data
+    Returns
+    -------
+    count : int
+        Le nombre de lignes écrites
+    """
+
+    with CorpusWriter(output_path) as writer :
+        for chunk in iter_corpus(input_path, chunksize) :
+            writer.write(harmonize(chunk))
+
+    return writer.count
 
 
 if __name__ == "__main__" :
 
     my_parser = argparse.ArgumentParser()
-    my_parser.add_argument("data", help="Le fichier csv contenant le jeu de données")
+    my_parser.add_argument("data", help="Le fichier (csv, parquet ou arrow) contenant le jeu de données")
+    my_parser.add_argument("--output", help="Le fichier de sortie (csv, parquet ou arrow), par défaut ../../data_harmonized.csv", default="../../data_harmonized.csv")
+    my_parser.add_argument("--chunksize", help="Le nombre de lignes traitées à la fois, par défaut 100000", type=int, default=100_000)
     my_args = my_parser.parse_args()
 
-    data = harmonize(my_args.data)
-
-    data.to_csv('../../data_harmonized.csv', index=False)  
+    with instrument.stage("harmonize") :
+        harmonize_stream(my_args.data, my_args.output, my_args.chunksize)
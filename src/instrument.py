@@ -0,0 +1,257 @@
+import atexit
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from multiprocessing import parent_process
+
+"""Mesures de performance
+
+Ce module enregistre où passent le temps et la mémoire dans les scripts du projet, et les exporte dans un format lisible
+par un programme : un fichier json et un fichier texte au format Prometheus (pour le collecteur textfile de node_exporter),
+qu'on peut comparer d'un lancement à l'autre pour repérer les régressions.
+
+Trois sortes de mesures, chacune avec des étiquettes (labels) optionnelles :
+
+    * les compteurs (inc) - des totaux qui ne font qu'augmenter : requêtes HTTP, octets téléchargés, reviews traduites... (noms en _total)
+    * les jauges (set_gauge) - une valeur qu'on remplace : reviews ou tokens par seconde, temps d'une étape...
+    * les histogrammes (observe) - la répartition d'une valeur dans des cases : latence des requêtes HTTP
+
+Le gestionnaire de contexte stage mesure une étape (le temps réel, le temps CPU du processus et de ses processus fils,
+et le maximum de mémoire résidente atteint à la fin de l'étape) sous les noms stage_wall_seconds, stage_cpu_seconds et stage_peak_rss_bytes.
+
+Les mesures sont exportées par export(), ou automatiquement à la fin de chaque script si la variable d'environnement METRICS_DIR
+est définie : on obtient alors <METRICS_DIR>/<script>.json et <METRICS_DIR>/<script>.prom. Les mesures prises dans les processus
+fils des pools (multiprocessing) ne sont pas remontées : les débits sont donc mesurés dans le processus principal.
+
+Ce module n'utilise que la bibliothèque standard (json, resource, threading, time, contextlib, atexit et multiprocessing).
+
+Ce module comporte ces fonctions et classes :
+
+    * Registry - les compteurs, jauges et histogrammes d'un processus, exportables en json et au format Prometheus
+    * inc - ajoute une valeur à un compteur
+    * set_gauge - remplace la valeur d'une jauge
+    * observe - ajoute une valeur à un histogramme
+    * stage - mesure le temps et la mémoire d'une étape
+    * export - écrit les mesures en json et au format Prometheus
+
+"""
+
+
+PREFIX = "corpus_"
+# bornes (en secondes) des cases des histogrammes par défaut, adaptées aux latences HTTP
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _label_key(labels: dict) -> tuple :
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _escape(value: str) -> str :
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(key: tuple, extra: tuple = ()) -> str :
+    pairs = list(key) + list(extra)
+    if not pairs :
+        return ""
+
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Registry :
+    """Les compteurs, jauges et histogrammes d'un processus (utilisable depuis plusieurs threads)"""
+
+    def __init__(self) :
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) :
+        with self._lock :
+            self.counters = {}
+            self.gauges = {}
+            self.histograms = {}
+            self.help = {}
+
+    def _describe(self, name: str, help: str) :
+        if help is not None :
+            self.help[name] = help
+
+    def inc(self, name: str, value: float = 1, help: str = None, **labels) :
+        """Ajoute une valeur (positive) à un compteur"""
+
+        with self._lock :
+            self._describe(name, help)
+            series = self.counters.setdefault(name, {})
+            key = _label_key(labels)
+            series[key] = series.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, help: str = None, **labels) :
+        """Remplace la valeur d'une jauge"""
+
+        with self._lock :
+            self._describe(name, help)
+            self.gauges.setdefault(name, {})[_label_key(labels)] = float(value)
+
+    def observe(self, name: str, value: float, buckets: tuple = DEFAULT_BUCKETS, help: str = None, **labels) :
+        """Ajoute une valeur à un histogramme (les bornes des cases sont fixées par la première valeur)"""
+
+        with self._lock :
+            self._describe(name, help)
+            series = self.histograms.setdefault(name, {})
+            key = _label_key(labels)
+            if key not in series :
+                series[key] = {"buckets": list(buckets), "counts": [0] * len(buckets), "sum": 0.0, "count": 0}
+            histogram = series[key]
+            for i, bound in enumerate(histogram["buckets"]) :
+                if value <= bound :
+                    histogram["counts"][i] += 1
+                    break
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+    def to_dict(self) -> dict :
+        """Les mesures sous une forme qu'on peut écrire en json (une liste de séries par mesure, avec leurs étiquettes)"""
+
+        def series(values) :
+            return [{"labels": dict(key), "value": value} for key, value in values.items()]
+
+        with self._lock :
+            return {
+                "timestamp": time.time(),
+                "counters": {PREFIX + name: series(values) for name, values in self.counters.items()},
+                "gauges": {PREFIX + name: series(values) for name, values in self.gauges.items()},
+                "histograms": {PREFIX + name: [{"labels": dict(key), **histogram} for key, histogram in values.items()]
+                               for name, values in self.histograms.items()},
+            }
+
+    def to_prometheus(self) -> str :
+        """Les mesures au format texte de Prometheus (les cases des histogrammes y sont cumulées)"""
+
+        lines = []
+        with self._lock :
+            for kind, metrics in (("counter", self.counters), ("gauge", self.gauges)) :
+                for name, values in sorted(metrics.items()) :
+                    full_name = PREFIX + name
+                    if name in self.help :
+                        lines.append(f"# HELP {full_name} {self.help[name]}")
+                    lines.append(f"# TYPE {full_name} {kind}")
+                    lines.extend(f"{full_name}{_format_labels(key)} {value}" for key, value in sorted(values.items()))
+
+            for name, values in sorted(self.histograms.items()) :
+                full_name = PREFIX + name
+                if name in self.help :
+                    lines.append(f"# HELP {full_name} {self.help[name]}")
+                lines.append(f"# TYPE {full_name} histogram")
+                for key, histogram in sorted(values.items()) :
+                    cumulated = 0
+                    for bound, count in zip(histogram["buckets"], histogram["counts"]) :
+                        cumulated += count
+                        lines.append(f"{full_name}_bucket{_format_labels(key, (('le', repr(float(bound))),))} {cumulated}")
+                    lines.append(f"{full_name}_bucket{_format_labels(key, (('le', '+Inf'),))} {histogram['count']}")
+                    lines.append(f"{full_name}_sum{_format_labels(key)} {histogram['sum']}")
+                    lines.append(f"{full_name}_count{_format_labels(key)} {histogram['count']}")
+
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def inc(name: str, value: float = 1, help: str = None, **labels) :
+    """Ajoute une valeur à un compteur du registre du processus"""
+    REGISTRY.inc(name, value, help, **labels)
+
+
+def set_gauge(name: str, value: float, help: str = None, **labels) :
+    """Remplace la valeur d'une jauge du registre du processus"""
+    REGISTRY.set_gauge(name, value, help, **labels)
+
+
+def observe(name: str, value: float, buckets: tuple = DEFAULT_BUCKETS, help: str = None, **labels) :
+    """Ajoute une valeur à un histogramme du registre du processus"""
+    REGISTRY.observe(name, value, buckets, help, **labels)
+
+
+def _cpu_seconds() -> float :
+    # temps CPU (utilisateur et système) du processus et de ses processus fils terminés
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+def _peak_rss_bytes() -> int :
+    # maximum de mémoire résidente du processus (ru_maxrss est en kilo-octets sous Linux, en octets sous macOS)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+@contextmanager
+def stage(name: str) :
+    """Mesure une étape : temps réel, temps CPU et maximum de mémoire résidente atteint à la fin de l'étape
+
+    Parameters
+    ----------
+    name : str
+        Le nom de l'étape (l'étiquette stage des mesures)
+    """
+
+    start_wall = time.perf_counter()
+    start_cpu = _cpu_seconds()
+    try :
+        yield
+    finally :
+        set_gauge("stage_wall_seconds", time.perf_counter() - start_wall, "Temps réel de l'étape, en secondes", stage=name)
+        set_gauge("stage_cpu_seconds", _cpu_seconds() - start_cpu, "Temps CPU de l'étape (processus et fils), en secondes", stage=name)
+        set_gauge("stage_peak_rss_bytes", _peak_rss_bytes(), "Maximum de mémoire résidente du processus à la fin de l'étape", stage=name)
+
+
+def export(directory: str = None, job: str = None) -> list :
+    """Ecrit les mesures du processus dans <directory>/<job>.json et <directory>/<job>.prom
+
+    Parameters
+    ----------
+    directory : str
+        Le dossier des fichiers (par défaut, la variable d'environnement METRICS_DIR ; rien n'est écrit si aucun des deux n'est donné)
+    job : str
+        Le nom des fichiers (par défaut, le nom du script lancé)
+
+    Returns
+    -------
+    paths : list
+        Les fichiers écrits
+    """
+
+    directory = directory or os.environ.get("METRICS_DIR")
+    if not directory :
+        return []
+    if job is None :
+        job = os.path.splitext(os.path.basename(sys.argv[0] or "python"))[0] or "python"
+
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for extension, content in (("json", json.dumps(REGISTRY.to_dict(), indent=2)), ("prom", REGISTRY.to_prometheus())) :
+        path = os.path.join(directory, f"{job}.{extension}")
+        # écrit à côté puis renommé, pour que le collecteur ne lise jamais un fichier à moitié écrit
+        tmp_path = f"{path}.tmp{os.getpid()}"
+        with open(tmp_path, "w", encoding="utf-8") as f :
+            f.write(content)
+        os.replace(tmp_path, path)
+        paths.append(path)
+
+    return paths
+
+
+def _export_at_exit() :
+    # seulement dans le processus principal : les processus des pools (spawn) importent ce module avant de connaître leur parent,
+    # on ne le vérifie donc qu'à la fin. Rien n'est écrit si le script s'est arrêté avant de mesurer quoi que ce soit (--help...)
+    if parent_process() is None and (REGISTRY.counters or REGISTRY.gauges or REGISTRY.histograms) :
+        export()
+
+
+# export automatique à la fin du script
+if os.environ.get("METRICS_DIR") :
+    atexit.register(_export_at_exit)
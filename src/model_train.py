@@ -1,21 +1,44 @@
-from transformers import AutoModelForSequenceClassification, Trainer, AutoTokenizer, TrainingArguments
-from datasets import load_dataset
+from tokenized_splits import tokenized_splits, CACHE_DIR
 import argparse
-from sklearn.metrics import accuracy_score, f1_score
+import json
+import os
+import socket
+import tempfile
 import numpy as np
+import instrument
 
 """Model train
 
-Ce script prend en argument un fichier csv contenant les données sur lesquelles on souhaite train un modèle. Il génère un modèle finetuné sauvegardé sur l'ordinateur.
-Ce script utilise les bibliothèques transformers, datasets, argparse, sklearn et numpy
+Ce script prend en argument un fichier csv (ou parquet / arrow, voir le module corpus_io) contenant les données sur lesquelles on souhaite train un modèle. Il génère un modèle finetuné sauvegardé sur l'ordinateur.
+Par défaut chaque review est tronquée et complétée à 128 tokens (option --max-length, à redonner à evaluate_model.py) et le modèle est entraîné review par review.
+Avec l'option --dynamic-padding, chaque batch n'est complété que jusqu'à la longueur de sa plus longue review, et avec --group-by-length
+les reviews de longueurs proches sont regroupées dans les mêmes batchs. La taille de batch effective est --batch-size x --gradient-accumulation.
+Le nombre de tokens et de reviews traités par seconde est affiché à la fin de l'entraînement.
+Le découpage en sous-corpus et la tokenization sont sauvegardés sur le disque (option --cache-dir) et partagés avec evaluate_model.py.
+Si le corpus a une colonne group (écrite par augment_data.py, gardée par dedup.py), le découpage se fait par groupe : une review
+et sa rétro-traduction sont toujours dans le même sous-corpus, et le test ne contient jamais la paraphrase d'une review d'entraînement.
+Avec l'option --nproc N, l'entraînement est réparti entre N processus sur le CPU (entraînement distribué data-parallel avec le backend gloo) :
+chaque processus voit une part différente du sous-corpus train, les gradients sont moyennés entre les processus à chaque mise à jour,
+et seul le premier processus sauvegarde les checkpoints et le modèle. La taille de batch effective est alors multipliée par N.
+Un checkpoint est sauvegardé dans ../results (option --output-dir) à chaque epoch, mais seuls les --save-total-limit derniers sont gardés (plus le meilleur).
+A la fin, c'est le meilleur modèle (selon la f-mesure pondérée sur le sous-corpus validation) qui est sauvegardé, et non le dernier.
+Avec --early-stopping-patience P, l'entraînement s'arrête quand la f-mesure n'a pas progressé pendant P epochs, et avec --resume
+un entraînement interrompu reprend depuis son dernier checkpoint (poids, optimiseur et position dans les données).
+L'option --scaling-report entraîne le modèle une fois avec un seul processus puis avec N processus, et compare les durées (accélération et efficacité).
+Ce script utilise les bibliothèques transformers, torch, argparse, json, socket, tempfile, sklearn et numpy, ainsi que les modules tokenized_splits et instrument
+(transformers, torch et sklearn ne sont importés qu'au lancement de l'entraînement, ce qui garde --help et la commande corpus rapides)
 
-Ce script comporte  une fonction :
+Ce script comporte ces fonctions :
     train_model - train un modèle huggingface sur nos données, et sauvegarde ce modèle sur l'ordinateur
+    train_distributed - lance train_model dans plusieurs processus qui s'entraînent ensemble sur le CPU
+    scaling_report - compare l'entraînement avec un seul processus et avec plusieurs processus
 
 """
 
 
-def train_model(data) :
+def train_model(data, batch_size=1, gradient_accumulation=1, dynamic_padding=False, group_by_length=False, max_length=128,
+                model_name="cmarkea/distilcamembert-base-sentiment", cache_dir=CACHE_DIR, epochs=3, save_total_limit=2,
+                load_best=True, early_stopping_patience=None, resume=False, output_dir="../results", model_dir="../bin/model") :
 
     """
     Train un modèle huggingface sur nos données
@@ -24,43 +47,56 @@ def train_model(data) :
     ---
     data : str
     Le chemin vers le fichier contenant nos données
+    batch_size : int
+    Le nombre de reviews par batch
+    gradient_accumulation : int
+    Le nombre de batchs dont on accumule les gradients avant chaque mise à jour (taille de batch effective = batch_size x gradient_accumulation)
+    dynamic_padding : bool
+    Compléter chaque batch jusqu'à la longueur de sa plus longue review au lieu de max_length
+    group_by_length : bool
+    Regrouper les reviews de longueurs proches dans les mêmes batchs
+    max_length : int
+    Le nombre maximum de tokens par review
+    model_name : str
+    Le modèle de départ
+    cache_dir : str
+    Le dossier où sont sauvegardés les sous-corpus tokenizés (None pour ne rien sauvegarder)
+    epochs : int
+    Le nombre maximum d'epochs
+    save_total_limit : int
+    Le nombre de checkpoints gardés dans output_dir (les plus anciens sont supprimés, sauf le meilleur), None pour tout garder
+    load_best : bool
+    Garder à la fin le meilleur modèle selon la f-mesure sur le sous-corpus validation, plutôt que le dernier
+    early_stopping_patience : int
+    Le nombre d'epochs sans amélioration de la f-mesure avant d'arrêter l'entraînement (None pour ne jamais arrêter avant la fin)
+    resume : bool
+    Reprendre depuis le dernier checkpoint de output_dir s'il y en a un
+    output_dir : str
+    Le dossier des checkpoints
+    model_dir : str
+    Le dossier où est sauvegardé le modèle final (avec son tokenizer)
+
+    Returns
+    ---
+    metrics : dict
+    Les mesures de l'entraînement, dont le débit en reviews et en tokens par seconde
 
     """
-    
+
+    from transformers import AutoModelForSequenceClassification, Trainer, AutoTokenizer, TrainingArguments, DataCollatorWithPadding, EarlyStoppingCallback
+    from transformers.trainer_utils import get_last_checkpoint
+    from sklearn.metrics import accuracy_score, f1_score
+
     #Le modèle sur lequel on s'appuie (utilise 5 classes, et est entraîné aussi sur des reviews allociné)
-    model_name = "cmarkea/distilcamembert-base-sentiment"
     tokenizer = AutoTokenizer.from_pretrained(model_name)
     model = AutoModelForSequenceClassification.from_pretrained(model_name)
 
-    #On charge nos données
-    dataset = load_dataset("csv", data_files={data})['train']
-
-    #On découpe notre corpus en 3 : 80% de train, 10% de validation et 10% de test 
-    # seed = 42 afin de pouvoir reproduire le découpage pour l'évaluation sur le sous-corpus test qu'on n'utilise pas ici
-    train_valtest = dataset.train_test_split(test_size = 0.2, seed=42)
-    valtest = train_valtest["test"].train_test_split(test_size=0.5, seed=42)
-
-    train_dataset = train_valtest['train']
-    val_dataset = valtest['train']
-    test_dataset = valtest['test']
-
-    #On tokenize les reviews dans nos données, et on le fait pour les 3 sous-corpus
-    def preprocess_function(dataset):
-        return tokenizer(dataset["reviews"], truncation=True, padding="max_length", max_length=128)
-
-    train_dataset = train_dataset.map(preprocess_function, batched=True)
-    val_dataset = val_dataset.map(preprocess_function, batched=True)
-    test_dataset = test_dataset.map(preprocess_function, batched=True)
+    #On charge nos sous-corpus train (80%), validation (10%) et test (10%), tokenizés et avec les labels (voir le module tokenized_splits)
+    #Le découpage (seed = 42) et la tokenization sont sauvegardés sur le disque et réutilisés par evaluate_model.py, qui évalue sur le sous-corpus test qu'on n'utilise pas ici
+    splits = tokenized_splits(data, tokenizer, max_length, seed=42, cache_dir=cache_dir)
 
-    #On ajoute les labels qui sont les notes
-    #On retire 1à chaque note pour décaler les notes vers la gauche (0 à 4 au lieu de 1 à 5, sinon ça bloque au niveau de la cross-entropie)
-    def add_labels(dataset):
-        dataset["labels"] = dataset["notes"] - 1
-        return dataset
-
-    train_dataset = train_dataset.map(add_labels)
-    val_dataset = val_dataset.map(add_labels)
-    test_dataset = test_dataset.map(add_labels)
+    train_dataset = splits["train"]
+    val_dataset = splits["validation"]
 
     #Les calculs d'accuracy et de f1 pour le sous-corpus val à chaque tour d'epoch
     def compute_metrics(eval_pred):
@@ -71,38 +107,257 @@ def train_model(data) :
             "f1": f1_score(labels, preds, average="weighted")
         }
 
+    #Le regroupement par longueur s'appelle group_by_length jusqu'à transformers 4, et train_sampling_strategy depuis transformers 5
+    if not group_by_length :
+        length_grouping = {}
+    elif "group_by_length" in TrainingArguments.__dataclass_fields__ :
+        length_grouping = {"group_by_length": True}
+    else :
+        length_grouping = {"train_sampling_strategy": "group_by_length"}
+
+    #Quand le script est lancé par train_distributed (ou torchrun), chaque processus connaît son rang et le nombre de processus par les variables d'environnement :
+    #le Trainer répartit alors le sous-corpus train entre les processus et synchronise les gradients, ici sur CPU avec gloo
+    distributed = {"ddp_backend": "gloo", "use_cpu": True} if int(os.environ.get("WORLD_SIZE", 1)) > 1 else {}
+
+    #L'arrêt anticipé compare les f-mesures des epochs : il a besoin du suivi du meilleur modèle
+    if early_stopping_patience is not None :
+        load_best = True
+
     #Training args pour le trainer contenant le nombre d'epochs, le nombre de batchs
-    #Il va train le modèle 3 fois sur le corpus train et évaluer à chaque fois le modèle sur le corpus val
+    #Il va train le modèle au plus epochs fois sur le corpus train et évaluer à chaque fois le modèle sur le corpus val
+    #Un checkpoint par epoch, dont on ne garde que les save_total_limit derniers et le meilleur (f-mesure sur val)
     training_args = TrainingArguments(
-        output_dir="../results",
+        output_dir=output_dir,
         eval_strategy="epoch",
         save_strategy="epoch",
-        per_device_train_batch_size=1,
-        per_device_eval_batch_size=1,
-        num_train_epochs=3,
+        save_total_limit=save_total_limit,
+        load_best_model_at_end=load_best,
+        metric_for_best_model="f1",
+        greater_is_better=True,
+        per_device_train_batch_size=batch_size,
+        per_device_eval_batch_size=batch_size,
+        gradient_accumulation_steps=gradient_accumulation,
+        **length_grouping,
+        **distributed,
+        num_train_epochs=epochs,
         learning_rate=2e-5,
     )
 
+    #Les sous-corpus ne sont pas complétés : c'est le data collator qui complète chaque batch,
+    #jusqu'à sa plus longue review en padding dynamique, et sinon jusqu'à max_length
+    if dynamic_padding :
+        data_collator = DataCollatorWithPadding(tokenizer)
+    else :
+        data_collator = DataCollatorWithPadding(tokenizer, padding="max_length", max_length=max_length)
+
+    callbacks = []
+    if early_stopping_patience is not None :
+        callbacks.append(EarlyStoppingCallback(early_stopping_patience=early_stopping_patience))
+
     #On initialise le trainer avec le modèle, les trainings args, nos sous-corpus train et val et la fonction pour afficher les scores
     trainer = Trainer(
         model=model,
         args=training_args,
         train_dataset=train_dataset,
         eval_dataset=val_dataset,
-        compute_metrics=compute_metrics
+        data_collator=data_collator,
+        compute_metrics=compute_metrics,
+        callbacks=callbacks
     )
 
-    #On lance le train et on sauvegarde les modèles
-    trainer.train()
+    #La loss de classification est déjà une moyenne par review : le Trainer doit la diviser lui-même par le nombre de batchs accumulés,
+    #et ne pas la multiplier par le nombre de processus (ce qu'il fait pour les modèles qui normalisent leur loss par le nombre de tokens)
+    trainer.model_accepts_loss_kwargs = False
+
+    #On lance le train (en reprenant depuis le dernier checkpoint si demandé) et on sauvegarde le modèle
+    checkpoint = get_last_checkpoint(output_dir) if resume and os.path.isdir(output_dir) else None
+    if checkpoint is not None and trainer.is_world_process_zero() :
+        print("Reprise depuis", checkpoint)
+    train_result = trainer.train(resume_from_checkpoint=checkpoint)
+
+    #En distribué, seul le premier processus écrit le modèle (save_model le vérifie lui-même)
+    trainer.save_model(model_dir)
+    if trainer.is_world_process_zero() :
+        tokenizer.save_pretrained(model_dir)
+
+    #On calcule le débit : les tokens comptés sont les vrais tokens des reviews (sans le padding)
+    #(nombre moyen de tokens par review x reviews par seconde, ce qui reste juste après un arrêt anticipé ou une reprise)
+    metrics = train_result.metrics
+    tokens_per_review = sum(sum(mask) for mask in train_dataset["attention_mask"]) / len(train_dataset)
+    metrics["train_tokens_per_second"] = tokens_per_review * metrics["train_samples_per_second"]
+    if trainer.state.best_metric is not None :
+        metrics["best_f1"] = trainer.state.best_metric
+        metrics["best_checkpoint"] = trainer.state.best_model_checkpoint
+
+    if trainer.is_world_process_zero() :
+        print(f"Reviews par seconde : {metrics['train_samples_per_second']:.2f}")
+        print(f"Tokens par seconde : {metrics['train_tokens_per_second']:.1f}")
+        instrument.set_gauge("train_samples_per_second", metrics["train_samples_per_second"], "Reviews d'entraînement par seconde")
+        instrument.set_gauge("train_tokens_per_second", metrics["train_tokens_per_second"], "Tokens d'entraînement (sans le padding) par seconde")
+
+    return metrics
+
+
+def _free_port() :
+    with socket.socket() as s :
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _distributed_worker(rank, world_size, port, threads, data, kwargs, results) :
+    import torch
+
+    #Les variables d'environnement que torchrun donnerait à chaque processus
+    if world_size > 1 :
+        os.environ.update({
+            "MASTER_ADDR": "127.0.0.1",
+            "MASTER_PORT": str(port),
+            "RANK": str(rank),
+            "LOCAL_RANK": str(rank),
+            "WORLD_SIZE": str(world_size),
+        })
+    torch.set_num_threads(threads)
+
+    metrics = train_model(data, **kwargs)
+    if rank == 0 :
+        results.put(metrics)
+
+
+def train_distributed(data, nproc=2, threads=None, **kwargs) :
+
+    """
+    Entraîne le modèle avec plusieurs processus sur le CPU (data-parallel, backend gloo)
+
+    Parameters
+    ---
+    data : str
+    Le chemin vers le fichier contenant nos données
+    nproc : int
+    Le nombre de processus (avec 1, un seul processus sans synchronisation)
+    threads : int
+    Le nombre de threads de calcul par processus (par défaut, les coeurs sont partagés équitablement entre les processus)
+    kwargs
+    Les autres paramètres de train_model
+
+    Returns
+    ---
+    metrics : dict
+    Les mesures de l'entraînement renvoyées par le premier processus
+
+    """
+
+    import torch
+    from transformers import AutoTokenizer
+
+    if threads is None :
+        threads = max(1, (os.cpu_count() or 1) // nproc)
+
+    #On tokenize le corpus une seule fois avant de lancer les processus, qui le relisent ensuite tous depuis le disque
+    cache_dir = kwargs.get("cache_dir", CACHE_DIR)
+    if cache_dir is not None :
+        tokenizer = AutoTokenizer.from_pretrained(kwargs.get("model_name", "cmarkea/distilcamembert-base-sentiment"))
+        tokenized_splits(data, tokenizer, kwargs.get("max_length", 128), seed=42, cache_dir=cache_dir)
+
+    context = torch.multiprocessing.get_context("spawn")
+    results = context.SimpleQueue()
+    torch.multiprocessing.spawn(_distributed_worker, args=(nproc, _free_port(), threads, data, kwargs, results), nprocs=nproc)
+
+    return results.get()
+
+
+def scaling_report(data, nproc, output="../figures/scaling_train.json", **kwargs) :
+
+    """
+    Entraîne le modèle avec un seul processus puis avec nproc processus, et compare les durées
+
+    Parameters
+    ---
+    data : str
+    Le chemin vers le fichier contenant nos données
+    nproc : int
+    Le nombre de processus de l'entraînement distribué
+    output : str
+    Le fichier json où est écrit le rapport (None pour ne pas l'écrire)
+    kwargs
+    Les autres paramètres de train_model (output_dir, model_dir et resume sont ignorés : chaque entraînement écrit ses checkpoints
+    et son modèle dans un dossier temporaire, et repart de zéro)
+
+    Returns
+    ---
+    report : dict
+    Pour chaque nombre de processus, la durée, le débit, l'accélération et l'efficacité (accélération / nombre de processus)
+
+    """
+
+    #Chaque entraînement a ses propres dossiers temporaires : il n'écrase pas le vrai modèle, et ne reprend pas les checkpoints de l'autre
+    kwargs = {key: value for key, value in kwargs.items() if key not in ("output_dir", "model_dir")}
+    kwargs["resume"] = False
+
+    runs = {}
+    for n in (1, nproc) :
+        with tempfile.TemporaryDirectory() as output_dir, tempfile.TemporaryDirectory() as model_dir :
+            #Le processus seul utilise tous les coeurs, comme un entraînement normal
+            threads = (os.cpu_count() or 1) if n == 1 else None
+            runs[n] = train_distributed(data, n, threads=threads, output_dir=output_dir, model_dir=model_dir, **kwargs)
+
+    report = {"cpu_count": os.cpu_count(), "runs": []}
+    for n, metrics in runs.items() :
+        speedup = runs[1]["train_runtime"] / metrics["train_runtime"]
+        report["runs"].append({
+            "nproc": n,
+            "train_runtime": metrics["train_runtime"],
+            "train_samples_per_second": metrics["train_samples_per_second"],
+            "train_tokens_per_second": metrics["train_tokens_per_second"],
+            "train_loss": metrics["train_loss"],
+            "speedup": speedup,
+            "efficiency": speedup / n,
+        })
+
+    print(f"{'processus':<11}{'durée (s)':>11}{'reviews/s':>11}{'accélération':>14}{'efficacité':>12}")
+    for run in report["runs"] :
+        print(f"{run['nproc']:<11}{run['train_runtime']:>11.1f}{run['train_samples_per_second']:>11.2f}{run['speedup']:>14.2f}{run['efficiency']:>12.0%}")
+
+    if output is not None :
+        with open(output, "w", encoding="utf-8") as f :
+            json.dump(report, f, indent=2)
 
-    trainer.save_model("../bin/model")
-    tokenizer.save_pretrained("../bin/model")
+    return report
 
 
 if __name__ == "__main__" :
     my_parser = argparse.ArgumentParser()
-    my_parser.add_argument("data", help="Le fichier csv contenant le jeu de données")
+    my_parser.add_argument("data", help="Le fichier (csv, parquet ou arrow) contenant le jeu de données")
+    my_parser.add_argument("--batch-size", help="Le nombre de reviews par batch, par défaut 1", type=int, default=1)
+    my_parser.add_argument("--gradient-accumulation", help="Le nombre de batchs accumulés avant chaque mise à jour, par défaut 1", type=int, default=1)
+    my_parser.add_argument("--dynamic-padding", help="Compléter chaque batch jusqu'à sa plus longue review plutôt que jusqu'à --max-length tokens", action="store_true")
+    my_parser.add_argument("--max-length", help="Le nombre maximum de tokens par review (à redonner à evaluate_model.py), par défaut 128", type=int, default=128)
+    my_parser.add_argument("--group-by-length", help="Regrouper les reviews de longueurs proches dans les mêmes batchs", action="store_true")
+    my_parser.add_argument("--cache-dir", help=f"Le dossier où sont sauvegardés les sous-corpus tokenizés, par défaut {CACHE_DIR}", default=CACHE_DIR)
+    my_parser.add_argument("--nproc", help="Le nombre de processus qui s'entraînent ensemble sur le CPU, par défaut 1", type=int, default=1)
+    my_parser.add_argument("--threads", help="Le nombre de threads de calcul par processus (par défaut, les coeurs sont partagés entre les processus)", type=int, default=None)
+    my_parser.add_argument("--scaling-report", help="Entraîner avec 1 puis --nproc processus et écrire le rapport dans --scaling-output", action="store_true")
+    my_parser.add_argument("--scaling-output", help="Le fichier json du rapport de --scaling-report, par défaut ../figures/scaling_train.json", default="../figures/scaling_train.json")
+    my_parser.add_argument("--epochs", help="Le nombre maximum d'epochs, par défaut 3", type=int, default=3)
+    my_parser.add_argument("--save-total-limit", help="Le nombre de checkpoints gardés dans --output-dir (plus le meilleur), par défaut 2", type=int, default=2)
+    my_parser.add_argument("--no-load-best", help="Garder le modèle de la dernière epoch plutôt que le meilleur", action="store_true")
+    my_parser.add_argument("--early-stopping-patience", help="Arrêter après ce nombre d'epochs sans amélioration de la f-mesure", type=int, default=None)
+    my_parser.add_argument("--resume", help="Reprendre depuis le dernier checkpoint de --output-dir", action="store_true")
+    my_parser.add_argument("--model-name", help="Le modèle de départ (nom huggingface ou dossier), par défaut cmarkea/distilcamembert-base-sentiment",
+                           default="cmarkea/distilcamembert-base-sentiment")
+    my_parser.add_argument("--output-dir", help="Le dossier des checkpoints, par défaut ../results", default="../results")
+    my_parser.add_argument("--model-dir", help="Le dossier où est sauvegardé le modèle, par défaut ../bin/model", default="../bin/model")
     my_args = my_parser.parse_args()
 
-    train_model(my_args.data)
+    with instrument.stage("train") :
+        train_kwargs = dict(batch_size=my_args.batch_size, gradient_accumulation=my_args.gradient_accumulation, dynamic_padding=my_args.dynamic_padding,
+                            group_by_length=my_args.group_by_length, max_length=my_args.max_length, cache_dir=my_args.cache_dir, epochs=my_args.epochs,
+                            save_total_limit=my_args.save_total_limit, load_best=not my_args.no_load_best,
+                            early_stopping_patience=my_args.early_stopping_patience, resume=my_args.resume, model_dir=my_args.model_dir,
+                            model_name=my_args.model_name, output_dir=my_args.output_dir)
 
+        if my_args.scaling_report :
+            scaling_report(my_args.data, my_args.nproc, my_args.scaling_output, **train_kwargs)
+        elif my_args.nproc > 1 :
+            train_distributed(my_args.data, my_args.nproc, my_args.threads, **train_kwargs)
+        else :
+            train_model(my_args.data, **train_kwargs)
@@ -0,0 +1,486 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from multiprocessing import get_context
+import instrument
+
+"""Pipeline
+
+Ce script enchaîne les étapes du projet, de la récupération des reviews jusqu'à l'évaluation du modèle :
+
+    * crawl - crawl et scrape des reviews (crawler_scraper.py), seulement si une url de départ est donnée dans la configuration
+    * stats - statistiques et visualisations du corpus brut (vis_stats.py)
+    * augment - augmentation des données par rétro-traduction (augment_data.py)
+    * harmonize - harmonisation des classes du corpus augmenté (harmonize_classes.py)
+    * dedup - retrait des doublons et des rétro-traductions trop proches (dedup.py)
+    * train - entraînement du modèle (model_train.py)
+    * evaluate - évaluation du modèle sur le sous-corpus test (evaluate_model.py)
+
+Chaque étape déclare ses fichiers d'entrée et de sortie, ses paramètres et les modules dont elle dépend. Avant de lancer une étape,
+on calcule sa clé : l'empreinte du contenu de ses entrées, de ses paramètres et du code de ses modules. Si la clé est la même
+qu'au dernier lancement réussi et que les sorties existent, l'étape est sautée (comme avec make, mais d'après le contenu et non la date).
+Modifier harmonize_classes.py relance donc harmonize et les étapes qui en dépendent (dedup, train, evaluate) si sa sortie change,
+mais ni le crawl ni les statistiques. Les options qui ne changent pas le résultat (nombre de processus, taille des morceaux...)
+ne font pas partie de la clé.
+
+Les étapes indépendantes (par exemple stats et augment) tournent en parallèle dans des processus séparés (option --jobs),
+et un récapitulatif du temps de chaque étape est affiché à la fin. Avec --metrics-dir, le temps réel, le temps CPU, le maximum de mémoire
+et les débits de chaque étape sont aussi écrits dans <metrics-dir>/<étape>.json et <metrics-dir>/<étape>.prom (voir instrument.py). Les clés des étapes et les empreintes des fichiers sont gardées
+dans --state-dir ; les empreintes ne sont recalculées que pour les fichiers dont la taille ou la date ont changé.
+
+Les paramètres se changent avec un fichier json (option --config) de la forme {"train": {"epochs": 5}, "crawl": {"target": "https://..."}}.
+Le max_length de train est repris par evaluate, sauf s'il est donné aussi pour evaluate.
+
+Ce script utilise les bibliothèques argparse, hashlib, json, concurrent.futures et multiprocessing, ainsi que les modules instrument et ceux de chaque étape
+
+Ce script comporte ces fonctions et classes :
+
+    * Stage - une étape du pipeline
+    * HashCache - empreintes du contenu des fichiers et des dossiers, gardées d'un lancement à l'autre
+    * default_stages - retourne les étapes du projet avec leurs chemins et leurs paramètres par défaut
+    * select_stages - retourne les étapes nécessaires pour obtenir certaines étapes
+    * run_pipeline - lance les étapes qui ne sont pas à jour et retourne le récapitulatif
+
+"""
+
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+STATE_DIR = "../cache/pipeline"
+
+
+class Stage :
+    """Une étape du pipeline
+
+    Parameters
+    ----------
+    name : str
+        Le nom de l'étape
+    function : callable
+        La fonction qui lance l'étape, appelée avec (inputs, outputs, params, options) dans un processus séparé
+    inputs : dict
+        Les fichiers (ou dossiers) lus par l'étape, par nom
+    outputs : dict
+        Les fichiers (ou dossiers) écrits par l'étape, par nom
+    params : dict
+        Les paramètres qui changent le résultat (ils font partie de la clé)
+    options : dict
+        Les options qui ne changent que la façon de calculer (processus, taille des morceaux...) : elles ne font pas partie de la clé
+    modules : list
+        Les modules de src/ dont dépend l'étape (leur code fait partie de la clé)
+    """
+
+    def __init__(self, name: str, function, inputs: dict, outputs: dict, params: dict = None, options: dict = None, modules: list = None) :
+        self.name = name
+        self.function = function
+        self.inputs = inputs
+        self.outputs = outputs
+        self.params = params or {}
+        self.options = options or {}
+        self.modules = modules or []
+
+    def configure(self, values: dict) :
+        """Change des paramètres ou des options de l'étape"""
+
+        for name, value in values.items() :
+            if name in self.params :
+                self.params[name] = value
+            elif name in self.options :
+                self.options[name] = value
+            else :
+                raise ValueError(f"Paramètre inconnu pour l'étape {self.name} : {name} (choix possibles : {', '.join([*self.params, *self.options])})")
+
+
+class HashCache :
+    """Empreintes (blake2b) du contenu des fichiers et des dossiers, recalculées seulement quand la taille ou la date d'un fichier changent
+
+    Parameters
+    ----------
+    path : str
+        Le fichier json où sont gardées les empreintes (None pour ne rien garder)
+    """
+
+    def __init__(self, path: str = None) :
+        self.path = path
+        self.entries = {}
+        if path is not None and os.path.exists(path) :
+            with open(path, encoding="utf-8") as f :
+                self.entries = json.load(f)
+
+    def file_hash(self, path: str) -> str :
+        """L'empreinte du contenu d'un fichier"""
+
+        stat = os.stat(path)
+        key = os.path.abspath(path)
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns :
+            return entry[2]
+
+        digest = hashlib.blake2b(digest_size=16)
+        with open(path, "rb") as f :
+            for block in iter(lambda : f.read(1 << 20), b"") :
+                digest.update(block)
+
+        self.entries[key] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+        return digest.hexdigest()
+
+    def hash(self, path: str) -> str :
+        """L'empreinte d'un fichier, ou d'un dossier (noms relatifs et contenus de tous ses fichiers), ou None s'il n'existe pas"""
+
+        if os.path.isfile(path) :
+            return self.file_hash(path)
+        if not os.path.isdir(path) :
+            return None
+
+        digest = hashlib.blake2b(digest_size=16)
+        for root, dirs, files in os.walk(path) :
+            dirs.sort()
+            for name in sorted(files) :
+                file_path = os.path.join(root, name)
+                digest.update(os.path.relpath(file_path, path).encode("utf-8"))
+                digest.update(self.file_hash(file_path).encode("ascii"))
+
+        return digest.hexdigest()
+
+    def save(self) :
+        if self.path is None :
+            return
+
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f :
+            json.dump(self.entries, f)
+        os.replace(tmp_path, self.path)
+
+
+# les fonctions des étapes, lancées dans un processus séparé : chacune n'importe que les modules dont elle a besoin
+
+def _run_crawl(inputs, outputs, params, options) :
+    from corpus_io import write_rows
+    from crawler_scraper import crawl_scrape, make_session
+
+    session = make_session(options["workers"])
+    reviews = crawl_scrape(params["target"], params["max_crawl"], options["workers"], params["delay"], session, parser=params["parser"])
+    print(write_rows(reviews, outputs["data"]), "reviews récupérées")
+
+
+def _run_stats(inputs, outputs, params, options) :
+    import matplotlib
+
+    # les figures sont enregistrées et non affichées
+    matplotlib.use("Agg")
+    from vis_stats import stats
+
+    stats(inputs["data"], options["chunksize"], options["workers"], os.path.dirname(outputs["summary"]), params["exact_words"])
+
+
+def _run_augment(inputs, outputs, params, options) :
+    from augment_data import augment, make_translator, CachedTranslator, TranslationCache
+    from corpus_io import read_corpus, write_corpus
+
+    translator = make_translator(params["backend"], "fr", params["pivot"])
+    cache = None
+    if options["cache"] is not None :
+        cache = TranslationCache(options["cache"])
+        translator = CachedTranslator(translator, cache, params["backend"])
+
+    write_corpus(augment(read_corpus(inputs["data"]), translator, options["batch_size"], options["workers"]), outputs["data"])
+
+    if cache is not None :
+        print(cache.stats())
+        cache.close()
+
+
+def _run_harmonize(inputs, outputs, params, options) :
+    from harmonize_classes import harmonize_stream
+
+    harmonize_stream(inputs["data"], outputs["data"], options["chunksize"])
+
+
+def _run_dedup(inputs, outputs, params, options) :
+    from corpus_io import read_corpus, write_corpus
+    from dedup import dedup
+
+    data, report = dedup(read_corpus(inputs["data"]), params["threshold"], params["augment_threshold"], params["num_perm"],
+                         params["shingle_size"], options["workers"])
+    write_corpus(data, outputs["data"])
+    with open(outputs["report"], "w", encoding="utf-8") as f :
+        json.dump(report, f, indent=2)
+    print(report["removed"], "lignes retirées,", report["kept"], "gardées")
+
+
+def _run_train(inputs, outputs, params, options) :
+    from model_train import train_model, train_distributed
+
+    kwargs = dict(params, cache_dir=options["cache_dir"], output_dir=options["output_dir"], model_dir=outputs["model"])
+    if options["nproc"] > 1 :
+        train_distributed(inputs["data"], options["nproc"], **kwargs)
+    else :
+        train_model(inputs["data"], **kwargs)
+
+
+def _run_evaluate(inputs, outputs, params, options) :
+    from evaluate_model import evaluate_model
+
+    evaluate_model(inputs["data"], options["batch_size"], outputs["metrics"], outputs["figure"], inputs["model"], options["cache_dir"], params["backend"],
+                   params["max_length"])
+
+
+def default_stages(data_dir: str = "../data", figures_dir: str = "../figures", model_dir: str = "../bin/model") -> list :
+    """Retourne les étapes du projet, avec leurs chemins et leurs paramètres par défaut (ceux des scripts)
+
+    Parameters
+    ----------
+    data_dir : str
+        Le dossier des fichiers du corpus (data.csv, data_augmented.csv, ...)
+    figures_dir : str
+        Le dossier des figures et des rapports
+    model_dir : str
+        Le dossier du modèle entraîné
+
+    Returns
+    -------
+    stages : list
+        Les étapes, dans un ordre où chacune vient après celles dont elle lit les sorties
+    """
+
+    data = os.path.join(data_dir, "data.csv")
+    augmented = os.path.join(data_dir, "data_augmented.csv")
+    harmonized = os.path.join(data_dir, "data_harmonized.csv")
+    deduplicated = os.path.join(data_dir, "data_dedup.csv")
+
+    def figure(name) :
+        return os.path.join(figures_dir, name)
+
+    return [
+        Stage("crawl", _run_crawl, {}, {"data": data},
+              params={"target": None, "max_crawl": 20, "delay": 0.0, "parser": "bs4"}, options={"workers": 1},
+              modules=["crawler_scraper", "extractors", "crawl_state", "corpus_io"]),
+        Stage("stats", _run_stats, {"data": data},
+              {"summary": figure("moyenne_compte_par_notes.txt"), "counts": figure("barplot_nombre_reviews_par_note.png"),
+               "zipf": figure("zipf_law.png"), "boxplot": figure("boxplot_longueur_note.png"), "lengths": figure("barplot_longueur_note.png")},
+              params={"exact_words": True}, options={"chunksize": 50_000, "workers": 1},
+              modules=["vis_stats", "corpus_stats", "corpus_io"]),
+        Stage("augment", _run_augment, {"data": data}, {"data": augmented},
+              params={"backend": "textaugment", "pivot": "en"}, options={"batch_size": 32, "workers": 4, "cache": "../../augment_cache.sqlite"},
+              modules=["augment_data", "corpus_io"]),
+        Stage("harmonize", _run_harmonize, {"data": augmented}, {"data": harmonized},
+              options={"chunksize": 100_000}, modules=["harmonize_classes", "corpus_io"]),
+        Stage("dedup", _run_dedup, {"data": harmonized}, {"data": deduplicated, "report": figure("dedup.json")},
+              params={"threshold": 0.8, "augment_threshold": None, "num_perm": 128, "shingle_size": 3}, options={"workers": 1},
+              modules=["dedup", "corpus_io"]),
+        Stage("train", _run_train, {"data": deduplicated}, {"model": model_dir},
+              params={"batch_size": 1, "gradient_accumulation": 1, "dynamic_padding": False, "group_by_length": False, "max_length": 128,
+                      "model_name": "cmarkea/distilcamembert-base-sentiment", "epochs": 3, "save_total_limit": 2, "load_best": True,
+                      "early_stopping_patience": None},
+              options={"nproc": 1, "cache_dir": "../cache/splits", "output_dir": "../results"},
+              modules=["model_train", "tokenized_splits", "corpus_io"]),
+        Stage("evaluate", _run_evaluate, {"data": deduplicated, "model": model_dir},
+              {"metrics": figure("evaluation_model.json"), "figure": figure("matrice_confusion_model.png")},
+              params={"backend": "pytorch", "max_length": 128}, options={"batch_size": 32, "cache_dir": "../cache/splits"},
+              modules=["evaluate_model", "export_model", "tokenized_splits", "corpus_io"]),
+    ]
+
+
+def _dependencies(stages: list) -> dict :
+    # une étape dépend de celles qui écrivent un des fichiers qu'elle lit
+    producers = {os.path.normpath(path): stage.name for stage in stages for path in stage.outputs.values()}
+    return {stage.name: {producers[os.path.normpath(path)] for path in stage.inputs.values() if os.path.normpath(path) in producers} for stage in stages}
+
+
+def select_stages(stages: list, targets: list) -> list :
+    """Retourne les étapes nécessaires pour obtenir les étapes demandées (elles-mêmes et toutes celles dont elles dépendent)"""
+
+    by_name = {stage.name: stage for stage in stages}
+    unknown = [target for target in targets if target not in by_name]
+    if unknown :
+        raise ValueError(f"Etape inconnue : {', '.join(unknown)} (choix possibles : {', '.join(by_name)})")
+
+    dependencies = _dependencies(stages)
+    needed = set()
+    todo = list(targets)
+    while todo :
+        name = todo.pop()
+        if name not in needed :
+            needed.add(name)
+            todo.extend(dependencies[name])
+
+    return [stage for stage in stages if stage.name in needed]
+
+
+def _stage_key(stage: Stage, hashes: HashCache) -> str :
+    # l'empreinte des entrées, des paramètres et du code de l'étape
+    description = {
+        "params": stage.params,
+        "inputs": {name: hashes.hash(path) for name, path in stage.inputs.items()},
+        "code": {module: hashes.file_hash(os.path.join(SRC_DIR, f"{module}.py")) for module in stage.modules},
+    }
+
+    return hashlib.blake2b(json.dumps(description, sort_keys=True).encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _run_stage(name, function, inputs, outputs, params, options) :
+    # dans le processus de l'étape : on crée les dossiers des sorties puis on lance l'étape,
+    # dont les mesures sont écrites dans <METRICS_DIR>/<étape>.json et .prom (si METRICS_DIR est défini)
+    for path in outputs.values() :
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    instrument.REGISTRY.reset()
+    start = time.perf_counter()
+    with instrument.stage(name) :
+        function(inputs, outputs, params, options)
+    runtime = time.perf_counter() - start
+    instrument.export(job=name)
+
+    return runtime
+
+
+def run_pipeline(stages: list, jobs: int = 2, force: list = (), state_dir: str = STATE_DIR, dry_run: bool = False) -> list :
+    """Lance les étapes qui ne sont pas à jour, en parallèle quand elles sont indépendantes
+
+    Parameters
+    ----------
+    stages : list
+        Les étapes (par exemple renvoyées par default_stages ou select_stages)
+    jobs : int
+        Le nombre d'étapes lancées en même temps
+    force : list
+        Les étapes à relancer même si elles sont à jour
+    state_dir : str
+        Le dossier où sont gardées les clés des étapes et les empreintes des fichiers
+    dry_run : bool
+        Seulement afficher les étapes qui seraient lancées
+
+    Returns
+    -------
+    summary : list
+        Pour chaque étape : son nom, son état (lancée, à jour, échec, bloquée ou à lancer) et sa durée en secondes
+    """
+
+    os.makedirs(state_dir, exist_ok=True)
+    hashes = HashCache(os.path.join(state_dir, "hashes.json"))
+    dependencies = _dependencies(stages)
+    names = {stage.name for stage in stages}
+
+    # les entrées qui ne sont écrites par aucune étape doivent déjà exister
+    for stage in stages :
+        for path in stage.inputs.values() :
+            if not any(path in other.outputs.values() for other in stages) and not os.path.exists(path) :
+                raise FileNotFoundError(f"Entrée manquante pour l'étape {stage.name} : {path}")
+
+    status = {}
+    durations = {}
+    pending = list(stages)
+    running = {}
+
+    def state_path(stage) :
+        return os.path.join(state_dir, f"{stage.name}.json")
+
+    # un processus neuf par étape : le maximum de mémoire résidente mesuré est alors bien celui de l'étape
+    with ProcessPoolExecutor(max(1, jobs), mp_context=get_context("spawn"), max_tasks_per_child=1) as pool :
+        while pending or running :
+            # on lance (ou on saute) toutes les étapes dont les dépendances sont terminées
+            for stage in list(pending) :
+                parents = dependencies[stage.name] & names
+                if any(status.get(parent) in ("échec", "bloquée") for parent in parents) :
+                    status[stage.name] = "bloquée"
+                    pending.remove(stage)
+                    continue
+                if not all(status.get(parent) in ("lancée", "à jour", "à lancer") for parent in parents) :
+                    continue
+
+                pending.remove(stage)
+                key = None if any(status.get(parent) == "à lancer" for parent in parents) else _stage_key(stage, hashes)
+                previous = None
+                if os.path.exists(state_path(stage)) :
+                    with open(state_path(stage), encoding="utf-8") as f :
+                        previous = json.load(f)
+
+                up_to_date = (key is not None and previous is not None and previous["key"] == key and stage.name not in force
+                              and all(os.path.exists(path) for path in stage.outputs.values()))
+                if up_to_date :
+                    status[stage.name] = "à jour"
+                elif dry_run :
+                    status[stage.name] = "à lancer"
+                else :
+                    print(f"[{stage.name}] lancement")
+                    future = pool.submit(_run_stage, stage.name, stage.function, stage.inputs, stage.outputs, stage.params, stage.options)
+                    running[future] = (stage, key)
+
+            if not running :
+                continue
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done :
+                stage, key = running.pop(future)
+                try :
+                    durations[stage.name] = future.result()
+                except Exception as error :
+                    status[stage.name] = "échec"
+                    print(f"[{stage.name}] échec : {error!r}")
+                    continue
+
+                status[stage.name] = "lancée"
+                with open(state_path(stage), "w", encoding="utf-8") as f :
+                    json.dump({"key": key, "seconds": durations[stage.name], "finished": time.time()}, f)
+                print(f"[{stage.name}] terminée en {durations[stage.name]:.1f} s")
+
+    hashes.save()
+
+    return [{"stage": stage.name, "status": status.get(stage.name, "bloquée"), "seconds": durations.get(stage.name)} for stage in stages]
+
+
+if __name__ == "__main__" :
+    my_parser = argparse.ArgumentParser()
+    my_parser.add_argument("stages", help="Les étapes à obtenir (avec celles dont elles dépendent), par défaut toutes", nargs="*")
+    my_parser.add_argument("--config", help="Un fichier json qui change les paramètres des étapes, par exemple {\"train\": {\"epochs\": 5}}", default=None)
+    my_parser.add_argument("--jobs", help="Le nombre d'étapes lancées en même temps, par défaut 2", type=int, default=2)
+    my_parser.add_argument("--force", help="Les étapes à relancer même si elles sont à jour", nargs="*", default=[])
+    my_parser.add_argument("--data-dir", help="Le dossier des fichiers du corpus, par défaut ../data", default="../data")
+    my_parser.add_argument("--figures-dir", help="Le dossier des figures et des rapports, par défaut ../figures", default="../figures")
+    my_parser.add_argument("--model-dir", help="Le dossier du modèle entraîné, par défaut ../bin/model", default="../bin/model")
+    my_parser.add_argument("--state-dir", help=f"Le dossier où sont gardées les clés des étapes, par défaut {STATE_DIR}", default=STATE_DIR)
+    my_parser.add_argument("--dry-run", help="Afficher les étapes qui seraient lancées sans les lancer", action="store_true")
+    my_parser.add_argument("--metrics-dir", help="Le dossier où écrire les mesures de chaque étape (json et Prometheus, voir instrument.py), par défaut aucun",
+                           default=None)
+    my_args = my_parser.parse_args()
+
+    # lu par les processus des étapes, qui héritent des variables d'environnement
+    if my_args.metrics_dir is not None :
+        os.environ["METRICS_DIR"] = os.path.abspath(my_args.metrics_dir)
+
+    stages = default_stages(my_args.data_dir, my_args.figures_dir, my_args.model_dir)
+
+    config = {}
+    if my_args.config is not None :
+        with open(my_args.config, encoding="utf-8") as f :
+            config = json.load(f)
+    by_name = {stage.name: stage for stage in stages}
+    for name, values in config.items() :
+        if name not in by_name :
+            my_parser.error(f"étape inconnue dans --config : {name}")
+        by_name[name].configure(values)
+    # l'évaluation relit le sous-corpus test tokenizé pour l'entraînement : même longueur maximale, sauf si la configuration en donne une
+    if "max_length" not in config.get("evaluate", {}) :
+        by_name["evaluate"].params["max_length"] = by_name["train"].params["max_length"]
+
+    # sans url de départ, le crawl n'est pas une étape : data.csv est une donnée d'entrée
+    if by_name["crawl"].params["target"] is None :
+        stages = [stage for stage in stages if stage.name != "crawl"]
+
+    if my_args.stages :
+        stages = select_stages(stages, my_args.stages)
+
+    start = time.perf_counter()
+    summary = run_pipeline(stages, my_args.jobs, my_args.force, my_args.state_dir, my_args.dry_run)
+    total = time.perf_counter() - start
+
+    print(f"\n{'étape':<12}{'état':<12}{'durée (s)':>10}")
+    for row in summary :
+        seconds = f"{row['seconds']:.1f}" if row["seconds"] is not None else "-"
+        print(f"{row['stage']:<12}{row['status']:<12}{seconds:>10}")
+    print(f"{'total':<24}{total:>10.1f}")
+
+    if any(row["status"] in ("échec", "bloquée") for row in summary) :
+        raise SystemExit(1)
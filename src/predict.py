@@ -0,0 +1,220 @@
+import argparse
+import os
+import time
+from collections import deque
+from multiprocessing import get_context
+import numpy as np
+import pandas as pd
+from corpus_io import iter_corpus, CorpusWriter
+import instrument
+
+"""Prédiction des notes de nouvelles reviews
+
+Ce script applique le modèle finetuné (../bin/model, généré par model_train.py) à un fichier de reviews sans notes
+(csv, parquet ou arrow, avec une colonne reviews) et écrit pour chaque review la note prédite (de 1 à 5) et la probabilité de chaque note.
+
+Le fichier est lu et écrit morceau par morceau (option --chunksize) : la mémoire utilisée ne dépend pas de la taille du fichier.
+Les morceaux sont répartis entre plusieurs processus (option --workers), qui chargent chacun le modèle une seule fois.
+Dans un morceau, les reviews sont triées par longueur puis tokenizées par batchs (option --batch-size), chaque batch n'étant complété
+que jusqu'à sa plus longue review. Les résultats sont écrits dans l'ordre du fichier d'entrée, et le nombre de reviews traitées par seconde est affiché.
+L'option --backend choisit la version du modèle : d'origine (pytorch), ou exportée par export_model.py (int8, onnx ou onnx-int8).
+
+Ce script utilise les bibliothèques argparse, multiprocessing, numpy, pandas et torch, ainsi que les modules corpus_io, export_model et instrument
+
+Ce script comporte ces fonctions :
+
+    * load_model - charge le modèle et son tokenizer
+    * predict_proba - retourne les probabilités de chaque note pour une liste de reviews
+    * predict_chunk - retourne un morceau du fichier avec les notes prédites et leurs probabilités
+    * predict_file - prédit les notes de toutes les reviews d'un fichier
+
+"""
+
+
+MODEL_DIR = "../bin/model"
+
+# le modèle et le tokenizer chargés une seule fois par processus
+_model = None
+_tokenizer = None
+
+
+def load_model(model_dir: str = MODEL_DIR, threads: int = None, backend: str = "pytorch") :
+    """Charge le modèle et son tokenizer, une seule fois par processus
+
+    Parameters
+    ----------
+    model_dir : str
+        Le dossier contenant le modèle généré par model_train.py
+    threads : int
+        Le nombre de threads utilisés pour l'inférence dans ce processus (par défaut, le choix de torch)
+    backend : str
+        La version du modèle (pytorch, int8, onnx ou onnx-int8, voir le module export_model)
+
+    Returns
+    -------
+    model, tokenizer : PreTrainedModel, PreTrainedTokenizer
+        Le modèle et son tokenizer
+    """
+
+    global _model, _tokenizer
+
+    if _model is None :
+        from export_model import load_backend
+
+        _model, _tokenizer = load_backend(model_dir, backend, threads)
+
+    return _model, _tokenizer
+
+
+def predict_proba(model, tokenizer, reviews: list, batch_size: int = 32, max_length: int = 128) -> np.ndarray :
+    """Retourne les probabilités de chaque note pour une liste de reviews
+
+    Parameters
+    ----------
+    model : PreTrainedModel
+        Le modèle
+    tokenizer : PreTrainedTokenizer
+        Son tokenizer
+    reviews : list
+        Les reviews
+    batch_size : int
+        Le nombre de reviews par batch
+    max_length : int
+        Le nombre maximum de tokens par review
+
+    Returns
+    -------
+    probas : np.ndarray
+        Une ligne par review (dans l'ordre donné), une colonne par note
+    """
+
+    import torch
+
+    probas = np.zeros((len(reviews), model.config.num_labels), dtype=np.float32)
+
+    # on trie les reviews par longueur pour que les reviews d'un même batch aient à peu près la même taille (moins de padding)
+    order = np.argsort([len(review) for review in reviews], kind="stable")
+
+    with torch.inference_mode() :
+        for start in range(0, len(reviews), batch_size) :
+            indices = order[start:start + batch_size]
+            batch = tokenizer([reviews[i] for i in indices], truncation=True, padding=True, max_length=max_length, return_tensors="pt")
+            probas[indices] = torch.softmax(model(**batch).logits.float(), dim=-1).numpy()
+
+    return probas
+
+
+def predict_chunk(chunk: pd.DataFrame, batch_size: int = 32, max_length: int = 128) -> pd.DataFrame :
+    """Prédit les notes d'un morceau du fichier avec le modèle chargé par load_model
+
+    Parameters
+    ----------
+    chunk : DataFrame
+        Le morceau, avec une colonne reviews
+    batch_size : int
+        Le nombre de reviews par batch
+    max_length : int
+        Le nombre maximum de tokens par review
+
+    Returns
+    -------
+    predictions : DataFrame
+        Les colonnes reviews, notes (la note prédite, de 1 à 5) et proba_1 à proba_5
+    """
+
+    model, tokenizer = load_model()
+    reviews = chunk["reviews"].fillna("").astype(str).tolist()
+    probas = predict_proba(model, tokenizer, reviews, batch_size, max_length)
+
+    #Les classes du modèle vont de 0 à 4 : on les redécale vers la droite pour retrouver les notes de 1 à 5
+    predictions = pd.DataFrame({"reviews": reviews, "notes": (probas.argmax(axis=1) + 1).astype("int8")})
+    for label in range(probas.shape[1]) :
+        predictions[f"proba_{label + 1}"] = probas[:, label]
+
+    return predictions
+
+
+def _init_worker(model_dir: str, threads: int, backend: str) :
+    load_model(model_dir, threads, backend)
+
+
+def predict_file(input_path: str, output_path: str, model_dir: str = MODEL_DIR, workers: int = 1, batch_size: int = 32,
+                 chunksize: int = 1000, max_length: int = 128, backend: str = "pytorch") -> int :
+    """Prédit les notes de toutes les reviews d'un fichier et les écrit au fur et à mesure
+
+    Parameters
+    ----------
+    input_path : str
+        Le fichier de reviews (csv, parquet ou arrow, avec une colonne reviews)
+    output_path : str
+        Le fichier à écrire (csv, parquet ou arrow)
+    model_dir : str
+        Le dossier contenant le modèle généré par model_train.py
+    workers : int
+        Le nombre de processus qui appliquent le modèle
+    batch_size : int
+        Le nombre de reviews par batch
+    chunksize : int
+        Le nombre de reviews lues et envoyées à un processus à la fois
+    max_length : int
+        Le nombre maximum de tokens par review
+    backend : str
+        La version du modèle (pytorch, int8, onnx ou onnx-int8, voir le module export_model)
+
+    Returns
+    -------
+    count : int
+        Le nombre de reviews traitées
+    """
+
+    chunks = iter_corpus(input_path, chunksize, columns=["reviews"])
+    columns = ["reviews", "notes"] + [f"proba_{label}" for label in range(1, 6)]
+
+    with CorpusWriter(output_path) as writer :
+        if workers <= 1 :
+            load_model(model_dir, backend=backend)
+            for chunk in chunks :
+                writer.write(predict_chunk(chunk, batch_size, max_length))
+        else :
+            # chaque processus a sa part des coeurs, pour que les threads de torch ne se marchent pas dessus
+            threads = max(1, (os.cpu_count() or 1) // workers)
+            context = get_context("spawn")
+            with context.Pool(workers, initializer=_init_worker, initargs=(model_dir, threads, backend)) as pool :
+                # fenêtre glissante : au plus 2 morceaux en attente par processus, et on écrit toujours le plus ancien
+                in_flight = deque()
+                for chunk in chunks :
+                    in_flight.append(pool.apply_async(predict_chunk, (chunk, batch_size, max_length)))
+                    if len(in_flight) >= 2 * workers :
+                        writer.write(in_flight.popleft().get())
+                while in_flight :
+                    writer.write(in_flight.popleft().get())
+
+        if writer.count == 0 :
+            writer.write(pd.DataFrame({column: pd.Series(dtype="float32" if column.startswith("proba") else "str") for column in columns}))
+
+    return writer.count
+
+
+if __name__ == "__main__" :
+    my_parser = argparse.ArgumentParser()
+    my_parser.add_argument("data", help="Le fichier (csv, parquet ou arrow) contenant les reviews à noter")
+    my_parser.add_argument("--output", help="Le fichier de sortie (csv, parquet ou arrow), par défaut ../../predictions.csv", default="../../predictions.csv")
+    my_parser.add_argument("--model", help=f"Le dossier contenant le modèle, par défaut {MODEL_DIR}", default=MODEL_DIR)
+    my_parser.add_argument("--workers", help="Le nombre de processus qui appliquent le modèle, par défaut 1", type=int, default=1)
+    my_parser.add_argument("--batch-size", help="Le nombre de reviews par batch, par défaut 32", type=int, default=32)
+    my_parser.add_argument("--chunksize", help="Le nombre de reviews envoyées à un processus à la fois, par défaut 1000", type=int, default=1000)
+    my_parser.add_argument("--max-length", help="Le nombre maximum de tokens par review, par défaut 128", type=int, default=128)
+    my_parser.add_argument("--backend", help="La version du modèle (pytorch, int8, onnx ou onnx-int8, voir export_model.py), par défaut pytorch", default="pytorch")
+    my_args = my_parser.parse_args()
+
+    with instrument.stage("predict") :
+        start = time.perf_counter()
+        count = predict_file(my_args.data, my_args.output, my_args.model, my_args.workers, my_args.batch_size, my_args.chunksize, my_args.max_length,
+                             my_args.backend)
+        runtime = time.perf_counter() - start
+
+        print(count, "reviews notées dans", my_args.output)
+        print(f"Reviews par seconde : {count / runtime if runtime > 0 else 0.0:.2f}")
+        instrument.inc("predict_reviews_total", count, "Reviews notées")
+        instrument.set_gauge("predict_reviews_per_second", count / runtime if runtime > 0 else 0.0, "Reviews notées par seconde",
+                             backend=my_args.backend)
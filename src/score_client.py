@@ -0,0 +1,103 @@
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from corpus_io import read_corpus
+
+"""Client de test du service de notation
+
+Ce script envoie des reviews au serveur lancé par serve_model.py, depuis plusieurs threads en même temps (option --concurrency),
+pour vérifier que le service répond et mesurer son débit. Les reviews viennent d'un fichier du corpus (csv, parquet ou arrow) :
+chaque requête contient une review (ou --per-request reviews), et le fichier est parcouru --repeat fois (à partir du deuxième passage,
+les réponses viennent du cache du serveur). A la fin, il affiche le débit côté client et les statistiques du serveur (route /stats).
+
+Ce script utilise les bibliothèques argparse, json, requests et concurrent.futures, ainsi que le module corpus_io
+
+Ce script comporte ces fonctions :
+
+    * score - envoie des reviews au serveur et retourne ses prédictions
+    * run_client - envoie toutes les reviews d'une liste avec plusieurs threads
+
+"""
+
+
+def score(url: str, reviews: list, session: requests.Session = None) -> list :
+    """Envoie des reviews au serveur et retourne ses prédictions
+
+    Parameters
+    ----------
+    url : str
+        L'adresse du serveur (par exemple http://127.0.0.1:8000)
+    reviews : list
+        Les reviews à noter
+    session : Session
+        La session HTTP à réutiliser (optionnelle)
+
+    Returns
+    -------
+    predictions : list
+        Pour chaque review, un dictionnaire avec la note prédite (note) et les probabilités de chaque note (probas)
+    """
+
+    response = (session or requests).post(f"{url}/predict", json={"reviews": reviews}, timeout=60)
+    response.raise_for_status()
+
+    return response.json()["predictions"]
+
+
+def run_client(url: str, reviews: list, concurrency: int = 8, per_request: int = 1) -> dict :
+    """Envoie toutes les reviews au serveur, depuis plusieurs threads en même temps
+
+    Parameters
+    ----------
+    url : str
+        L'adresse du serveur
+    reviews : list
+        Les reviews à noter
+    concurrency : int
+        Le nombre de requêtes envoyées en même temps
+    per_request : int
+        Le nombre de reviews par requête
+
+    Returns
+    -------
+    results : dict
+        Le nombre de requêtes et de reviews, la durée et le débit
+    """
+
+    requests_reviews = [reviews[i:i + per_request] for i in range(0, len(reviews), per_request)]
+    session = requests.Session()
+    session.mount("http://", requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=concurrency))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool :
+        for predictions in pool.map(lambda batch : score(url, batch, session), requests_reviews) :
+            pass
+    runtime = time.perf_counter() - start
+
+    return {
+        "requests": len(requests_reviews),
+        "reviews": len(reviews),
+        "runtime": runtime,
+        "reviews_per_second": len(reviews) / runtime if runtime > 0 else 0.0,
+    }
+
+
+if __name__ == "__main__" :
+    my_parser = argparse.ArgumentParser()
+    my_parser.add_argument("data", help="Le fichier (csv, parquet ou arrow) contenant les reviews à envoyer")
+    my_parser.add_argument("--url", help="L'adresse du serveur, par défaut http://127.0.0.1:8000", default="http://127.0.0.1:8000")
+    my_parser.add_argument("--concurrency", help="Le nombre de requêtes envoyées en même temps, par défaut 8", type=int, default=8)
+    my_parser.add_argument("--per-request", help="Le nombre de reviews par requête, par défaut 1", type=int, default=1)
+    my_parser.add_argument("--limit", help="Le nombre maximum de reviews lues dans le fichier", type=int, default=None)
+    my_parser.add_argument("--repeat", help="Le nombre de passages sur les reviews, par défaut 1", type=int, default=1)
+    my_args = my_parser.parse_args()
+
+    reviews = read_corpus(my_args.data, columns=["reviews"])["reviews"].fillna("").astype(str).tolist()[:my_args.limit]
+
+    for i in range(my_args.repeat) :
+        results = run_client(my_args.url, reviews, my_args.concurrency, my_args.per_request)
+        print(f"Passage {i + 1} : {results['requests']} requêtes, {results['reviews_per_second']:.2f} reviews par seconde")
+
+    print(json.dumps(requests.get(f"{my_args.url}/stats", timeout=10).json(), indent=2, ensure_ascii=False))
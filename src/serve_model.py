@@ -0,0 +1,337 @@
+import argparse
+import json
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from queue import Queue, Empty
+import numpy as np
+from predict import load_model, predict_proba, MODEL_DIR
+
+"""Service de notation des reviews
+
+Ce script lance un serveur HTTP local qui charge le modèle finetuné (../bin/model) une seule fois et note les reviews qu'on lui envoie.
+
+Les requêtes qui arrivent en même temps sont regroupées en micro-batchs : un batch part dès qu'il contient --max-batch-size reviews,
+ou au plus tard --max-wait-ms millisecondes après l'arrivée de sa première review. Les reviews déjà notées sont servies depuis
+un cache LRU (option --cache-size) sans repasser par le modèle. Tout tourne sur CPU, avec la version du modèle choisie par --backend
+(d'origine, ou exportée par export_model.py).
+
+Routes :
+
+    * POST /predict - corps json {"reviews": ["...", ...]} (ou {"review": "..."}), répond {"predictions": [{"note": 4, "probas": [...]}, ...]}
+      (400 et {"error": "..."} pour une requête invalide, 500 et {"error": "..."} si le modèle échoue)
+    * GET /stats - latences (p50, p99 et histogramme), nombre d'erreurs, histogramme des tailles de batchs et compteurs du cache
+    * GET /health - répond {"status": "ok"} quand le modèle est chargé
+
+Le script score_client.py envoie des requêtes simultanées à ce serveur pour le tester.
+
+Ce script utilise les bibliothèques argparse, json, threading, queue, http.server et numpy, ainsi que le module predict
+
+Ce script comporte ces classes et fonctions :
+
+    * LRUCache - cache des probabilités déjà calculées, limité en nombre de reviews
+    * ServingStats - histogrammes des latences et des tailles de batchs
+    * MicroBatcher - regroupe les reviews reçues en batchs et les fait noter par le modèle
+    * make_server - crée le serveur HTTP
+
+"""
+
+
+# bornes (en millisecondes) des cases de l'histogramme des latences
+LATENCY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+
+class LRUCache :
+    """Cache des probabilités par texte de review, qui oublie les reviews les moins récemment demandées
+
+    Parameters
+    ----------
+    max_entries : int
+        Le nombre maximum de reviews gardées (0 pour désactiver le cache)
+    """
+
+    def __init__(self, max_entries: int = 10_000) :
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, review: str) :
+        """Retourne les probabilités d'une review si elle est dans le cache, None sinon"""
+
+        with self._lock :
+            probas = self._entries.get(review)
+            if probas is None :
+                self.misses += 1
+                return None
+            self._entries.move_to_end(review)
+            self.hits += 1
+            return probas
+
+    def put(self, review: str, probas) :
+        """Ajoute les probabilités d'une review, en oubliant la plus ancienne si le cache est plein"""
+
+        if self.max_entries <= 0 :
+            return
+
+        with self._lock :
+            self._entries[review] = probas
+            self._entries.move_to_end(review)
+            while len(self._entries) > self.max_entries :
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict :
+        with self._lock :
+            return {"entries": len(self._entries), "max_entries": self.max_entries, "hits": self.hits, "misses": self.misses}
+
+
+class ServingStats :
+    """Histogrammes des latences des requêtes et des tailles des batchs envoyés au modèle
+
+    Parameters
+    ----------
+    window : int
+        Le nombre de latences récentes gardées pour calculer les percentiles
+    """
+
+    def __init__(self, window: int = 10_000) :
+        self.requests = 0
+        self.errors = 0
+        self._latencies = deque(maxlen=window)
+        self._latency_counts = Counter()
+        self._batch_sizes = Counter()
+        self._lock = threading.Lock()
+
+    def record_latency(self, seconds: float) :
+        milliseconds = seconds * 1000
+        bucket = next((bound for bound in LATENCY_BUCKETS if milliseconds <= bound), "inf")
+        with self._lock :
+            self.requests += 1
+            self._latencies.append(milliseconds)
+            self._latency_counts[bucket] += 1
+
+    def record_error(self) :
+        with self._lock :
+            self.errors += 1
+
+    def record_batch(self, size: int) :
+        with self._lock :
+            self._batch_sizes[size] += 1
+
+    def snapshot(self) -> dict :
+        """Retourne les percentiles de latence (en ms) et les histogrammes"""
+
+        with self._lock :
+            latencies = np.array(self._latencies)
+            latency_counts = dict(self._latency_counts)
+            batch_sizes = dict(self._batch_sizes)
+            requests = self.requests
+            errors = self.errors
+
+        percentiles = {}
+        if len(latencies) :
+            for name, q in (("p50", 50), ("p90", 90), ("p99", 99)) :
+                percentiles[name] = float(np.percentile(latencies, q))
+
+        batches = sum(batch_sizes.values())
+        return {
+            "requests": requests,
+            "errors": errors,
+            "latency_ms": percentiles,
+            "latency_histogram_ms": {f"<={bucket}" : latency_counts.get(bucket, 0) for bucket in LATENCY_BUCKETS + ("inf",)},
+            "batches": batches,
+            "mean_batch_size": sum(size * count for size, count in batch_sizes.items()) / batches if batches else 0.0,
+            "batch_size_histogram": {str(size) : batch_sizes[size] for size in sorted(batch_sizes)},
+        }
+
+
+class MicroBatcher :
+    """Regroupe les reviews reçues par toutes les requêtes en batchs, que le modèle note dans un thread à part
+
+    Parameters
+    ----------
+    model : PreTrainedModel
+        Le modèle
+    tokenizer : PreTrainedTokenizer
+        Son tokenizer
+    max_batch_size : int
+        Le nombre maximum de reviews par batch
+    max_wait : float
+        Le temps maximum (en secondes) pendant lequel la première review d'un batch attend que d'autres arrivent
+    cache : LRUCache
+        Le cache des reviews déjà notées
+    stats : ServingStats
+        Les statistiques du service
+    max_length : int
+        Le nombre maximum de tokens par review
+    """
+
+    def __init__(self, model, tokenizer, max_batch_size: int = 32, max_wait: float = 0.01, cache: LRUCache = None,
+                 stats: ServingStats = None, max_length: int = 128) :
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.max_length = max_length
+        self.cache = cache if cache is not None else LRUCache(0)
+        self.stats = stats if stats is not None else ServingStats()
+        self._queue = Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, review: str) -> Future :
+        """Demande la note d'une review, et retourne un Future qui recevra ses probabilités"""
+
+        future = Future()
+        probas = self.cache.get(review)
+        if probas is not None :
+            future.set_result(probas)
+        else :
+            self._queue.put((review, future))
+
+        return future
+
+    def predict(self, reviews: list) -> list :
+        """Retourne les probabilités de chaque review, en attendant que leurs batchs soient passés dans le modèle"""
+
+        futures = [self.submit(review) for review in reviews]
+        return [future.result() for future in futures]
+
+    def _next_batch(self) -> list :
+        # on attend la première review, puis on complète le batch jusqu'à sa taille maximum ou jusqu'à la fin de l'attente
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size :
+            remaining = deadline - time.monotonic()
+            try :
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except Empty :
+                break
+
+        return batch
+
+    def _run(self) :
+        while True :
+            batch = self._next_batch()
+
+            # une même review demandée plusieurs fois dans le batch n'est notée qu'une fois
+            waiting = {}
+            for review, future in batch :
+                waiting.setdefault(review, []).append(future)
+            reviews = list(waiting)
+
+            try :
+                probas = predict_proba(self.model, self.tokenizer, reviews, len(reviews), self.max_length)
+            except Exception as e :
+                for futures in waiting.values() :
+                    for future in futures :
+                        future.set_exception(e)
+                continue
+
+            self.stats.record_batch(len(reviews))
+            for review, review_probas in zip(reviews, probas) :
+                review_probas = review_probas.tolist()
+                self.cache.put(review, review_probas)
+                for future in waiting[review] :
+                    future.set_result(review_probas)
+
+
+def make_server(batcher: MicroBatcher, host: str = "127.0.0.1", port: int = 8000) -> ThreadingHTTPServer :
+    """Crée le serveur HTTP qui transmet les reviews reçues au MicroBatcher
+
+    Parameters
+    ----------
+    batcher : MicroBatcher
+        Le MicroBatcher qui note les reviews
+    host : str
+        L'adresse d'écoute
+    port : int
+        Le port d'écoute (0 pour un port libre choisi par le système)
+
+    Returns
+    -------
+    server : ThreadingHTTPServer
+        Le serveur, à lancer avec serve_forever()
+    """
+
+    class Handler(BaseHTTPRequestHandler) :
+
+        def _send_json(self, status: int, content: dict) :
+            body = json.dumps(content, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self) :
+            if self.path == "/health" :
+                self._send_json(200, {"status": "ok"})
+            elif self.path == "/stats" :
+                stats = batcher.stats.snapshot()
+                stats["cache"] = batcher.cache.stats()
+                self._send_json(200, stats)
+            else :
+                self._send_json(404, {"error": f"route inconnue : {self.path}"})
+
+        def do_POST(self) :
+            if self.path != "/predict" :
+                self._send_json(404, {"error": f"route inconnue : {self.path}"})
+                return
+
+            start = time.perf_counter()
+            try :
+                content = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                reviews = content["reviews"] if "reviews" in content else [content["review"]]
+                if not all(isinstance(review, str) for review in reviews) :
+                    raise ValueError("les reviews doivent être des chaînes de caractères")
+            except (ValueError, KeyError, TypeError) as e :
+                self._send_json(400, {"error": f"requête invalide : {e}"})
+                return
+
+            try :
+                probas = batcher.predict(reviews)
+            except Exception as e :
+                # erreur du modèle ou du tokenizer (mémoire, modèle abîmé...) : le client reçoit une réponse plutôt qu'une connexion coupée
+                batcher.stats.record_error()
+                self._send_json(500, {"error": f"erreur du modèle : {e!r}"})
+                return
+
+            #Les classes du modèle vont de 0 à 4 : on les redécale vers la droite pour retrouver les notes de 1 à 5
+            predictions = [{"note": int(np.argmax(review_probas)) + 1, "probas": review_probas} for review_probas in probas]
+            self._send_json(200, {"predictions": predictions})
+            batcher.stats.record_latency(time.perf_counter() - start)
+
+        def log_message(self, format, *args) :
+            # pas une ligne de log par requête
+            pass
+
+    return ThreadingHTTPServer((host, port), Handler)
+
+
+if __name__ == "__main__" :
+    my_parser = argparse.ArgumentParser()
+    my_parser.add_argument("--host", help="L'adresse d'écoute, par défaut 127.0.0.1", default="127.0.0.1")
+    my_parser.add_argument("--port", help="Le port d'écoute, par défaut 8000", type=int, default=8000)
+    my_parser.add_argument("--model", help=f"Le dossier contenant le modèle, par défaut {MODEL_DIR}", default=MODEL_DIR)
+    my_parser.add_argument("--max-batch-size", help="Le nombre maximum de reviews par batch, par défaut 32", type=int, default=32)
+    my_parser.add_argument("--max-wait-ms", help="L'attente maximum avant d'envoyer un batch incomplet, en millisecondes, par défaut 10", type=float, default=10.0)
+    my_parser.add_argument("--cache-size", help="Le nombre de reviews gardées dans le cache, par défaut 10000 (0 pour le désactiver)", type=int, default=10_000)
+    my_parser.add_argument("--threads", help="Le nombre de threads utilisés par torch (par défaut, le choix de torch)", type=int, default=None)
+    my_parser.add_argument("--backend", help="La version du modèle (pytorch, int8, onnx ou onnx-int8, voir export_model.py), par défaut pytorch", default="pytorch")
+    my_args = my_parser.parse_args()
+
+    model, tokenizer = load_model(my_args.model, my_args.threads, my_args.backend)
+    batcher = MicroBatcher(model, tokenizer, my_args.max_batch_size, my_args.max_wait_ms / 1000, LRUCache(my_args.cache_size), ServingStats())
+    server = make_server(batcher, my_args.host, my_args.port)
+
+    print(f"Serveur prêt sur http://{my_args.host}:{server.server_address[1]}", flush=True)
+    try :
+        server.serve_forever()
+    except KeyboardInterrupt :
+        pass
+    finally :
+        server.server_close()
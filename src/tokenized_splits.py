@@ -0,0 +1,252 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+from corpus_io import load_dataset
+
+"""Sous-corpus tokenizés
+
+Ce module découpe le corpus en sous-corpus train (80%), validation (10%) et test (10%), tokenize les reviews et ajoute
+les labels (notes décalées de 1 vers la gauche), puis sauvegarde le résultat sur le disque au format Arrow.
+Les reviews sont seulement tronquées à la longueur maximale, sans padding : c'est au moment de former les batchs qu'elles
+sont complétées (jusqu'à la longueur maximale ou jusqu'à la plus longue review du batch), si bien que l'entraînement
+avec ou sans padding dynamique et l'évaluation relisent tous les mêmes sous-corpus.
+Les scripts model_train.py et evaluate_model.py passent tous les deux par ce module : le découpage et la tokenization
+ne sont faits qu'une seule fois, les fois suivantes les sous-corpus sont relus par memory-mapping (en quelques secondes),
+et le sous-corpus test utilisé pour l'évaluation est forcément celui que l'entraînement a mis de côté.
+
+Les sous-corpus sont rangés dans un dossier dont le nom est une clé calculée à partir :
+
+    * du contenu du fichier de données (et non de son nom ou de sa date)
+    * du tokenizer (son vocabulaire et ses règles, et non le dossier d'où il est chargé)
+    * de la longueur maximale et du seed du découpage
+
+Si l'un de ces éléments change, une nouvelle version est calculée.
+
+Si le corpus a une colonne group (écrite par augment_data.py et gardée par dedup.py), le découpage se fait par groupe :
+une review et sa rétro-traduction sont toujours dans le même sous-corpus, pour que le test ne contienne pas la paraphrase
+d'une review vue à l'entraînement. Sans cette colonne, le découpage est le même qu'avant.
+
+Lancé comme script, il prépare les sous-corpus à l'avance pour un fichier de données et un tokenizer.
+
+Ce module utilise les bibliothèques hashlib, json, shutil, numpy et argparse, les bibliothèques transformers et datasets, ainsi que le module corpus_io
+
+Ce module comporte ces fonctions :
+
+    * file_hash - retourne l'empreinte du contenu d'un fichier
+    * tokenizer_hash - retourne l'empreinte d'un tokenizer
+    * split_key - retourne la clé des sous-corpus pour un fichier, un tokenizer et des paramètres
+    * split_dataset - découpe un Dataset en sous-corpus train, validation et test (par groupe s'il y a une colonne group)
+    * tokenized_splits - retourne les sous-corpus tokenizés, depuis le cache ou en les calculant
+
+"""
+
+
+CACHE_DIR = "../cache/splits"
+GROUP_COLUMN = "group"
+
+
+def file_hash(path: str, block_size: int = 1 << 20) -> str :
+    """Calcule l'empreinte (blake2b) du contenu d'un fichier, lu par blocs
+
+    Parameters
+    ----------
+    path : str
+        Le chemin du fichier
+    block_size : int
+        La taille des blocs lus à la fois
+
+    Returns
+    -------
+    digest : str
+        L'empreinte en hexadécimal
+    """
+
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f :
+        for block in iter(lambda : f.read(block_size), b"") :
+            digest.update(block)
+
+    return digest.hexdigest()
+
+
+def tokenizer_hash(tokenizer) -> str :
+    """Calcule l'empreinte d'un tokenizer à partir de son vocabulaire et de ses règles
+
+    Le même tokenizer chargé depuis le hub ou depuis ../bin/model (où model_train.py le sauvegarde) a la même empreinte.
+
+    Parameters
+    ----------
+    tokenizer : PreTrainedTokenizer
+        Le tokenizer
+
+    Returns
+    -------
+    digest : str
+        L'empreinte en hexadécimal
+    """
+
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(type(tokenizer).__name__.encode())
+
+    backend = getattr(tokenizer, "backend_tokenizer", None)
+    if backend is not None :
+        # on retire les réglages de troncature et de padding, que le tokenizer modifie lui-même à chaque appel
+        description = json.loads(backend.to_str())
+        description.pop("truncation", None)
+        description.pop("padding", None)
+        digest.update(json.dumps(description, sort_keys=True).encode())
+    else :
+        for token, index in sorted(tokenizer.get_vocab().items()) :
+            digest.update(f"{token}\t{index}\n".encode())
+
+    digest.update(str(tokenizer.padding_side).encode())
+
+    return digest.hexdigest()
+
+
+def split_key(data: str, tokenizer, max_length: int = 128, seed: int = 42) -> str :
+    """Retourne la clé sous laquelle les sous-corpus sont rangés
+
+    Parameters
+    ----------
+    data : str
+        Le chemin vers le fichier contenant nos données
+    tokenizer : PreTrainedTokenizer
+        Le tokenizer
+    max_length : int
+        Le nombre maximum de tokens par review
+    seed : int
+        Le seed du découpage
+
+    Returns
+    -------
+    key : str
+        La clé (un nom de dossier)
+    """
+
+    parts = [file_hash(data), tokenizer_hash(tokenizer), str(max_length), str(seed)]
+
+    return hashlib.blake2b("|".join(parts).encode(), digest_size=16).hexdigest()
+
+
+def split_dataset(dataset, seed: int = 42) :
+    """Découpe un Dataset en 3 : 80% de train, 10% de validation et 10% de test
+
+    Si le Dataset a une colonne group, ce sont les groupes qui sont répartis (80%, 10% et 10% des groupes) :
+    toutes les lignes d'un groupe sont dans le même sous-corpus.
+
+    Parameters
+    ----------
+    dataset : Dataset
+        Le corpus
+    seed : int
+        Le seed des deux découpages
+
+    Returns
+    -------
+    splits : DatasetDict
+        Les sous-corpus train, validation et test
+    """
+
+    import datasets
+
+    if GROUP_COLUMN in dataset.column_names :
+        groups = np.asarray(dataset[GROUP_COLUMN])
+        unique = np.unique(groups)
+        np.random.default_rng(seed).shuffle(unique)
+
+        n_train = int(round(len(unique) * 0.8))
+        n_validation = (len(unique) - n_train) // 2
+        parts = {"train": unique[:n_train], "validation": unique[n_train:n_train + n_validation], "test": unique[n_train + n_validation:]}
+
+        return datasets.DatasetDict({name: dataset.select(np.flatnonzero(np.isin(groups, part))) for name, part in parts.items()})
+
+    train_valtest = dataset.train_test_split(test_size=0.2, seed=seed)
+    valtest = train_valtest["test"].train_test_split(test_size=0.5, seed=seed)
+
+    return datasets.DatasetDict({
+        "train": train_valtest["train"],
+        "validation": valtest["train"],
+        "test": valtest["test"],
+    })
+
+
+def tokenized_splits(data: str, tokenizer, max_length: int = 128, seed: int = 42, cache_dir: str = CACHE_DIR) :
+    """Retourne les sous-corpus train, validation et test tokenizés et labellisés
+
+    S'ils ont déjà été calculés pour les mêmes données, le même tokenizer et les mêmes paramètres, ils sont relus depuis
+    le disque (memory-mappés) ; sinon ils sont calculés puis sauvegardés.
+
+    Parameters
+    ----------
+    data : str
+        Le chemin vers le fichier contenant nos données (csv, parquet ou arrow)
+    tokenizer : PreTrainedTokenizer
+        Le tokenizer
+    max_length : int
+        Le nombre maximum de tokens par review
+    seed : int
+        Le seed du découpage
+    cache_dir : str
+        Le dossier où sont rangés les sous-corpus (None pour ne rien sauvegarder)
+
+    Returns
+    -------
+    splits : DatasetDict
+        Les sous-corpus train, validation et test, avec les colonnes reviews, notes, input_ids, attention_mask et labels
+        (input_ids et attention_mask sans padding, à compléter batch par batch)
+    """
+
+    import datasets
+
+    if cache_dir is not None :
+        path = os.path.join(cache_dir, split_key(data, tokenizer, max_length, seed))
+        if os.path.isdir(path) :
+            return datasets.load_from_disk(path)
+
+    splits = split_dataset(load_dataset(data), seed)
+
+    #On tokenize les reviews (tronquées mais pas complétées, le padding est fait batch par batch) et on ajoute les labels qui sont les notes
+    #On retire 1 à chaque note pour décaler les notes vers la gauche (0 à 4 au lieu de 1 à 5, sinon ça bloque au niveau de la cross-entropie)
+    def preprocess_function(batch) :
+        encoded = tokenizer(batch["reviews"], truncation=True, max_length=max_length)
+        encoded["labels"] = [note - 1 for note in batch["notes"]]
+        return encoded
+
+    splits = splits.map(preprocess_function, batched=True, load_from_cache_file=False)
+
+    if cache_dir is None :
+        return splits
+
+    # on écrit dans un dossier temporaire puis on le renomme, pour qu'un calcul interrompu ne laisse pas un cache incomplet
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    splits.save_to_disk(tmp_path)
+    try :
+        os.replace(tmp_path, path)
+    except OSError :
+        # un autre processus a sauvegardé les mêmes sous-corpus entre temps
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+    return datasets.load_from_disk(path)
+
+
+if __name__ == "__main__" :
+    my_parser = argparse.ArgumentParser()
+    my_parser.add_argument("data", help="Le fichier (csv, parquet ou arrow) contenant le jeu de données")
+    my_parser.add_argument("--model", help="Le modèle dont on utilise le tokenizer, par défaut cmarkea/distilcamembert-base-sentiment", default="cmarkea/distilcamembert-base-sentiment")
+    my_parser.add_argument("--max-length", help="Le nombre maximum de tokens par review, par défaut 128", type=int, default=128)
+    my_parser.add_argument("--seed", help="Le seed du découpage, par défaut 42", type=int, default=42)
+    my_parser.add_argument("--cache-dir", help=f"Le dossier où sont rangés les sous-corpus, par défaut {CACHE_DIR}", default=CACHE_DIR)
+    my_args = my_parser.parse_args()
+
+    from transformers import AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(my_args.model)
+    splits = tokenized_splits(my_args.data, tokenizer, my_args.max_length, my_args.seed, my_args.cache_dir)
+
+    print(os.path.join(my_args.cache_dir, split_key(my_args.data, tokenizer, my_args.max_length, my_args.seed)))
+    for name, split in splits.items() :
+        print(name, ":", split.num_rows, "reviews")
@@ -1,120 +1,176 @@
 import pandas as pd
 import argparse
-import matplotlib.pyplot as plt
-import seaborn as sns
-from collections import Counter
-from nltk.corpus import stopwords
+import os
+from corpus_stats import CorpusStats, chunk_stats, french_stopwords, update_stats
+import instrument
 
 """Visualisation et stats
 
-Ce script prend en argument un fichier csv sur lequel on souhaite réaliser des statistiques. 
-Ce script génère des visualisations grâce à matplotlib qu'on peut sauvegarder.
+Ce script prend en argument un fichier csv (ou parquet / arrow, voir le module corpus_io) sur lequel on souhaite réaliser des statistiques,
+ou directement un fichier de statistiques (data.csv.stats.json) sauvegardé par le module corpus_stats.
+Ce script génère des visualisations grâce à matplotlib qu'on peut sauvegarder (option --figures pour les enregistrer directement dans un dossier).
+Les statistiques sont calculées par le module corpus_stats, morceau par morceau et éventuellement dans plusieurs processus (options --chunksize et --workers) :
+la mémoire utilisée dépend du vocabulaire du corpus et non de sa taille.
+Les statistiques sont sauvegardées à côté du corpus et mises à jour seulement avec les reviews ajoutées depuis la dernière fois :
+si le corpus n'a pas changé, les figures et le fichier txt sont régénérés sans relire le corpus.
 
-Ce script utilise les bibliothèques pandas, argparse, matplotlib, seaborn, collections et nltk
+Ce script utilise les bibliothèques pandas, argparse, matplotlib et seaborn, ainsi que les modules corpus_stats et instrument
+(matplotlib et seaborn ne sont importés que pour tracer les figures, ce qui garde --help et la commande corpus rapides)
 
-Ce script comporte  une fonction :
+Ce script comporte ces fonctions :
     stats - permet de calculer des moyennes sur le corpus, ainsi que d'autres diverses visualisations
+    write_summary - écrit les moyennes et le nombre de reviews par note dans un fichier txt
+    plot_stats - génère les visualisations à partir des statistiques du corpus
 
 """
 
 
-def stats(data: pd.DataFrame) :
+def write_summary(corpus_stats: CorpusStats, path="../figures/moyenne_compte_par_notes.txt") :
 
     """
-    Réalise différentes statistiques et visualisations sur un jeu de données de type DataFrame
+    Ecrit la longueur moyenne des reviews, la note moyenne et le nombre de reviews par note dans un fichier txt
 
     Parameters
     ---
-    data : Dataframe
-    Le jeu de données sur lequel on souhaite réaliser des statistiques
-    
+    corpus_stats : CorpusStats
+    Les statistiques du corpus
+    path : str
+    Le fichier txt à écrire
+
     """
 
-    # On transforme le texte des reviews en une liste de mots
-    data['reviews'] = data['reviews'].str.lower().replace(r'[^\w\s]', " ", regex=True).str.split()
+    with open(path, "w") as f:
+        f.write(f"La longueur moyenne des reviews est de {corpus_stats.mean_length} mots\n\n")
+        f.write(f"La note moyenne donnée par les utilisateurs est de {corpus_stats.mean_note} étoiles\n\n")
+        f.write(f"Voici le nombre de reviews par note : \n\n {corpus_stats.count_by_note()}")
 
-    # On calcule la moyenne de la longueur des textes et la moyenne des notes (on en profite pour convertir les notes en float, qui étaient des str jusqu'ici)
-    nombre_mots = data['reviews'].apply(len)
-    moyenne_mots = nombre_mots.mean()
-    data['notes'] = data['notes'].str.replace(",", ".").apply(float)
-    notes_mean = data['notes'].mean(axis=0)
 
-    # On écrit ces informations dans un fichier txt, et on calcule aussi le nombre de reviews par note
-    with open("../figures/moyenne_compte_par_notes.txt", "w") as f:
-        f.write(f"La longueur moyenne des reviews est de {moyenne_mots} mots\n\n")
-        f.write(f"La note moyenne donnée par les utilisateurs est de {notes_mean} étoiles\n\n")
-        f.write(f"Voici le nombre de reviews par note : \n\n {data.groupby(['notes']).count()}")
-   
+def _show(figures_dir, name) :
+    import matplotlib.pyplot as plt
 
-    # On fait la visualisation du nombre de reviews par note
-    plt.figure(figsize=(8,6))
-    sns.barplot(data=data.groupby(['notes']).count(), x='notes', y='reviews')
-    plt.title("Nombre de reviews par note")
-    plt.xlabel("Note")
-    plt.ylabel("Nombre de reviews")
-    plt.show()
+    # Sans dossier, on affiche la figure comme avant, sinon on l'enregistre sans l'afficher
+    if figures_dir is None :
+        plt.show()
+    else :
+        plt.savefig(os.path.join(figures_dir, name))
+        plt.close()
 
 
-    # A partir d'ici on fait la visualisation de la loi de Zipf sur notre corpus
-    
-    #On ajoute toutes les listes de mots dans une grande liste aplatie, en retirant au passage les stopwords
-    stop_words = set(stopwords.words('french'))
+def plot_stats(corpus_stats: CorpusStats, figures_dir=None) :
 
-    all_words = []
-    for text in data["reviews"] :
-        all_words.extend(text)
+    """
+    Génère les visualisations à partir des statistiques du corpus
 
-    all_words_no_stopwords = []
-    for word in all_words :
-        if word not in stop_words:
-            all_words_no_stopwords.append(word)
+    Parameters
+    ---
+    corpus_stats : CorpusStats
+    Les statistiques du corpus
+    figures_dir : str
+    Le dossier où enregistrer les figures (None pour les afficher)
 
-    # On compte les occurrences de chaque mot et on les trie par ordre du plus fréquent au moins fréquent
-    word_count = Counter(all_words_no_stopwords)
-    sorted_counts = word_count.most_common()
+    """
+
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    # On fait la visualisation du nombre de reviews par note
+    plt.figure(figsize=(8,6))
+    sns.barplot(data=corpus_stats.count_by_note().reset_index(), x='notes', y='reviews')
+    plt.title("Nombre de reviews par note")
+    plt.xlabel("Note")
+    plt.ylabel("Nombre de reviews")
+    _show(figures_dir, "barplot_nombre_reviews_par_note.png")
 
-    # On créé les variables frequencies qui comporte les fréquences et ranks qui comporte les rangs (1 : le plus fréquent, jusqu'au dernier nombre : le moins fréquent)
-    frequencies = [count for word, count in sorted_counts]
-    ranks = range(1, len(frequencies) + 1)
 
+    # On fait la visualisation de la loi de Zipf sur notre corpus (sans les stopwords)
+    # ranks comporte les rangs (1 : le plus fréquent, jusqu'au dernier nombre : le moins fréquent) et frequencies les fréquences
+    ranks, frequencies = corpus_stats.zipf()
 
-    # On créé la visualisation
+    plt.figure()
     plt.plot(ranks,frequencies)
     plt.xlabel('Rank(r)')
     plt.ylabel('Frequency(f)')
     plt.title("Zipf's law")
-    plt.show()
-    
-    # On modifie la colonne "reviews", au lieu de la liste de mots, on a le nombre de mots
-    data['reviews'] = data['reviews'].apply(len)
+    _show(figures_dir, "zipf_law.png")
+
 
     # On fait la visualisation de la longueur des textes selon la note sous la forme d'un boxplot qui nous permet de voir les outliers
+    # Les boîtes sont calculées à partir des histogrammes des longueurs, sans avoir besoin de la longueur de chaque review
+    notes = sorted(corpus_stats.length_hist)
     plt.figure(figsize=(8, 6))
-    sns.boxplot(x='notes', y='reviews', data=data)
+    plt.gca().bxp([corpus_stats.length_boxplot(note) for note in notes], showfliers=True)
     plt.title("Longueur des textes selon la note")
     plt.xlabel("Note")
     plt.ylabel("Longueur du texte (en mots)")
-    plt.show()
+    _show(figures_dir, "boxplot_longueur_note.png")
 
 
-    # On calcule la moyenne de longueur des textes pour chaque note et on en fait la visualisation
-    mean_lengths = data.groupby('notes')['reviews'].mean().reset_index()
+    # On fait la visualisation de la moyenne de longueur des textes pour chaque note
+    mean_lengths = corpus_stats.mean_length_by_note()
 
     plt.figure(figsize=(8, 6))
     sns.barplot(x='notes', y='reviews', data=mean_lengths)
     plt.title("Longueur moyenne des textes selon la note")
     plt.xlabel("Note")
     plt.ylabel("Longueur moyenne du texte")
-    plt.show()
+    _show(figures_dir, "barplot_longueur_note.png")
+
+
+def stats(data, chunksize=50_000, workers=1, figures_dir=None, exact_words=True, summary_path=None) :
+
+    """
+    Réalise différentes statistiques et visualisations sur un jeu de données
+
+    Parameters
+    ---
+    data : str or Dataframe
+    Le fichier du jeu de données (lu morceau par morceau), un fichier de statistiques (.stats.json), ou le jeu de données lui-même, sur lequel on souhaite réaliser des statistiques
+    chunksize : int
+    Le nombre de reviews par morceau
+    workers : int
+    Le nombre de processus qui calculent les statistiques
+    figures_dir : str
+    Le dossier où enregistrer les figures (None pour les afficher)
+    exact_words : bool
+    Garder le compte exact des mots (sinon, la loi de Zipf n'est tracée que pour les mots les plus fréquents)
+    summary_path : str
+    Le fichier txt des moyennes (par défaut moyenne_compte_par_notes.txt dans figures_dir, ou dans ../figures)
+
+    Returns
+    ---
+    corpus_stats : CorpusStats
+    Les statistiques du corpus
+
+    """
+
+    if isinstance(data, pd.DataFrame) :
+        corpus_stats = chunk_stats(data, french_stopwords())
+    elif data.endswith(".stats.json") :
+        corpus_stats = CorpusStats.load(data)
+    else :
+        # on ne lit que ce qui a changé dans le corpus depuis la dernière sauvegarde des statistiques
+        corpus_stats = update_stats(data, chunksize, workers, exact_words=exact_words)
+
+    # On écrit la longueur moyenne, la note moyenne et le nombre de reviews par note dans un fichier txt (à côté des figures)
+    if summary_path is None :
+        summary_path = os.path.join(figures_dir or "../figures", "moyenne_compte_par_notes.txt")
+    write_summary(corpus_stats, summary_path)
+
+    plot_stats(corpus_stats, figures_dir)
+
+    return corpus_stats
 
 
 
 if __name__ == "__main__" :
     my_parser = argparse.ArgumentParser()
-    my_parser.add_argument("data", help="Fichier csv sur lequel réaliser des statistiques")
+    my_parser.add_argument("data", help="Fichier (csv, parquet ou arrow) sur lequel réaliser des statistiques, ou fichier de statistiques (.stats.json)")
+    my_parser.add_argument("--chunksize", help="Le nombre de reviews lues à la fois, par défaut 50000", type=int, default=50_000)
+    my_parser.add_argument("--workers", help="Le nombre de processus qui calculent les statistiques, par défaut 1", type=int, default=1)
+    my_parser.add_argument("--figures", help="Le dossier où enregistrer les figures (par défaut elles sont affichées)", default=None)
+    my_parser.add_argument("--summary", help="Le fichier txt des moyennes, par défaut moyenne_compte_par_notes.txt dans --figures (ou ../figures)", default=None)
+    my_parser.add_argument("--sketch-only", help="Ne pas garder le compte exact des mots (Zipf tracée sur les mots les plus fréquents seulement)", action="store_true")
     my_args = my_parser.parse_args()
 
-    data = my_args.data
-    data = pd.read_csv(data)
-
-    stats(data)
+    with instrument.stage("stats") :
+        stats(my_args.data, my_args.chunksize, my_args.workers, my_args.figures, not my_args.sketch_only, my_args.summary)
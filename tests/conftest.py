@@ -0,0 +1,5 @@
+import os
+import sys
+
+# les scripts du projet s'importent entre eux depuis src/ (ils sont lancés depuis ce dossier)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
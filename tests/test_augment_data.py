@@ -0,0 +1,20 @@
+import pandas as pd
+from augment_data import StubTranslator, augment
+
+
+def test_augment_output_schema() :
+    data = pd.DataFrame({"reviews": ["Bon film", "Mauvais film", "Film moyen"], "notes": ["4,0", "1,0", "2,5"]})
+
+    result = augment(data, StubTranslator(), batch_size=2, workers=1)
+
+    # les reviews de base, puis leurs rétro-traductions dans le même ordre, reliées par la colonne group
+    assert result.columns.tolist() == ["reviews", "notes", "group"]
+    assert result["reviews"].tolist() == data["reviews"].tolist() * 2
+    assert result["notes"].tolist() == data["notes"].tolist() * 2
+    assert result["group"].tolist() == [0, 1, 2, 0, 1, 2]
+
+
+def test_augment_keeps_existing_groups() :
+    data = pd.DataFrame({"reviews": ["Bon film", "Mauvais film"], "notes": ["4,0", "1,0"], "group": [7, 9]})
+
+    assert augment(data, StubTranslator(), workers=1)["group"].tolist() == [7, 9, 7, 9]
@@ -0,0 +1,13 @@
+import pandas as pd
+import pytest
+from baseline_model import train_baseline
+from corpus_io import write_corpus
+
+
+def test_train_baseline_requires_at_least_one_epoch(tmp_path) :
+    data = str(tmp_path / "data.csv")
+    write_corpus(pd.DataFrame({"reviews": [f"review {i}" for i in range(20)], "notes": [i % 5 + 1 for i in range(20)]}), data)
+
+    with pytest.raises(ValueError) :
+        train_baseline(data, str(tmp_path / "baseline.joblib"), epochs=0)
+    assert not (tmp_path / "baseline.joblib").exists()
@@ -0,0 +1,29 @@
+from bench_pipeline import compare
+
+
+def _result(seconds: float, reviews_per_second: float, stage_rss_mb: float = 50.0) :
+    return {"stage": "harmonize", "rows": 1000, "seconds": seconds, "reviews_per_second": reviews_per_second, "peak_rss_mb": 200.0,
+            "stage_rss_mb": stage_rss_mb}
+
+
+def test_compare_reports_throughput_regression() :
+    regressions = compare([_result(2.0, 500.0)], [_result(1.0, 1000.0)])
+
+    assert len(regressions) == 1
+    assert "reviews_per_second" in regressions[0]
+
+
+def test_compare_ignores_throughput_of_short_runs() :
+    assert compare([_result(0.04, 25_000.0)], [_result(0.03, 33_000.0)], min_seconds=0.2) == []
+
+
+def test_compare_reports_stage_memory_regression_above_floor() :
+    assert compare([_result(1.0, 1000.0, stage_rss_mb=60.0)], [_result(1.0, 1000.0, stage_rss_mb=40.0)], min_rss_mb=32.0) == []
+    assert len(compare([_result(1.0, 1000.0, stage_rss_mb=400.0)], [_result(1.0, 1000.0, stage_rss_mb=100.0)], min_rss_mb=32.0)) == 1
+
+
+def test_compare_skips_memory_of_older_baselines() :
+    base = _result(1.0, 1000.0)
+    del base["stage_rss_mb"]
+
+    assert compare([_result(1.0, 1000.0, stage_rss_mb=1000.0)], [base]) == []
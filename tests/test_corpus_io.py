@@ -0,0 +1,77 @@
+import pandas as pd
+import pytest
+from corpus_io import CorpusWriter, corpus_format, iter_corpus, load_dataset, read_corpus, write_corpus, write_rows
+
+FORMATS = [".csv", ".parquet", ".arrow"]
+
+
+def _corpus(n: int = 25) -> pd.DataFrame :
+    # des reviews avec virgules, guillemets et retours à la ligne, qui doivent survivre au csv
+    return pd.DataFrame({"reviews": [f"Review {i}, \"citée\"\nsur deux lignes" for i in range(n)], "notes": [i % 5 + 1 for i in range(n)]})
+
+
+def test_corpus_format_from_extension() :
+    assert [corpus_format(f"data{extension}") for extension in FORMATS + [".feather"]] == ["csv", "parquet", "arrow", "arrow"]
+    with pytest.raises(ValueError) :
+        corpus_format("data.json")
+
+
+@pytest.mark.parametrize("extension", FORMATS)
+def test_write_then_read_round_trip(tmp_path, extension) :
+    data = _corpus()
+    path = str(tmp_path / f"data{extension}")
+
+    write_corpus(data, path)
+    result = read_corpus(path)
+
+    assert result["reviews"].tolist() == data["reviews"].tolist()
+    assert result["notes"].tolist() == data["notes"].tolist()
+    if extension != ".csv" :
+        # les notes entières sont stockées sur un octet
+        assert result["notes"].dtype == "int8"
+
+
+@pytest.mark.parametrize("extension", FORMATS)
+def test_chunked_write_and_read_round_trip(tmp_path, extension) :
+    data = _corpus(53)
+    path = str(tmp_path / f"data{extension}")
+
+    with CorpusWriter(path) as writer :
+        for start in range(0, len(data), 10) :
+            writer.write(data.iloc[start:start + 10])
+    chunks = list(iter_corpus(path, chunksize=20))
+
+    assert writer.count == 53
+    # en arrow les morceaux suivent les lots écrits : on vérifie seulement qu'aucun ne dépasse chunksize
+    assert all(len(chunk) <= 20 for chunk in chunks)
+    assert pd.concat(chunks)["reviews"].tolist() == data["reviews"].tolist()
+
+
+@pytest.mark.parametrize("extension", FORMATS)
+def test_read_selected_columns(tmp_path, extension) :
+    path = str(tmp_path / f"data{extension}")
+    write_corpus(_corpus(), path)
+
+    assert read_corpus(path, columns=["notes"]).columns.tolist() == ["notes"]
+
+
+@pytest.mark.parametrize("extension", FORMATS)
+def test_write_rows_round_trip(tmp_path, extension) :
+    path = str(tmp_path / f"data{extension}")
+    rows = [("Très bon film", "4,5"), ("Nul", "0,5")]
+
+    assert write_rows(iter(rows), path, batch_size=1) == 2
+    result = read_corpus(path)
+    assert list(zip(result["reviews"], result["notes"].astype(str))) == rows
+
+
+@pytest.mark.parametrize("extension", FORMATS)
+def test_load_dataset_matches_read_corpus(tmp_path, extension) :
+    data = _corpus()
+    path = str(tmp_path / f"data{extension}")
+    write_corpus(data, path)
+
+    dataset = load_dataset(path)
+
+    assert dataset["reviews"] == data["reviews"].tolist()
+    assert dataset["notes"] == data["notes"].tolist()
@@ -0,0 +1,86 @@
+import csv
+import pandas as pd
+import pytest
+import corpus_stats
+from corpus_stats import compute_stats, update_stats
+
+STOP_WORDS = frozenset({"le", "la", "et"})
+NOTES = ["1,0", "2,5", "3,0", "4,5", "5,0"]
+
+
+def _rows(start: int, n: int) -> list :
+    return [(f"le film {i} et la musique {i % 7} sont vraiment {'bons' if i % 2 else 'mauvais'}", NOTES[i % len(NOTES)]) for i in range(start, start + n)]
+
+
+def _write_csv(path, rows, mode="w") :
+    with open(path, mode, newline="", encoding="utf-8") as f :
+        writer = csv.writer(f)
+        if mode == "w" :
+            writer.writerow(["reviews", "notes"])
+        writer.writerows(rows)
+
+
+def _exact_fields(stats) -> dict :
+    data = stats.to_dict()
+    return {key: data[key] for key in ("n_reviews", "n_words", "notes_sum", "note_counts", "length_hist", "word_counts", "vocabulary")}
+
+
+def test_appended_rows_match_full_recompute(tmp_path, monkeypatch) :
+    path = str(tmp_path / "data.csv")
+    _write_csv(path, _rows(0, 40))
+    update_stats(path, chunksize=7, stop_words=STOP_WORDS)
+
+    _write_csv(path, _rows(40, 25), mode="a")
+    full = compute_stats(path, chunksize=7, stop_words=STOP_WORDS)
+
+    # seules les lignes ajoutées doivent être lues : un recalcul complet ferait échouer le test
+    def no_recompute(*args, **kwargs) :
+        raise AssertionError("recalcul complet au lieu d'une mise à jour")
+    monkeypatch.setattr(corpus_stats, "compute_stats", no_recompute)
+    updated = update_stats(path, chunksize=7, stop_words=STOP_WORDS)
+
+    assert updated.n_reviews == 65
+    assert _exact_fields(updated) == _exact_fields(full)
+
+
+def test_unchanged_file_is_not_read_again(tmp_path, monkeypatch) :
+    path = str(tmp_path / "data.csv")
+    _write_csv(path, _rows(0, 20))
+    first = update_stats(path, stop_words=STOP_WORDS)
+
+    monkeypatch.setattr(corpus_stats, "_merge_chunks", lambda *args, **kwargs : pytest.fail("le fichier a été relu"))
+    assert _exact_fields(update_stats(path, stop_words=STOP_WORDS)) == _exact_fields(first)
+
+
+def test_rewritten_file_is_recomputed(tmp_path) :
+    path = str(tmp_path / "data.csv")
+    _write_csv(path, _rows(0, 30))
+    update_stats(path, stop_words=STOP_WORDS)
+
+    _write_csv(path, _rows(100, 35))
+    updated = update_stats(path, stop_words=STOP_WORDS)
+
+    assert _exact_fields(updated) == _exact_fields(compute_stats(path, stop_words=STOP_WORDS))
+
+
+def test_other_stop_words_trigger_a_recompute(tmp_path) :
+    path = str(tmp_path / "data.csv")
+    _write_csv(path, _rows(0, 30))
+    update_stats(path, stop_words=STOP_WORDS)
+
+    updated = update_stats(path, stop_words=frozenset({"film"}))
+
+    assert "film" not in updated.word_counts
+    assert "le" in updated.word_counts
+
+
+def test_stats_match_pandas(tmp_path) :
+    path = str(tmp_path / "data.csv")
+    _write_csv(path, _rows(0, 30))
+    data = pd.read_csv(path)
+
+    stats = compute_stats(path, chunksize=4, stop_words=STOP_WORDS)
+
+    assert stats.n_reviews == len(data)
+    assert stats.mean_length == pytest.approx(data["reviews"].str.split().str.len().mean())
+    assert stats.mean_note == pytest.approx(data["notes"].str.replace(",", ".").astype(float).mean())
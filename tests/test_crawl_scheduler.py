@@ -0,0 +1,97 @@
+import time
+import requests
+from bench_parsers import render_page, TARGET_URL
+from crawl_scheduler import AdaptiveThrottle, crawl_catalogue
+
+
+class StubResponse :
+    def __init__(self, content: bytes = b"", status_code: int = 200) :
+        self.content = content
+        self.status_code = status_code
+        self.headers = {}
+
+    @property
+    def ok(self) :
+        return self.status_code < 400
+
+
+class StubSession :
+    """Session qui répond toujours la même page (avec le code status) après server_time secondes, et lève d'abord les erreurs de failures"""
+
+    def __init__(self, content: bytes = b"", server_time: float = 0.0, failures: list = (), status: int = 200) :
+        self.content = content
+        self.status = status
+        self.server_time = server_time
+        self.failures = list(failures)
+        self.calls = 0
+
+    def get(self, url, headers=None) :
+        self.calls += 1
+        if self.failures :
+            raise self.failures.pop(0)
+        time.sleep(self.server_time)
+        return StubResponse(self.content, self.status)
+
+
+def test_throttle_follows_server_latency_not_its_own_delay() :
+    # le serveur répond en 5 ms, bien sous la latence cible : le délai doit diminuer, même s'il part au-dessus de la cible
+    # (mesurer l'attente du délai de politesse le ferait au contraire augmenter à chaque requête)
+    throttle = AdaptiveThrottle(delay=0.1, min_delay=0.001, target_latency=0.06)
+    session = StubSession(render_page([], 1, 1), server_time=0.005)
+    host = "www.allocine.fr"
+
+    list(crawl_catalogue([TARGET_URL + f"?film={i}" for i in range(6)], max_crawl=1, workers=1, throttle=throttle, session=session))
+
+    assert session.calls == 6
+    assert throttle.delay_for(host) < 0.1 * 0.9 ** 5
+
+
+def test_network_error_is_retried_instead_of_stopping_the_crawl() :
+    page = render_page([("Un très bon film", "4,0")], 1, 1).encode("utf-8")
+    throttle = AdaptiveThrottle(delay=0.0, min_delay=0.0)
+    session = StubSession(page, failures=[requests.ConnectionError("connexion coupée"), requests.Timeout("timeout")])
+
+    reviews = list(crawl_catalogue([TARGET_URL], max_crawl=1, workers=1, throttle=throttle, session=session))
+
+    assert [(review, note) for _, review, note in reviews] == [("Un très bon film", "4,0")]
+    assert session.calls == 3
+
+
+def test_network_error_gives_up_after_max_retries() :
+    throttle = AdaptiveThrottle(delay=0.0, min_delay=0.0)
+    session = StubSession(failures=[requests.ConnectionError("connexion coupée")] * 3)
+
+    reviews = list(crawl_catalogue([TARGET_URL], max_crawl=1, workers=1, throttle=throttle, session=session, max_retries=2))
+
+    assert reviews == []
+    assert session.calls == 3
+
+
+def test_film_with_abandoned_pages_is_not_marked_done() :
+    throttle = AdaptiveThrottle(delay=0.0, min_delay=0.0, max_delay=0.0)
+    session = StubSession(status=503)
+    done = []
+
+    reviews = list(crawl_catalogue([TARGET_URL], max_crawl=1, workers=1, throttle=throttle, session=session, max_retries=2, on_film_done=done.append))
+
+    assert reviews == []
+    assert session.calls == 3
+    assert done == []
+
+
+def test_film_with_error_page_is_not_marked_done() :
+    throttle = AdaptiveThrottle(delay=0.0, min_delay=0.0)
+    done = []
+
+    list(crawl_catalogue([TARGET_URL], max_crawl=1, workers=1, throttle=throttle, session=StubSession(status=404), on_film_done=done.append))
+
+    assert done == []
+
+
+def test_complete_film_is_marked_done() :
+    throttle = AdaptiveThrottle(delay=0.0, min_delay=0.0)
+    done = []
+
+    list(crawl_catalogue([TARGET_URL], max_crawl=1, workers=1, throttle=throttle, session=StubSession(render_page([], 1, 1)), on_film_done=done.append))
+
+    assert done == [TARGET_URL]
@@ -0,0 +1,46 @@
+from bench_parsers import render_page, TARGET_URL
+from crawl_scheduler import page_number
+from crawler_scraper import crawler
+
+
+class StubResponse :
+    def __init__(self, text: str) :
+        self.text = text
+        self.content = text.encode("utf-8")
+        self.status_code = 200
+        self.headers = {}
+        self.ok = True
+
+    def raise_for_status(self) :
+        pass
+
+
+class PagedSession :
+    """Session qui sert un film de n_pages pages de critiques, et note les urls demandées"""
+
+    def __init__(self, n_pages: int) :
+        self.n_pages = n_pages
+        self.requested = []
+
+    def get(self, url, headers=None) :
+        self.requested.append(url)
+        return StubResponse(render_page([("Une review", "3,0")], page_number(url), self.n_pages))
+
+
+def test_crawler_follows_review_links() :
+    session = PagedSession(5)
+
+    urls = crawler(TARGET_URL, 20, session=session)
+
+    assert session.requested[0] == TARGET_URL
+    assert urls[-1] == TARGET_URL
+    assert urls[:-1] and all(url.startswith(TARGET_URL) and "?page=" in url for url in urls[:-1])
+
+
+def test_crawler_downloads_only_the_pages_it_visits() :
+    # le budget est épuisé par les liens de la première page : aucune autre page ne doit être téléchargée
+    session = PagedSession(5)
+
+    crawler(TARGET_URL, 1, session=session)
+
+    assert session.requested == [TARGET_URL]
@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+from dedup import dedup, near_duplicates, normalize
+
+REVIEW = "un film magnifique avec des acteurs excellents et une histoire touchante du début à la fin"
+OTHER = "une comédie lourde et ennuyeuse dont les blagues tombent toutes à plat malgré un bon casting"
+
+
+def test_normalize_ignores_case_punctuation_and_spaces() :
+    assert normalize("  Super   FILM, vraiment !") == "super film vraiment"
+
+
+def test_exact_duplicates_keep_first_occurrence() :
+    data = pd.DataFrame({"reviews": [REVIEW, OTHER, REVIEW.upper() + " !"], "notes": [5, 1, 4]})
+
+    result, report = dedup(data)
+
+    assert report["exact_duplicates"] == 1
+    assert result["notes"].tolist() == [5, 1]
+
+
+def test_near_duplicates_are_removed_but_distinct_reviews_kept() :
+    near = REVIEW.replace("magnifique", "superbe")
+    data = pd.DataFrame({"reviews": [REVIEW, OTHER, REVIEW + " vraiment", near], "notes": [5, 1, 5, 5]})
+
+    result, report = dedup(data, threshold=0.5)
+
+    assert report["near_duplicates"] == 2
+    assert result["reviews"].tolist() == [REVIEW, OTHER]
+
+
+def test_augmentation_too_close_to_its_original_is_removed() :
+    paraphrase = "un film superbe porté par des comédiens remarquables et un récit émouvant jusqu'au bout"
+    data = pd.DataFrame({
+        "reviews": [REVIEW, OTHER, REVIEW + " vraiment", paraphrase],
+        "notes": [5, 1, 5, 5],
+        "group": [0, 1, 0, 0],
+    })
+
+    result, report = dedup(data, threshold=0.9, augment_threshold=0.5)
+
+    assert report["augmentations_too_close"] == 1
+    assert report["near_duplicates"] == 0
+    assert result["reviews"].tolist() == [REVIEW, OTHER, paraphrase]
+    assert result["group"].tolist() == [0, 1, 0]
+
+
+def test_same_group_is_not_merged_by_the_lsh_pass() :
+    data = pd.DataFrame({"reviews": [REVIEW, REVIEW + " vraiment"], "notes": [5, 5], "group": [0, 0]})
+
+    result, report = dedup(data, threshold=0.5, augment_threshold=1.0)
+
+    assert report["near_duplicates"] == 0
+    assert len(result) == 2
+
+
+def test_lsh_bucket_compares_members_behind_the_first() :
+    # les trois reviews ont la même première bande, mais seules les deux dernières se ressemblent (3 valeurs sur 4)
+    signatures = np.array([[1, 1, 9, 9], [1, 1, 5, 6], [1, 1, 5, 7]], dtype=np.uint32)
+
+    roots = near_duplicates(signatures, threshold=0.7, bands=2)
+
+    assert roots.tolist() == [0, 1, 1]
+
+
+def test_lsh_keeps_groups_apart() :
+    signatures = np.array([[1, 1, 5, 6], [1, 1, 5, 7]], dtype=np.uint32)
+
+    assert near_duplicates(signatures, threshold=0.7, groups=np.array([3, 3]), bands=2).tolist() == [0, 1]
+    assert near_duplicates(signatures, threshold=0.7, groups=np.array([3, 4]), bands=2).tolist() == [0, 0]
@@ -0,0 +1,35 @@
+import pandas as pd
+import pytest
+from corpus_io import read_corpus, write_corpus
+from harmonize_classes import harmonize, harmonize_notes, harmonize_stream
+
+NOTES = ["0,5", "1,0", "1,5", "2,0", "2,5", "3,0", "3,5", "4,0", "4,5", "5,0"]
+
+
+def test_harmonize_notes_drops_decimals() :
+    result = harmonize_notes(pd.Series(["0,5", "3,5", "5,0", "4,0"]))
+
+    assert result.tolist() == [0, 3, 5, 4]
+    assert result.dtype == "int8"
+
+
+def test_harmonize_notes_accepts_numbers() :
+    assert harmonize_notes(pd.Series([0.5, 2.5, 4.0])).tolist() == [0, 2, 4]
+
+
+@pytest.mark.parametrize("extension", [".csv", ".parquet", ".arrow"])
+def test_harmonize_stream_matches_in_memory_harmonize(tmp_path, extension) :
+    data = pd.DataFrame({"reviews": [f"review {i}" for i in range(53)], "notes": [NOTES[i % len(NOTES)] for i in range(53)]})
+    source = str(tmp_path / f"data{extension}")
+    output = str(tmp_path / f"harmonized{extension}")
+    write_corpus(data, source)
+
+    count = harmonize_stream(source, output, chunksize=10)
+
+    # les notes sont celles de harmonize_notes, sans les lignes de note 0 (0,5 dans le fichier d'origine)
+    expected = harmonize(data)
+    result = read_corpus(output)
+    assert count == len(expected) == 53 - 6
+    assert result["reviews"].tolist() == expected["reviews"].tolist()
+    assert result["notes"].tolist() == harmonize_notes(expected["notes"]).tolist() == expected["notes"].tolist()
+    assert 0 not in result["notes"].tolist()
@@ -0,0 +1,110 @@
+import os
+import pytest
+from pipeline import Stage, default_stages, run_pipeline, select_stages
+
+
+# les fonctions des étapes sont lancées dans des processus séparés (spawn) : elles doivent être définies au niveau du module
+
+def _upper(inputs, outputs, params, options) :
+    with open(inputs["source"], encoding="utf-8") as f :
+        text = f.read()
+    with open(outputs["result"], "w", encoding="utf-8") as f :
+        f.write(text.upper() * params.get("repeat", 1))
+    with open(options["log"], "a", encoding="utf-8") as f :
+        f.write(options["name"] + "\n")
+
+
+def _fail(inputs, outputs, params, options) :
+    raise RuntimeError("étape en échec")
+
+
+def _stages(tmp_path, first=_upper, repeat: int = 1) -> list :
+    log = str(tmp_path / "log.txt")
+    return [
+        Stage("first", first, {"source": str(tmp_path / "source.txt")}, {"result": str(tmp_path / "out" / "first.txt")},
+              options={"log": log, "name": "first"}),
+        Stage("second", _upper, {"source": str(tmp_path / "out" / "first.txt")}, {"result": str(tmp_path / "out" / "second.txt")},
+              params={"repeat": repeat}, options={"log": log, "name": "second"}),
+    ]
+
+
+def _run(tmp_path, stages, **kwargs) -> dict :
+    summary = run_pipeline(stages, jobs=1, state_dir=str(tmp_path / "state"), **kwargs)
+    return {entry["stage"]: entry["status"] for entry in summary}
+
+
+def _runs(tmp_path) -> list :
+    with open(tmp_path / "log.txt", encoding="utf-8") as f :
+        return f.read().split()
+
+
+@pytest.fixture
+def source(tmp_path) :
+    path = tmp_path / "source.txt"
+    path.write_text("bonjour", encoding="utf-8")
+    return path
+
+
+def test_second_run_skips_up_to_date_stages(tmp_path, source) :
+    assert _run(tmp_path, _stages(tmp_path)) == {"first": "lancée", "second": "lancée"}
+    assert _run(tmp_path, _stages(tmp_path)) == {"first": "à jour", "second": "à jour"}
+    assert _runs(tmp_path) == ["first", "second"]
+    assert (tmp_path / "out" / "second.txt").read_text(encoding="utf-8") == "BONJOUR"
+
+
+def test_changed_input_reruns_the_stage_and_its_dependents(tmp_path, source) :
+    _run(tmp_path, _stages(tmp_path))
+    source.write_text("au revoir", encoding="utf-8")
+
+    assert _run(tmp_path, _stages(tmp_path)) == {"first": "lancée", "second": "lancée"}
+    assert (tmp_path / "out" / "second.txt").read_text(encoding="utf-8") == "AU REVOIR"
+
+
+def test_same_content_with_new_date_is_up_to_date(tmp_path, source) :
+    _run(tmp_path, _stages(tmp_path))
+    source.write_text("bonjour", encoding="utf-8")
+    os.utime(source, ns=(0, 0))
+
+    assert _run(tmp_path, _stages(tmp_path)) == {"first": "à jour", "second": "à jour"}
+
+
+def test_changed_params_rerun_only_that_stage(tmp_path, source) :
+    _run(tmp_path, _stages(tmp_path))
+
+    assert _run(tmp_path, _stages(tmp_path, repeat=2)) == {"first": "à jour", "second": "lancée"}
+    assert _runs(tmp_path) == ["first", "second", "second"]
+
+
+def test_missing_output_and_force_rerun(tmp_path, source) :
+    _run(tmp_path, _stages(tmp_path))
+    os.remove(tmp_path / "out" / "second.txt")
+
+    assert _run(tmp_path, _stages(tmp_path)) == {"first": "à jour", "second": "lancée"}
+    assert _run(tmp_path, _stages(tmp_path), force=["first"]) == {"first": "lancée", "second": "à jour"}
+
+
+def test_failed_stage_blocks_its_dependents(tmp_path, source) :
+    assert _run(tmp_path, _stages(tmp_path, first=_fail)) == {"first": "échec", "second": "bloquée"}
+
+    # après un échec, l'étape est relancée au lancement suivant
+    assert _run(tmp_path, _stages(tmp_path)) == {"first": "lancée", "second": "lancée"}
+
+
+def test_dry_run_launches_nothing(tmp_path, source) :
+    assert _run(tmp_path, _stages(tmp_path), dry_run=True) == {"first": "à lancer", "second": "à lancer"}
+    assert not (tmp_path / "log.txt").exists()
+
+
+def test_select_stages_adds_dependencies(tmp_path) :
+    stages = _stages(tmp_path)
+
+    assert [stage.name for stage in select_stages(stages, ["second"])] == ["first", "second"]
+    assert [stage.name for stage in select_stages(stages, ["first"])] == ["first"]
+    with pytest.raises(ValueError) :
+        select_stages(stages, ["inconnue"])
+
+
+def test_evaluate_tokenizes_like_train(tmp_path) :
+    by_name = {stage.name: stage for stage in default_stages(str(tmp_path), str(tmp_path), str(tmp_path / "model"))}
+
+    assert by_name["evaluate"].params["max_length"] == by_name["train"].params["max_length"]
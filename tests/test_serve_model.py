@@ -0,0 +1,48 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+import pytest
+import serve_model
+from serve_model import LRUCache, MicroBatcher, make_server
+
+
+@pytest.fixture
+def server(monkeypatch) :
+    def broken_predict(model, tokenizer, reviews, batch_size, max_length) :
+        raise MemoryError("plus de mémoire")
+
+    monkeypatch.setattr(serve_model, "predict_proba", broken_predict)
+    batcher = MicroBatcher(model=None, tokenizer=None, max_wait=0.0, cache=LRUCache(0))
+    server = make_server(batcher, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def _post(url: str, content: dict) :
+    request = urllib.request.Request(url + "/predict", data=json.dumps(content).encode("utf-8"), method="POST")
+    try :
+        with urllib.request.urlopen(request, timeout=10) as response :
+            return response.status, json.load(response)
+    except urllib.error.HTTPError as error :
+        return error.code, json.load(error)
+
+
+def test_model_error_returns_500_with_json_body(server) :
+    status, body = _post(server, {"review": "Un bon film"})
+
+    assert status == 500
+    assert "MemoryError" in body["error"]
+
+    with urllib.request.urlopen(server + "/stats", timeout=10) as response :
+        assert json.load(response)["errors"] == 1
+
+
+def test_invalid_request_returns_400(server) :
+    status, body = _post(server, {"reviews": [1, 2]})
+
+    assert status == 400
+    assert "requête invalide" in body["error"]
@@ -0,0 +1,47 @@
+import datasets
+import numpy as np
+import pandas as pd
+from tokenized_splits import split_dataset
+
+
+def _dataset(n: int, group_size: int = None) :
+    data = {"reviews": [f"review {i}" for i in range(n)], "notes": [i % 5 + 1 for i in range(n)]}
+    if group_size is not None :
+        data["group"] = [i // group_size for i in range(n)]
+    return datasets.Dataset.from_pandas(pd.DataFrame(data), preserve_index=False)
+
+
+def test_groups_never_cross_splits() :
+    splits = split_dataset(_dataset(300, group_size=3), seed=42)
+
+    groups = {name : set(split["group"]) for name, split in splits.items()}
+    assert not groups["train"] & groups["validation"]
+    assert not groups["train"] & groups["test"]
+    assert not groups["validation"] & groups["test"]
+    assert sum(split.num_rows for split in splits.values()) == 300
+
+
+def test_groups_are_split_80_10_10() :
+    splits = split_dataset(_dataset(300, group_size=3), seed=42)
+
+    assert [len(set(splits[name]["group"])) for name in ("train", "validation", "test")] == [80, 10, 10]
+
+
+def test_group_split_is_deterministic_for_a_seed() :
+    first, second = split_dataset(_dataset(300, group_size=3), seed=7), split_dataset(_dataset(300, group_size=3), seed=7)
+
+    assert first["test"]["reviews"] == second["test"]["reviews"]
+    assert first["test"]["reviews"] != split_dataset(_dataset(300, group_size=3), seed=8)["test"]["reviews"]
+
+
+def test_without_group_column_the_split_is_unchanged() :
+    dataset = _dataset(100)
+    train_valtest = dataset.train_test_split(test_size=0.2, seed=42)
+    valtest = train_valtest["test"].train_test_split(test_size=0.5, seed=42)
+
+    splits = split_dataset(dataset, seed=42)
+
+    assert splits["train"]["reviews"] == train_valtest["train"]["reviews"]
+    assert splits["validation"]["reviews"] == valtest["train"]["reviews"]
+    assert splits["test"]["reviews"] == valtest["test"]["reviews"]
+    assert np.isin(splits["test"]["reviews"], splits["train"]["reviews"]).sum() == 0